@@ -0,0 +1,318 @@
+"""Benchmark of broker provisioning: registering, rotating and deleting Services through RabbitMQHandler and Amqp091ProtocolHander.
+
+    uv run python benchmarks/broker_provisioning.py --services 200 --latency 2 --failure-rate 0.01
+
+Runs offline. The management API is served by a fake RabbitMQ on localhost, which keeps users, topic permissions and queues in memory,
+and the AMQP connections are replaced by a stub which keeps the queues it declares in the same place. Every HTTP request and every AMQP
+operation takes --latency milliseconds, and fails with a probability of --failure-rate (HTTP 503, or a closed channel or connection).
+Opening an AMQP connection and its channel takes four round trips, as against a real broker.
+
+Each operation is measured one Service at a time, as the UI does it, and in batches of --batch-size, as the admin API and the bulk
+import do it. Rotation re-creates the broker user with a new password, which is what rotating the broker credentials amounts to.
+The table reports the wall time, the round trips to the broker, the calls which raised, and what was left on the broker afterwards.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from collections.abc import Callable, Iterator, Sequence
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any
+
+SERVICE_PREFIX = 'benchmark-broker'
+
+
+class FakeRabbitMQ:
+    """State of the fake broker, shared by the management API and the AMQP stub."""
+
+    def __init__(self, latency: float, failure_rate: float, seed: int) -> None:
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)  # noqa: S311
+        self.lock = threading.Lock()
+        self.users: dict[str, str] = {}
+        """username -> password or password hash"""
+        self.topic_permissions: dict[str, dict[str, str]] = {}
+        self.queues: dict[str, dict[str, Any]] = {}
+        """queue name -> the fields the management API lists"""
+        self.round_trips: Counter[str] = Counter()
+
+    def round_trip(self, kind: str) -> bool:
+        """Count and delay one round trip. Returns: whether it should fail"""
+        with self.lock:
+            self.round_trips[kind] += 1
+            failed = self._random.random() < self.failure_rate
+        if self.latency:
+            time.sleep(self.latency)
+        return failed
+
+
+class ManagementAPI(BaseHTTPRequestHandler):
+    """The parts of https://www.rabbitmq.com/docs/http-api-reference which RabbitMQHandler uses."""
+
+    protocol_version = 'HTTP/1.1'
+    broker: FakeRabbitMQ
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        pass
+
+    def do_GET(self) -> None:  # noqa: N802
+        self._handle('GET')
+
+    def do_PUT(self) -> None:  # noqa: N802
+        self._handle('PUT')
+
+    def do_POST(self) -> None:  # noqa: N802
+        self._handle('POST')
+
+    def do_DELETE(self) -> None:  # noqa: N802
+        self._handle('DELETE')
+
+    def _handle(self, method: str) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        parts = [urllib.parse.unquote(part) for part in url.path.split('/')[2:]]
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        if self.broker.round_trip(f'{method} /api/{parts[0]}'):
+            self._respond(503, {'error': 'injected failure'})
+            return
+        broker = self.broker
+        with broker.lock:
+            match method, parts:
+                case 'PUT', ['users', username]:
+                    broker.users[username] = body['password']
+                    self._respond(204)
+                case 'DELETE', ['users', username]:
+                    found = broker.users.pop(username, None) is not None
+                    broker.topic_permissions.pop(username, None)
+                    self._respond(204 if found else 404)
+                case 'POST', ['users', 'bulk-delete']:
+                    for username in body['users']:
+                        broker.users.pop(username, None)
+                        broker.topic_permissions.pop(username, None)
+                    self._respond(204)
+                case 'PUT', ['topic-permissions', _, username]:
+                    broker.topic_permissions[username] = body
+                    self._respond(204)
+                case 'POST', ['definitions']:
+                    for user in body.get('users', []):
+                        broker.users[user['name']] = user['password_hash']
+                    for permission in body.get('topic_permissions', []):
+                        broker.topic_permissions[permission['user']] = permission
+                    self._respond(204)
+                case 'GET', ['queues', _]:
+                    self._respond(200, self._list_queues(urllib.parse.parse_qs(url.query)))
+                case 'DELETE', ['queues', _, queue_name]:
+                    queue = broker.queues.get(queue_name)
+                    if queue is None:
+                        self._respond(404)
+                    elif 'if-unused' in url.query and queue['consumers']:
+                        self._respond(400, {'error': 'in use'})
+                    else:
+                        del broker.queues[queue_name]
+                        self._respond(204)
+                case _:
+                    self._respond(405)
+
+    def _list_queues(self, query: dict[str, list[str]]) -> dict[str, Any]:
+        pattern = re.compile(query['name'][0])
+        page_size = int(query['page_size'][0])
+        page = int(query['page'][0])
+        names = sorted(name for name in self.broker.queues if pattern.search(name))
+        items = [
+            {'name': name, **self.broker.queues[name]}
+            for name in names[(page - 1) * page_size : page * page_size]
+        ]
+        return {'items': items, 'page_count': max(-(-len(names) // page_size), 1)}
+
+    def _respond(self, status: int, body: Any = None) -> None:
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def make_amqp_stub(broker: FakeRabbitMQ) -> type:
+    """A stand-in for pika.BlockingConnection, which declares and deletes queues on the fake broker."""
+    import pika.exceptions
+
+    class StubChannel:
+        def _operation(self) -> None:
+            if broker.round_trip('amqp operation'):
+                raise pika.exceptions.ChannelClosedByBroker(541, 'injected failure')
+
+        def exchange_declare(self, **kwargs: Any) -> Any:  # noqa: ARG002
+            self._operation()
+            return SimpleNamespace(method='Exchange.DeclareOk')
+
+        def queue_declare(self, queue: str, **kwargs: Any) -> Any:  # noqa: ARG002
+            self._operation()
+            with broker.lock:
+                broker.queues.setdefault(queue, {'consumers': 0, 'idle_since': None})
+            return SimpleNamespace(method=SimpleNamespace(queue=queue))
+
+        def queue_bind(self, **kwargs: Any) -> Any:  # noqa: ARG002
+            self._operation()
+            return SimpleNamespace(method='Queue.BindOk')
+
+        def queue_delete(self, queue: str) -> Any:
+            self._operation()
+            with broker.lock:
+                broker.queues.pop(queue, None)
+            return SimpleNamespace(method='Queue.DeleteOk')
+
+    class StubConnection:
+        def __init__(self, parameters: Any) -> None:  # noqa: ARG002
+            # protocol header, Connection.Tune, Connection.Open and Channel.Open each wait for the broker
+            failed = [broker.round_trip('amqp connection') for _ in range(4)]
+            if any(failed):
+                msg = 'injected failure'
+                raise pika.exceptions.AMQPConnectionError(msg)
+
+        def __enter__(self) -> 'StubConnection':
+            return self
+
+        def __exit__(self, *_: object) -> None:
+            pass
+
+        def channel(self) -> StubChannel:
+            return StubChannel()
+
+    return StubConnection
+
+
+def batched(items: Sequence[str], size: int) -> Iterator[Sequence[str]]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def measure(
+    label: str,
+    broker: FakeRabbitMQ,
+    calls: Iterator[Callable[[], object]],
+) -> None:
+    """Run every call, counting those which raise, and print one row of the table."""
+    with broker.lock:
+        broker.round_trips.clear()
+    errors = 0
+    total = 0
+    start = time.perf_counter()
+    for call in calls:
+        total += 1
+        try:
+            call()
+        except Exception:  # noqa: BLE001
+            errors += 1
+    elapsed = time.perf_counter() - start
+    http = sum(count for kind, count in broker.round_trips.items() if not kind.startswith('amqp'))
+    service_users = sum(1 for user in broker.users if user.startswith(SERVICE_PREFIX))
+    print(
+        f'{label:<28} {elapsed:>8.3f} {total:>6} {errors:>6} {http:>6}'
+        f' {broker.round_trips["amqp connection"] // 4:>6} {broker.round_trips["amqp operation"]:>7}'
+        f' {service_users:>6} {len(broker.queues):>7}'
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--services', type=int, default=200, help='number of Services')
+    parser.add_argument('--batch-size', type=int, default=100, help='Services per batch call')
+    parser.add_argument(
+        '--client-queues', type=int, default=1000, help='Client queues for the stale queue sweep'
+    )
+    parser.add_argument(
+        '--latency', type=float, default=1.0, help='milliseconds every round trip takes'
+    )
+    parser.add_argument(
+        '--failure-rate', type=float, default=0.0, help='probability that a round trip fails'
+    )
+    parser.add_argument('--seed', type=int, default=0, help='seed of the injected failures')
+    args = parser.parse_args()
+
+    broker = FakeRabbitMQ(args.latency / 1000, args.failure_rate, args.seed)
+    ManagementAPI.broker = broker
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ManagementAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # the Settings parse the command line and the environment when they are imported
+    del sys.argv[1:]
+    os.environ['BROKER_MANAGEMENT_URI'] = f'http://127.0.0.1:{server.server_port}'
+    os.environ['BROKER_APPLICATION'] = 'rabbitmq'
+    os.environ['BROKER_PROTOCOL'] = 'amqp0.9.1'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import pika
+
+    from intersect_registry_service.app.core.configuration_manager import ConfigurationManager
+    from intersect_registry_service.app.core.environment import settings
+    from intersect_registry_service.app.core.log_config import setup_logging
+    from intersect_registry_service.app.utils.client_name_generator import CLIENT_PREFIX
+
+    setup_logging()
+    pika.BlockingConnection = make_amqp_stub(broker)  # type: ignore[misc]
+    config_manager = ConfigurationManager(settings)
+    broker_handler = config_manager.broker_handler
+    service_names = [f'{SERVICE_PREFIX}-{i}' for i in range(args.services)]
+    batches = list(batched(service_names, args.batch_size))
+
+    stale_since = '2020-01-01 00:00:00'
+    for i in range(args.client_queues):
+        # every tenth queue is in use, the rest were left behind by crashed Clients
+        broker.queues[f'{CLIENT_PREFIX}{i}_response'] = {
+            'consumers': int(i % 10 == 0),
+            'idle_since': stale_since,
+        }
+
+    print(
+        f'{"operation":<28} {"wall s":>8} {"calls":>6} {"errors":>6} {"HTTP":>6}'
+        f' {"conns":>6} {"AMQP ops":>7} {"users":>6} {"queues":>7}'
+    )
+    measure(
+        'register, one at a time',
+        broker,
+        (lambda name=name: config_manager.add_service(name) for name in service_names),
+    )
+    measure(
+        'rotate, one at a time',
+        broker,
+        (
+            lambda name=name: broker_handler.initialize_service_config(name)
+            for name in service_names
+        ),
+    )
+    measure(
+        'delete, one at a time',
+        broker,
+        (lambda name=name: config_manager.remove_services([name]) for name in service_names),
+    )
+    measure(
+        'register, batches',
+        broker,
+        (lambda batch=batch: config_manager.add_services(batch) for batch in batches),
+    )
+    measure(
+        'rotate, batches',
+        broker,
+        (lambda batch=batch: broker_handler.initialize_service_configs(batch) for batch in batches),
+    )
+    measure(
+        'delete, batches',
+        broker,
+        (lambda batch=batch: config_manager.remove_services(batch) for batch in batches),
+    )
+    measure('sweep stale client queues', broker, iter([config_manager.remove_stale_clients]))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
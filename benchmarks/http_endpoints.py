@@ -0,0 +1,370 @@
+"""Load test of the SDK and UI endpoints: latency percentiles and throughput of the whole app, middlewares and lifespan included.
+
+    uv run python benchmarks/http_endpoints.py --concurrency 16 --requests 2000 --json results.json
+
+Requests go through httpx's ASGI transport, in the same process and on the same event loop as the app, so sockets and HTTP parsing are
+not measured, while the client's own overhead is. Only compare numbers taken on the same machine with the same options.
+
+The broker is replaced by handlers which accept every call after --broker-latency milliseconds. The database is Postgres if --url is given,
+point it at the instance from `docker compose` after running the migrations. Without --url, a temporary SQLite database stands in for it,
+which shows the app's overhead but not realistic query times, and does not save Service activity.
+
+Scenarios, each run on its own after a warm-up:
+- service_config: an SDK Service fetching its configuration, spread over --services Services
+- client_config: an SDK Client fetching its configuration, served from the Client identity pool
+- microservice_user_page: a logged in user's first page of --services Services
+- add_new_service: a user registering a Service with Javascript enabled, i.e. an HTMX request
+
+With --json, the results are written as JSON, with keys in a stable order so that runs can be diffed.
+With --baseline, the results are compared against an earlier --json file, and the script exits with status 1 if any scenario got slower
+(p95 latency) or lost throughput by more than --tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import secrets
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Sequence
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+SERVICE_PREFIX = 'benchmark-http'
+USERNAME = 'username'
+"""One of the users of the 'rudimentary' auth implementation"""
+
+
+class StandInHandler:
+    """Every call succeeds after the configured latency, and is counted."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls = 0
+
+    def _round_trip(self) -> None:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def check_health(self) -> None:
+        # the health checks run in the background, and are not part of any scenario
+        pass
+
+
+class StandInProtocolHandler(StandInHandler):
+    def initialize_broker(self) -> None:
+        self._round_trip()
+
+    def initialize_service_config(self, service_name: str) -> None:  # noqa: ARG002
+        self._round_trip()
+
+    def initialize_service_configs(self, service_names: Sequence[str]) -> None:  # noqa: ARG002
+        self._round_trip()
+
+    def remove_service_config(self, service_name: str) -> None:  # noqa: ARG002
+        self._round_trip()
+
+    def remove_service_configs(self, service_names: Sequence[str]) -> None:  # noqa: ARG002
+        self._round_trip()
+
+    def initialize_client_configs(self, client_names: Sequence[str]) -> None:  # noqa: ARG002
+        self._round_trip()
+
+
+class StandInBrokerHandler(StandInHandler):
+    def initialize_broker(self, client_username: str, client_password: str) -> None:  # noqa: ARG002
+        self._round_trip()
+
+    def initialize_service_config(self, service_name: str) -> tuple[str, str]:
+        self._round_trip()
+        return service_name, secrets.token_urlsafe(16)
+
+    def initialize_service_configs(self, service_names: Sequence[str]) -> list[tuple[str, str]]:
+        self._round_trip()
+        return [(service_name, secrets.token_urlsafe(16)) for service_name in service_names]
+
+    def remove_service_config(self, service_name: str) -> None:  # noqa: ARG002
+        self._round_trip()
+
+    def remove_service_configs(self, service_names: Sequence[str]) -> None:  # noqa: ARG002
+        self._round_trip()
+
+    def remove_stale_client_queues(self, max_idle_seconds: int) -> int:  # noqa: ARG002
+        self._round_trip()
+        return 0
+
+
+def percentile_ms(quantiles: list[float], percent: int) -> float:
+    return round(quantiles[percent - 1] / 1e6, 3)
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    make_request: Callable[[httpx.AsyncClient, int], Any],
+    expected_status: int,
+    requests: int,
+    concurrency: int,
+) -> dict[str, Any]:
+    """Send 'requests' requests from 'concurrency' concurrent callers, and summarize their latencies."""
+    latencies: list[int] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def caller() -> None:
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter_ns()
+            response = await make_request(client, i)
+            latencies.append(time.perf_counter_ns() - start)
+            if response.status_code != expected_status:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput': round(requests / elapsed, 1),
+        'mean_ms': round(statistics.fmean(latencies) / 1e6, 3),
+        'p50_ms': percentile_ms(quantiles, 50),
+        'p95_ms': percentile_ms(quantiles, 95),
+        'p99_ms': percentile_ms(quantiles, 99),
+    }
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """Returns: a description of every regression beyond the tolerance"""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f'{name}: p95 {previous["p95_ms"]} ms -> {current["p95_ms"]} ms')
+        if current['throughput'] < previous['throughput'] * (1 - tolerance):
+            regressions.append(
+                f'{name}: throughput {previous["throughput"]} -> {current["throughput"]} req/s'
+            )
+    return regressions
+
+
+async def benchmark(args: argparse.Namespace, database_dir: Path) -> dict[str, Any]:
+    from sqlalchemy import create_engine, delete, event
+    from sqlmodel import Session, SQLModel, col
+
+    from intersect_registry_service.app import main
+    from intersect_registry_service.app.auth import session_manager
+    from intersect_registry_service.app.core import configuration_manager
+    from intersect_registry_service.app.core.database import InstrumentedQueuePool
+    from intersect_registry_service.app.core.environment import Settings, settings
+    from intersect_registry_service.app.core.request_phases import time_engine_statements
+    from intersect_registry_service.app.core.service_activity import ServiceActivityTracker
+    from intersect_registry_service.app.models.service import Service
+
+    latency = args.broker_latency / 1000
+    protocol_handler = StandInProtocolHandler(latency)
+    broker_handler = StandInBrokerHandler(latency)
+
+    def use_protocol_stand_in(settings: Settings) -> Any:  # noqa: ARG001
+        return protocol_handler
+
+    def use_broker_stand_in(settings: Settings) -> Any:  # noqa: ARG001
+        return broker_handler
+
+    # the app looks these up when its lifespan starts
+    configuration_manager.get_protocol_handler = use_protocol_stand_in
+    configuration_manager.get_broker_handler = use_broker_stand_in
+
+    if args.url:
+        engine = main.create_db_engine(args.url, settings)
+    else:
+        engine = create_engine(
+            f'sqlite:///{database_dir / "registry.db"}',
+            poolclass=InstrumentedQueuePool,
+            pool_size=settings.POSTGRESQL_POOL_SIZE,
+            connect_args={'check_same_thread': False},
+        )
+
+        def concurrent_writes(dbapi_connection: Any, connection_record: Any) -> None:  # noqa: ARG001
+            # with the default rollback journal, concurrent writers wait on each other for hundreds of milliseconds
+            dbapi_connection.execute('PRAGMA journal_mode=WAL')
+            dbapi_connection.execute('PRAGMA synchronous=NORMAL')
+
+        event.listen(engine, 'connect', concurrent_writes)
+        time_engine_statements(engine)
+
+        class DiscardedActivity(ServiceActivityTracker):
+            """The activity upsert only works on Postgres"""
+
+            def flush(self) -> None:
+                pass
+
+        main.ServiceActivityTracker = DiscardedActivity  # type: ignore[misc]
+
+    def use_benchmark_engine(url: str, settings: Settings) -> Any:  # noqa: ARG001
+        return engine
+
+    main.create_db_engine = use_benchmark_engine
+
+    SQLModel.metadata.create_all(engine)
+    services = [
+        (f'{SERVICE_PREFIX}-{i}-{secrets.token_hex(4)}', secrets.token_urlsafe(32))
+        for i in range(args.services)
+    ]
+    with Session(engine) as session:
+        session.add_all(
+            Service(service_name=service_name, username=USERNAME, api_key=api_key)
+            for service_name, api_key in services
+        )
+        session.commit()
+
+    async def service_config(client: httpx.AsyncClient, i: int) -> httpx.Response:
+        service_name, api_key = services[i % len(services)]
+        return await client.get(
+            '/api/v1/sdk/service_config',
+            params={'service_name': service_name},
+            headers={'Authorization': api_key},
+        )
+
+    async def client_config(client: httpx.AsyncClient, i: int) -> httpx.Response:  # noqa: ARG001
+        return await client.get(
+            '/api/v1/sdk/client_config', headers={'Authorization': settings.BROKER_CLIENT_API_KEY}
+        )
+
+    async def microservice_user_page(client: httpx.AsyncClient, i: int) -> httpx.Response:  # noqa: ARG001
+        return await client.get('/')
+
+    csrf_token = ''
+
+    async def fetch_csrf_token(client: httpx.AsyncClient) -> None:
+        """Every visit of the user page sets a new CSRF cookie, which the form's token is checked against."""
+        nonlocal csrf_token
+        page = await client.get('/')
+        match = re.search(r'name="csrf-token" value="([^"]+)"', page.text)
+        if match is None:
+            msg = f'Could not log in, the user page returned {page.status_code}'
+            raise Exception(msg)  # noqa: TRY002
+        csrf_token = match.group(1)
+
+    async def add_new_service(client: httpx.AsyncClient, i: int) -> httpx.Response:
+        return await client.post(
+            '/',
+            data={
+                'service_name': f'{SERVICE_PREFIX}-new-{i}-{secrets.token_hex(4)}',
+                'csrf-token': csrf_token,
+            },
+            headers={'HX-Request': 'true'},
+        )
+
+    # name, request, expected status code, preparation before the warm-up
+    scenarios: list[
+        tuple[
+            str,
+            Callable[[httpx.AsyncClient, int], Any],
+            int,
+            Callable[[httpx.AsyncClient], Any] | None,
+        ]
+    ] = [
+        ('service_config', service_config, 200, None),
+        ('client_config', client_config, 200, None),
+        ('microservice_user_page', microservice_user_page, 200, None),
+        ('add_new_service', add_new_service, 200, fetch_csrf_token),
+    ]
+    results: dict[str, Any] = {}
+    try:
+        async with (
+            main.app.router.lifespan_context(main.app),
+            httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=main.app), base_url='https://testserver'
+            ) as client,
+        ):
+            client.cookies.set(
+                session_manager.cookie_name,
+                session_manager.create_access_token(data={'sub': USERNAME}),
+            )
+            for name, make_request, expected_status, prepare in scenarios:
+                if prepare is not None:
+                    await prepare(client)
+                await run_scenario(client, make_request, expected_status, args.warmup, 1)
+                results[name] = await run_scenario(
+                    client, make_request, expected_status, args.requests, args.concurrency
+                )
+    finally:
+        with Session(engine) as session:
+            session.execute(
+                delete(Service).where(col(Service.service_name).startswith(SERVICE_PREFIX))
+            )
+            session.commit()
+        engine.dispose()
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'database': engine.dialect.name,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'services': args.services,
+            'broker_latency_ms': args.broker_latency,
+            'broker_calls': protocol_handler.calls + broker_handler.calls,
+        },
+        'scenarios': results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='SQLAlchemy URL of a Postgres database, SQLite if not set')
+    parser.add_argument('--concurrency', type=int, default=8, help='requests in flight at once')
+    parser.add_argument('--requests', type=int, default=1000, help='requests per scenario')
+    parser.add_argument('--warmup', type=int, default=50, help='requests before each scenario')
+    parser.add_argument(
+        '--services', type=int, default=50, help='Services the user owns, one page by default'
+    )
+    parser.add_argument(
+        '--broker-latency', type=float, default=0.0, help='milliseconds every broker call takes'
+    )
+    parser.add_argument('--json', type=Path, help='file to write the results to')
+    parser.add_argument('--baseline', type=Path, help='results of an earlier run to compare with')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.2, help='regression allowed against the baseline'
+    )
+    args = parser.parse_args()
+    # the Settings parse the command line when they are imported
+    del sys.argv[1:]
+    os.environ['AUTH_IMPLEMENTATION'] = 'rudimentary'
+    os.environ['DEVELOPMENT_API_KEY'] = ''
+    # otherwise every request writes an access log entry, set LOG_LEVEL to include their cost
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    with tempfile.TemporaryDirectory() as database_dir:
+        results = asyncio.run(benchmark(args, Path(database_dir)))
+
+    print(f'{"scenario":<24} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}')
+    for name, result in results['scenarios'].items():
+        print(
+            f'{name:<24} {result["throughput"]:>8.1f} {result["p50_ms"]:>8.2f}'
+            f' {result["p95_ms"]:>8.2f} {result["p99_ms"]:>8.2f} {result["errors"]:>7}'
+        )
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2) + '\n')
+
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
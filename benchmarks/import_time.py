@@ -0,0 +1,139 @@
+"""Import time of the app, which is most of what a new worker spends before it can serve requests.
+
+    uv run python benchmarks/import_time.py --api-only --budget-ms 500
+
+Imports intersect_registry_service.app.main in a fresh interpreter with `python -X importtime`, --runs times, and reports the fastest
+run: the total, and the packages which took the longest, counting only the time spent in each module itself. The app's own modules
+are grouped by subpackage (i.e. 'intersect_registry_service.app.ui'), everything else by distribution. Uvicorn is imported beforehand
+and not counted, since workers already run in it when they import the app.
+
+The Settings are read from the environment and '.env' as usual, so run it from a directory with a '.env', i.e. the repository root.
+With --api-only, the app is imported with UI_ENABLED=false, and the run fails if any part of the UI stack was imported anyway.
+
+With --json, the results are written as JSON. With --budget-ms, the script exits with status 1 if the fastest run took longer.
+Import times vary a lot between machines and with the state of the file system cache, so only compare budgets on the same machine.
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+APP_MODULE = 'intersect_registry_service.app.main'
+
+UI_MODULES = (
+    'intersect_registry_service.app.ui',
+    'intersect_registry_service.app.auth',
+    'intersect_registry_service.app.middlewares.csrf',
+    'intersect_registry_service.app.middlewares.server_session',
+    'jinja2',
+    'fastapi_csrf_protect',
+    'fastapi_login',
+    'authlib',
+)
+"""Modules which API-only workers must not import"""
+
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| *(\S+)$')
+
+
+def import_once(module: str, env: dict[str, str]) -> dict[str, tuple[int, int]]:
+    """Returns: microseconds spent in each imported module itself, and including its own imports"""
+    process = subprocess.run(  # noqa: S603
+        [sys.executable, '-X', 'importtime', '-c', f'import uvicorn; import {module}'],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if process.returncode != 0:
+        sys.exit(f'Importing {module} failed:\n{process.stderr}')
+    modules = {}
+    lines = process.stderr.splitlines()
+    # everything before is uvicorn's
+    start = max(idx for idx, line in enumerate(lines) if line.endswith('| uvicorn'))
+    for line in lines[start + 1 :]:
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            modules[match[3]] = (int(match[1]), int(match[2]))
+    return modules
+
+
+def package_of(module: str) -> str:
+    parts = module.split('.')
+    if parts[0] == 'intersect_registry_service':
+        return '.'.join(parts[:3])
+    return parts[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to import in')
+    parser.add_argument('--top', type=int, default=15, help='packages to list')
+    parser.add_argument(
+        '--api-only', action='store_true', help='import the app with UI_ENABLED=false'
+    )
+    parser.add_argument('--json', type=Path, help='file to write the results to')
+    parser.add_argument('--budget-ms', type=float, help='fail if the app took longer to import')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.api_only:
+        env['UI_ENABLED'] = 'false'
+    runs = [import_once(APP_MODULE, env) for _ in range(args.runs)]
+    totals = [run[APP_MODULE][1] for run in runs]
+    fastest = runs[totals.index(min(totals))]
+
+    packages: Counter[str] = Counter()
+    for module, times in fastest.items():
+        packages[package_of(module)] += times[0]
+    ui_modules = sorted(
+        module
+        for module in fastest
+        if any(module == ui or module.startswith(f'{ui}.') for ui in UI_MODULES)
+    )
+
+    results: dict[str, Any] = {
+        'environment': {
+            'python': platform.python_version(),
+            'api_only': args.api_only,
+            'runs': args.runs,
+        },
+        'total_ms': round(min(totals) / 1000, 1),
+        'median_ms': round(statistics.median(totals) / 1000, 1),
+        'modules': len(fastest),
+        'packages_ms': {
+            package: round(own / 1000, 1) for package, own in packages.most_common(args.top)
+        },
+        'ui_modules': ui_modules,
+    }
+
+    print(f'{"package":<44} {"ms":>8}')
+    for package, own_ms in results['packages_ms'].items():
+        print(f'{package:<44} {own_ms:>8.1f}')
+    print(
+        f'{APP_MODULE}: {results["total_ms"]:.1f} ms fastest, {results["median_ms"]:.1f} ms median,'
+        f' {results["modules"]} modules'
+    )
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2) + '\n')
+
+    failed = False
+    if args.api_only and ui_modules:
+        print(f'FAILED API-only workers imported {", ".join(ui_modules)}')
+        failed = True
+    if args.budget_ms is not None and results['total_ms'] > args.budget_ms:
+        print(f'FAILED import took {results["total_ms"]:.1f} ms, budget is {args.budget_ms} ms')
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Microbenchmark of the logging pipeline: how long the logging thread (i.e. the event loop) spends on one access log event.
+
+    uv run python benchmarks/logging_pipeline.py --json --output /dev/null
+
+Compares writing to stderr on the logging thread, as setup_logging used to, against handing the record to the listener thread.
+The 'drained' column includes the time the listener thread needs to write out everything, so it shows the throughput.
+With --json, the Bunyan fields and the JSON serializers are measured on their own as well.
+
+Events are written to --output. Point it at a pipe with a slow reader or a network filesystem to see the cost of blocking I/O.
+The logging configuration reads the same environment variables (or .env) as the server.
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import timeit
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, cast
+
+EVENT = {
+    'msg': '127.0.0.1:50000 - "GET /api/v1/sdk/service_config HTTP/1.1" 200',
+    'http': {
+        'url': 'https://registry.example.com/api/v1/sdk/service_config',
+        'status_code': 200,
+        'method': 'GET',
+        'request_id': '4bd43bfc0cc948de87017ead521ead99',
+        'version': '1.1',
+    },
+    'network': {'client': {'ip': '127.0.0.1', 'port': 50000}},
+    'duration': 554381,
+    'request_id': '4bd43bfc0cc948de87017ead521ead99',
+    'logger': 'intersect-registry-service.access',
+    'level': 30,
+    'time': '2026-10-19T08:04:54.834784Z',
+}
+
+
+def per_event(label: str, func: Callable[[], Any], iterations: int) -> None:
+    elapsed = timeit.timeit(func, number=iterations)
+    print(f'{label:<28} {elapsed / iterations * 1e6:>8.2f} us/event')
+
+
+def log_events(label: str, iterations: int, drain: Callable[[], None]) -> None:
+    import structlog
+
+    access_logger = structlog.get_logger('intersect-registry-service.access')
+    sqlalchemy_logger = logging.getLogger('sqlalchemy.engine')
+    structlog.contextvars.bind_contextvars(request_id=EVENT['request_id'])
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        # the same mix as a request which runs one statement: one foreign event and one structlog event
+        sqlalchemy_logger.info('[cached since %ss ago] %s', i, 'SELECT 1')
+        access_logger.info('%s', EVENT['msg'], http=EVENT['http'], network=EVENT['network'])
+    logged = time.perf_counter() - start
+    drain()
+    drained = time.perf_counter() - start
+    print(
+        f'{label:<28} {logged / iterations / 2 * 1e6:>8.2f} us/event logging thread'
+        f' {drained / iterations / 2 * 1e6:>8.2f} us/event drained'
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--json', action='store_true', help='use the production (Bunyan JSON) format'
+    )
+    parser.add_argument('--output', default=os.devnull, help='file the events are written to')
+    parser.add_argument('--iterations', type=int, default=20000, help='events per variant')
+    args = parser.parse_args()
+    # the Settings parse the command line when they are imported
+    del sys.argv[1:]
+    os.environ['PRODUCTION'] = str(args.json)
+    os.environ['LOG_LEVEL'] = 'INFO'
+
+    from intersect_registry_service.app.core.log_config import _dumps_json, setup_logging
+
+    if args.json:
+        event = dict(EVENT)
+        per_event(
+            'Bunyan fields, per event',
+            lambda: event.update(v=0, pid=os.getpid(), hostname=platform.node()),
+            args.iterations,
+        )
+        static_fields = {'v': 0, 'pid': os.getpid(), 'hostname': platform.node()}
+        per_event(
+            'Bunyan fields, per process', lambda: event.update(static_fields), args.iterations
+        )
+        per_event('json.dumps', lambda: json.dumps(EVENT), args.iterations)
+        per_event('orjson', lambda: _dumps_json(EVENT), args.iterations)
+
+    with Path(args.output).open('w') as output, contextlib.redirect_stderr(output):
+        setup_logging()
+        queue_handler = cast('logging.Handler', logging.getHandlerByName('queue_handler'))
+        stderr_handler = cast('logging.Handler', logging.getHandlerByName('stderr'))
+        # closing the queue handler waits for the listener thread to write out the queue
+        log_events('queue handler', args.iterations, queue_handler.close)
+
+        # what setup_logging used to do, the same processors but the stream handler on every logger
+        for name in ('', 'sqlalchemy.engine'):
+            logging.getLogger(name).handlers = [stderr_handler]
+        log_events('stream handler', args.iterations, lambda: None)
+
+
+if __name__ == '__main__':
+    main()
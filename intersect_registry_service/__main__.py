@@ -1,19 +1,44 @@
-import structlog
-import uvicorn
+import argparse
+import contextlib
+import os
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+from typing import IO
 
-from intersect_registry_service.app.core.configuration_manager import ConfigurationManager
-from intersect_registry_service.app.core.environment import settings
-from intersect_registry_service.app.core.log_config import setup_logging
-from intersect_registry_service.app.core.run_migrations import run_migrations
+import structlog
 
 logger = structlog.stdlib.get_logger('intersect-registry-service.main')
 
+# NOTE: the Settings parse the command line as soon as they are imported, so only import them after our own arguments were removed from sys.argv
+
 
 def main() -> None:
+    if sys.argv[1:2] == ['services']:
+        services_command(sys.argv[2:])
+    else:
+        run_server()
+
+
+def run_server() -> None:
+    import uvicorn
+
+    from intersect_registry_service.app.core.configuration_manager import ConfigurationManager
+    from intersect_registry_service.app.core.environment import settings
+    from intersect_registry_service.app.core.log_config import setup_logging
+    from intersect_registry_service.app.core.run_migrations import run_migrations
+
     # WARNING - the logger names will NOT propogate to workers if uvicorn.reload = True or uvicorn.server_workers > 1
     # so we should setup logging twice - once on the uvicorn main, and once in the runner
     setup_logging()
 
+    # workers inherit this, and write their metrics there instead of keeping them in memory. Stale files from a previous run would be reported as well,
+    # so remove them - but only the metric files, in case the directory was misconfigured to one holding anything else
+    settings.METRICS_MULTIPROC_DIR.mkdir(parents=True, exist_ok=True)
+    for stale_file in settings.METRICS_MULTIPROC_DIR.glob('*.db'):
+        stale_file.unlink(missing_ok=True)
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = str(settings.METRICS_MULTIPROC_DIR)
+
     host = '0.0.0.0' if settings.PRODUCTION else '127.0.0.1'  # noqa: S104 (mandatory if running in Docker)
     url = f'http://{host}:{settings.SERVER_PORT}{settings.BASE_URL}'
     if settings.PRODUCTION:
@@ -62,5 +87,91 @@ def main() -> None:
     )
 
 
+def services_command(argv: list[str]) -> None:
+    """Bulk import or export Services. The database and broker are configured through environment variables, same as the server."""
+    parser = argparse.ArgumentParser(
+        prog='python -m intersect_registry_service services',
+        description='Bulk import or export Services as CSV or JSON lines.',
+    )
+    actions = parser.add_subparsers(dest='action', required=True)
+    export_parser = actions.add_parser('export', help='write every Service to a file')
+    export_parser.add_argument(
+        'output', nargs='?', default='-', help="file to write, '-' for stdout"
+    )
+    export_parser.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+    import_parser = actions.add_parser(
+        'import',
+        help='create Services and their broker users from a file',
+        description="Rows need a 'service_name' and a 'username', rows with an 'api_key', 'created_on' or 'last_modified' keep them. Existing Services are skipped.",
+    )
+    import_parser.add_argument('input', help="file to read, '-' for stdin")
+    import_parser.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+    import_parser.add_argument('--username', help='owner of the rows which do not have a username')
+    import_parser.add_argument(
+        '--batch-size', type=int, default=1000, help='number of Services committed at once'
+    )
+    args = parser.parse_args(argv)
+    del sys.argv[1:]
+
+    import psycopg
+    from sqlalchemy import make_url
+
+    from intersect_registry_service.app.core.configuration_manager import ConfigurationManager
+    from intersect_registry_service.app.core.environment import settings
+    from intersect_registry_service.app.core.log_config import setup_logging
+    from intersect_registry_service.app.core.service_transfer import (
+        export_services,
+        import_services,
+        read_services,
+    )
+
+    setup_logging()
+    conninfo = (
+        make_url(settings.postgres_url)
+        .set(drivername='postgresql')
+        .render_as_string(hide_password=False)
+    )
+    with psycopg.connect(conninfo, autocommit=True) as connection:
+        if args.action == 'export':
+            with _open_output(args.output) as output:
+                count = export_services(connection, output, args.format)
+            logger.info('Exported %d services', count)
+            return
+
+        config_manager = ConfigurationManager(settings)
+        with _open_input(args.input) as source:
+            summary = import_services(
+                connection,
+                read_services(source, args.format, args.username),
+                config_manager,
+                args.batch_size,
+            )
+        logger.info(
+            'Imported %d services, skipped %d which already existed and %d invalid rows',
+            summary.imported,
+            summary.skipped_existing,
+            summary.skipped_invalid,
+        )
+
+
+@contextlib.contextmanager
+def _open_output(path: str) -> Iterator[IO[bytes]]:
+    if path == '-':
+        yield sys.stdout.buffer
+        return
+    with Path(path).open('wb') as output:
+        yield output
+
+
+@contextlib.contextmanager
+def _open_input(path: str) -> Iterator[IO[str]]:
+    if path == '-':
+        yield sys.stdin
+        return
+    # newline='' is required by the csv module
+    with Path(path).open(encoding='utf-8', newline='') as source:
+        yield source
+
+
 if __name__ == '__main__':
     main()
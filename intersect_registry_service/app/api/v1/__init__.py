@@ -1,7 +1,11 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Security
 
 from ...core.environment import settings
+from .api_key import require_admin_api_key
 from .endpoints import general
+from .endpoints.admin import profiling as admin_profiling
+from .endpoints.admin import services as admin_services
+from .endpoints.admin import stats as admin_stats
 
 router = APIRouter(prefix='/v1', tags=['V1'])
 router.include_router(general.router)
@@ -10,3 +14,11 @@ if settings.DEVELOPMENT_API_KEY:
 else:
     from .endpoints.sdk import impl_real as sdk  # type: ignore[no-redef]
 router.include_router(sdk.router, prefix='/sdk', tags=['SDK'])
+
+admin_router = APIRouter(
+    prefix='/admin', tags=['Admin'], dependencies=[Security(require_admin_api_key)]
+)
+admin_router.include_router(admin_stats.router)
+admin_router.include_router(admin_services.router)
+admin_router.include_router(admin_profiling.router)
+router.include_router(admin_router)
@@ -1,3 +1,15 @@
+import secrets
+from typing import Annotated
+
+from fastapi import HTTPException, Security
 from fastapi.security.api_key import APIKeyHeader
 
+from ...core.environment import settings
+
 api_key_header = APIKeyHeader(name='Authorization')
+
+
+def require_admin_api_key(api_key: Annotated[str, Security(api_key_header)]) -> None:
+    """Dependency for administrative endpoints. These are disabled entirely if no admin API key is configured."""
+    if not settings.ADMIN_API_KEY or not secrets.compare_digest(api_key, settings.ADMIN_API_KEY):
+        raise HTTPException(status_code=403, detail='Invalid API key in Authorization header')
@@ -0,0 +1,114 @@
+"""Profiling sessions, for finding out why an endpoint is slow or a worker's memory grows. See core/profiling.py for what gets recorded."""
+
+import datetime
+from pathlib import Path
+from typing import Annotated
+
+from anyio.to_thread import run_sync
+from fastapi import APIRouter, HTTPException
+from fastapi import Path as PathParam
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, Field, PositiveInt
+
+from .....core.environment import settings
+from .....core.log_config import logger
+from .....core.profiling import (
+    CONTROL_FILE_NAME,
+    RESULT_FILE_REGEX,
+    ProfilingSession,
+    read_session,
+    write_session,
+)
+
+router = APIRouter(prefix='/profiling')
+
+
+class NewProfilingSession(BaseModel):
+    cpu_sample_rate: Annotated[float, Field(ge=0.0, le=1.0)] = 0.0
+    """Fraction of requests which get a CPU profile"""
+    path_prefix: str = '/'
+    """Only requests whose path starts with this are profiled"""
+    max_cpu_profiles: PositiveInt = 100
+    """Each worker stops profiling requests once it wrote this many profiles during the session"""
+    memory_snapshot_interval: PositiveInt | None = None
+    """If set, every worker traces memory allocations, and writes a diff against the start of the session this many seconds apart. Tracing slows down every allocation."""
+    duration: Annotated[int, Field(ge=1, le=86400)] = 600
+    """Number of seconds after which the session ends by itself"""
+
+
+class ProfilingFile(BaseModel):
+    name: str
+    size: int
+    modified: datetime.datetime
+
+
+class ProfilingStatus(BaseModel):
+    session: ProfilingSession | None
+    """The current session, None if there is none"""
+    files: list[ProfilingFile]
+    """Results of this and previous sessions, newest first"""
+
+
+def _profiling_dir() -> Path:
+    if settings.PROFILING_DIR is None:
+        raise HTTPException(status_code=404, detail='Profiling is disabled, set PROFILING_DIR')
+    return settings.PROFILING_DIR
+
+
+def _get_status(directory: Path) -> ProfilingStatus:
+    files = []
+    for path in directory.iterdir():
+        if path.name == CONTROL_FILE_NAME or not path.is_file():
+            continue
+        stat = path.stat()
+        files.append(
+            ProfilingFile(
+                name=path.name,
+                size=stat.st_size,
+                modified=datetime.datetime.fromtimestamp(stat.st_mtime, datetime.UTC),
+            )
+        )
+    files.sort(key=lambda file: file.modified, reverse=True)
+    return ProfilingStatus(session=read_session(directory / CONTROL_FILE_NAME), files=files)
+
+
+@router.get('', description='The current profiling session, and the files all sessions produced.')
+async def get_profiling() -> ProfilingStatus:
+    return await run_sync(_get_status, _profiling_dir())
+
+
+@router.post(
+    '',
+    status_code=201,
+    description='Start a profiling session, replacing the current one. Every worker picks it up within PROFILING_POLL_INTERVAL seconds.',
+)
+async def post_profiling(body: NewProfilingSession) -> ProfilingSession:
+    directory = _profiling_dir()
+    now = datetime.datetime.now(datetime.UTC)
+    session = ProfilingSession(
+        **body.model_dump(exclude={'duration'}),
+        started_at=now,
+        expires_at=now + datetime.timedelta(seconds=body.duration),
+    )
+    await run_sync(write_session, directory / CONTROL_FILE_NAME, session)
+    logger.info('Started a profiling session until %s', session.expires_at.isoformat())
+    return session
+
+
+@router.delete(
+    '',
+    status_code=204,
+    description='End the current profiling session. Workers write their last memory diff when they notice.',
+)
+async def delete_profiling() -> None:
+    await run_sync(write_session, _profiling_dir() / CONTROL_FILE_NAME, None)
+
+
+@router.get('/files/{name}', description='Download a file written by a profiling session.')
+async def get_profiling_file(
+    name: Annotated[str, PathParam(pattern=RESULT_FILE_REGEX)],
+) -> FileResponse:
+    path = _profiling_dir() / name
+    if not await run_sync(path.is_file):
+        raise HTTPException(status_code=404, detail='No such file')
+    return FileResponse(path, filename=name)
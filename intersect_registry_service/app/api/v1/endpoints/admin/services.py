@@ -0,0 +1,160 @@
+"""Batched Service management, for automation which would otherwise have to go through the UI one Service at a time."""
+
+import datetime
+from typing import Annotated, Any
+
+from anyio.to_thread import run_sync
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import BaseModel, Field
+from sqlalchemy import Row
+
+from .....core.definitions import HIERARCHY_REGEX
+from .....core.environment import settings
+from .....core.log_config import logger
+from .....core.service_batches import (
+    create_services,
+    delete_services,
+    list_services,
+    rotate_api_keys,
+)
+
+router = APIRouter(prefix='/services')
+
+# pydantic only searches for the pattern, so it needs to be anchored
+ServiceName = Annotated[str, Field(min_length=3, max_length=63, pattern=f'^{HIERARCHY_REGEX}$')]
+
+
+class ServiceInfo(BaseModel):
+    id: int
+    service_name: str
+    username: str
+    """The user who manages this Service in the UI"""
+    api_key: str
+    """The key the Service's SDK processes use to fetch their configuration"""
+    created_on: datetime.datetime
+    last_modified: datetime.datetime
+
+
+class ServicePage(BaseModel):
+    services: list[ServiceInfo]
+    next_after: int | None
+    """Pass this as 'after' to get the next page, None if this was the last page"""
+
+
+class NewService(BaseModel):
+    service_name: ServiceName
+    username: Annotated[str, Field(min_length=1)]
+    """The user who will manage this Service in the UI"""
+
+
+class NewServices(BaseModel):
+    services: Annotated[
+        list[NewService], Field(min_length=1, max_length=settings.ADMIN_API_MAX_BATCH_SIZE)
+    ]
+
+
+class ServiceNames(BaseModel):
+    service_names: Annotated[
+        list[ServiceName], Field(min_length=1, max_length=settings.ADMIN_API_MAX_BATCH_SIZE)
+    ]
+
+
+class CreatedServices(BaseModel):
+    created: list[ServiceInfo]
+    existing: list[str]
+    """Names which were already taken, these Services were left untouched"""
+
+
+class RotatedServices(BaseModel):
+    rotated: list[ServiceInfo]
+    missing: list[str]
+    """Names which do not belong to any Service"""
+
+
+class DeletedServices(BaseModel):
+    deleted: list[str]
+    missing: list[str]
+    """Names which do not belong to any Service"""
+    broker_leftovers: list[str]
+    """Names whose broker users or queues could not all be removed. Delete them again to retry."""
+
+
+def _service_info(row: Row[Any]) -> ServiceInfo:
+    return ServiceInfo.model_validate(row._asdict())
+
+
+@router.get(
+    '', description='List Services in order of creation, optionally only those of one user.'
+)
+async def get_services(
+    req: Request,
+    username: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=settings.ADMIN_API_MAX_BATCH_SIZE)] = 100,
+    after: int | None = None,
+) -> ServicePage:
+    rows = await run_sync(list_services, req.app.state.db, username, limit, after)
+    return ServicePage(
+        services=[_service_info(row) for row in rows],
+        next_after=rows[-1].id if len(rows) == limit else None,
+    )
+
+
+@router.post(
+    '',
+    status_code=201,
+    description='Create a batch of Services, each with a new API key. Names which are already taken are skipped. If the broker cannot be configured, none of the Services are created.',
+)
+async def post_services(req: Request, body: NewServices) -> CreatedServices:
+    # the first occurrence of a name wins
+    services = list({svc.service_name: svc.username for svc in body.services}.items())
+    try:
+        rows = await run_sync(
+            create_services, req.app.state.db, req.app.state.config_manager, services
+        )
+    except Exception as e:
+        logger.exception('Could not create a batch of %d services', len(services))
+        raise HTTPException(
+            status_code=500, detail='Could not create the Services, none were created'
+        ) from e
+    created = {row.service_name for row in rows}
+    return CreatedServices(
+        created=[_service_info(row) for row in rows],
+        existing=[service_name for service_name, _ in services if service_name not in created],
+    )
+
+
+@router.post(
+    '/rotate',
+    description='Give each Service in the batch a new API key. The old keys stop working immediately.',
+)
+async def post_rotate_services(req: Request, body: ServiceNames) -> RotatedServices:
+    service_names = list(dict.fromkeys(body.service_names))
+    rows = await run_sync(rotate_api_keys, req.app.state.db, service_names)
+    rotated = {row.service_name for row in rows}
+    return RotatedServices(
+        rotated=[_service_info(row) for row in rows],
+        missing=[name for name in service_names if name not in rotated],
+    )
+
+
+@router.post(
+    '/delete',
+    description='Delete a batch of Services, then their broker users and queues. If the broker cannot be updated, the Services are still deleted, and the names whose broker resources may be left are listed in broker_leftovers; deleting them again retries the removal.',
+)
+async def post_delete_services(req: Request, body: ServiceNames) -> DeletedServices:
+    service_names = list(dict.fromkeys(body.service_names))
+    try:
+        summary = await run_sync(
+            delete_services, req.app.state.db, req.app.state.config_manager, service_names
+        )
+    except Exception as e:
+        logger.exception('Could not delete a batch of %d services', len(service_names))
+        raise HTTPException(
+            status_code=500, detail='Could not delete the Services, none were deleted'
+        ) from e
+    deleted_names = set(summary.deleted)
+    return DeletedServices(
+        deleted=summary.deleted,
+        missing=[name for name in service_names if name not in deleted_names],
+        broker_leftovers=summary.broker_leftovers,
+    )
@@ -0,0 +1,36 @@
+"""Internal statistics about this worker, meant for operators sizing a deployment."""
+
+import os
+
+from fastapi import APIRouter, Request
+from pydantic import BaseModel
+
+from .....core.database import get_pool_status
+
+router = APIRouter()
+
+
+class WorkerStats(BaseModel):
+    """Statistics of the single uvicorn worker which handled the request. Query repeatedly to sample every worker."""
+
+    pid: int
+    """Process ID of the worker"""
+    database: dict[str, dict[str, int | float]]
+    """Connection pool status, keyed by engine name"""
+    event_loop_lag: dict[str, float]
+    """Percentiles of the worker's recent event loop lag in seconds, empty right after it started"""
+
+
+@router.get(
+    '/stats',
+    description='Internal statistics of the worker handling this request, i.e. database connection pool usage and event loop lag.',
+)
+async def worker_stats(req: Request) -> WorkerStats:
+    database = {'primary': get_pool_status(req.app.state.db)}
+    for idx, engine in enumerate(req.app.state.db_replicas.engines):
+        database[f'replica-{idx}'] = get_pool_status(engine)
+    return WorkerStats(
+        pid=os.getpid(),
+        database=database,
+        event_loop_lag=req.app.state.event_loop_monitor.lag_percentiles(),
+    )
@@ -1,5 +1,7 @@
 from fastapi import APIRouter, Request, Response
-from sqlmodel import text
+from fastapi.responses import JSONResponse
+
+from ....core.health import HealthReport
 
 router = APIRouter()
 
@@ -18,16 +20,12 @@ async def ping() -> Response:
 @router.get(
     '/healthcheck',
     tags=['Healthcheck'],
-    description='Application healthcheck',
-    response_description=(
-        "Array of errors explaining why the service won't work (if empty array: all OK)"
-    ),
+    description='Application healthcheck, as of the last background check of its dependencies. Use /api/v1/liveness for liveness probes.',
+    response_description='The health of every dependency, with status 200 if all of them are healthy and 503 if not',
+    response_model=HealthReport,
+    responses={503: {'model': HealthReport}},
 )
 async def healthcheck(req: Request) -> Response:
-    """This can be used as a healthcheck endpoint for, e.g. Kubernetes."""
-    # check DB connection first
-    with req.app.state.db.connect() as connection:
-        connection.execute(text('SELECT 1'))
-
-    # check that we're connected to the broker
-    return Response()
+    """This can be used as a readiness probe for, e.g. Kubernetes. It does not contact any dependency itself."""
+    report: HealthReport = req.app.state.health.report()
+    return JSONResponse(report.model_dump(mode='json'), status_code=200 if report.healthy else 503)
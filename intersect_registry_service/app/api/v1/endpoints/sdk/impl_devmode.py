@@ -2,11 +2,10 @@
 
 from typing import Annotated
 
-from fastapi import APIRouter, HTTPException, Security
+from fastapi import APIRouter, HTTPException, Request, Security
 
 from .....core.definitions import get_raw_protocol, get_uri_path
 from .....core.environment import settings
-from .....utils.client_name_generator import generate_client_name
 from ...api_key import api_key_header
 from .definitions import ControlPlaneConfig, IntersectClientConfig, IntersectConfig
 
@@ -47,6 +46,7 @@ async def debug_service_config(
     response_description='The response type used by INTERSECT-SDK Clients to understand how to connect to the INTERSECT ecosystem.',
 )
 async def client_config_debug(
+    req: Request,
     api_key: Annotated[str, Security(api_key_header)],
 ) -> IntersectClientConfig:
     if api_key != settings.BROKER_CLIENT_API_KEY:
@@ -54,7 +54,7 @@ async def client_config_debug(
 
     # in Debug mode, we will just use the root broker credentials, and not worry about using a different user
     root_broker_uri = f'{get_raw_protocol(settings.BROKER_PROTOCOL, bool(settings.BROKER_TLS_CERT))}://{settings.BROKER_ROOT_USERNAME}:{settings.BROKER_ROOT_PASSWORD}@{settings.BROKER_HOST}:{settings.BROKER_PORT}{get_uri_path(settings.BROKER_PROTOCOL)}'
-    client_name = generate_client_name()
+    client_name = await req.app.state.client_pool.acquire()
     return IntersectClientConfig(
         system_name=settings.SYSTEM_NAME,
         brokers=[
@@ -3,12 +3,10 @@
 from typing import Annotated
 
 from fastapi import APIRouter, HTTPException, Query, Request, Security
-from sqlalchemy.exc import NoResultFound
-from sqlmodel import Session, select
 
+from .....core.database import get_read_engine
 from .....core.environment import settings
-from .....models.service import Service
-from .....utils.client_name_generator import generate_client_name
+from .....core.queries import service_exists
 from ...api_key import api_key_header
 from .definitions import ControlPlaneConfig, IntersectClientConfig, IntersectConfig
 
@@ -27,19 +25,17 @@ async def service_config(
     service_name: Annotated[str, Query(min_length=3, max_length=63)],
     api_key: Annotated[str, Security(api_key_header)],
 ) -> IntersectConfig:
-    with Session(req.app.state.db) as session:
-        statement = (
-            select(Service)
-            .where(Service.service_name == service_name, Service.api_key == api_key)
-            .limit(1)
+    read_engine = get_read_engine(req)
+    # a Service registered moments ago may not have reached the replica yet
+    if not service_exists(read_engine, service_name, api_key) and (
+        read_engine is req.app.state.db
+        or not service_exists(req.app.state.db, service_name, api_key)
+    ):
+        raise HTTPException(
+            status_code=403,
+            detail=f"Service namespace '{service_name}' either has not been registered yet or you have sent an invalid API key. You will need to manually register the key in the UI if it has not been registered yet.",
         )
-        try:
-            session.exec(statement).one()
-        except NoResultFound:  # don't need to check for multiple because of DB constraints
-            raise HTTPException(  # noqa: B904
-                status_code=403,
-                detail=f"Service namespace '{service_name}' either has not been registered yet or you have sent an invalid API key. You will need to manually register the key in the UI if it has not been registered yet.",
-            )
+    req.app.state.service_activity.record(service_name)
 
     return IntersectConfig(
         system_name=settings.SYSTEM_NAME,
@@ -59,12 +55,13 @@ async def service_config(
     response_description='The response type used by INTERSECT-SDK Clients to understand how to connect to the INTERSECT ecosystem.',
 )
 async def client_config(
+    req: Request,
     api_key: Annotated[str, Security(api_key_header)],
 ) -> IntersectClientConfig:
     if api_key != settings.BROKER_CLIENT_API_KEY:
         raise HTTPException(status_code=403, detail='Invalid API key in Authorization header')
 
-    client_name = generate_client_name()
+    client_name = await req.app.state.client_pool.acquire()
     return IntersectClientConfig(
         system_name=settings.SYSTEM_NAME,
         brokers=[
@@ -2,10 +2,13 @@
 Note that this authentication should ONLY apply to the UI-facing side. INTERSECT-SDK microservices authenticate with a different API-key mechanism.
 """
 
+from collections.abc import Awaitable, Callable
+
 from ..core.environment import settings
-from .definitions import SessionManager
+from .definitions import USER, SessionManager
 
 session_manager: SessionManager
+get_user: Callable[[str], USER | None] | Callable[[str], Awaitable[USER | None]]
 if settings.AUTH_IMPLEMENTATION == 'keycloak':
     from .impl_keycloak.get_user import get_user
     from .impl_keycloak.session_manager import session_manager
@@ -15,6 +15,10 @@ For now it's just a simple username/password tuple, may want to change this late
 
 
 SESSION_COOKIE_NAME = 'session'
+"""The cookie of rudimentary auth's login manager"""
+
+SESSION_ID_COOKIE_NAME = 'registry_session'
+"""The cookie holding the ID of the server-side session, see ServerSessionMiddleware. Keycloak auth keeps its login in that session."""
 
 LOGIN_URL = '/login'
 
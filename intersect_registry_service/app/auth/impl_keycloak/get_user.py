@@ -1,33 +1,83 @@
+import hashlib
+import time
+from collections import OrderedDict
+
 import jwt
-from jwt import PyJWKClient
 
 from ...core.environment import settings
 from ...core.log_config import logger
+from ...core.metrics import TOKEN_VERIFICATIONS
+from ...core.tracing import tracer
 from ..definitions import USER, IntersectNotAuthenticatedError
+from .jwks import JwksCache
 
-_jwks_client = PyJWKClient(settings.keycloak_jwks_url)
+jwks_cache = JwksCache(settings.keycloak_jwks_url, settings.KEYCLOAK_JWKS_CACHE_FILE)
 """
-This object handles caching, so it needs to be a global singleton
-
-See: https://blog.ploetzli.ch/2024/pyjwt-django-resource-server-sane/
+Loaded and periodically refreshed by the app lifespan, so it needs to be a global singleton
 """
 
+_VERIFIED_TOKENS_MAX_SIZE = 4096
+
+
+class _VerifiedTokens:
+    """Usernames of tokens whose signature we already verified, keyed by the token's digest, until the token expires.
+
+    Every page load and HTMX request carries the same token, so we only verify it once per worker.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size = max_size
+        self._entries: OrderedDict[bytes, tuple[str, float]] = OrderedDict()
+
+    def get(self, digest: bytes) -> str | None:
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        username, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[digest]
+            return None
+        self._entries.move_to_end(digest)
+        return username
+
+    def add(self, digest: bytes, username: str, expires_at: float) -> None:
+        self._entries[digest] = (username, expires_at)
+        self._entries.move_to_end(digest)
+        if len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+
+_verified_tokens = _VerifiedTokens(_VERIFIED_TOKENS_MAX_SIZE)
+
 
-def get_user(user_token: str) -> None | USER:
-    try:
-        signing_key = _jwks_client.get_signing_key_from_jwt(user_token).key
-        user = jwt.decode(
-            user_token,
-            signing_key,
-            algorithms=['RS256'],
-            verify=True,
-            options={'verify_signature': True, 'verify_aud': False},
-        )
-        username = user.get('preferred_username', None)
-        if not username:
-            # all tokens should at least have email if email scope is requested
-            username = user['email']
-        return username, user_token  # noqa: TRY300
-    except Exception as e:
-        logger.error('%s', e)
-        raise IntersectNotAuthenticatedError from e
+async def get_user(user_token: str) -> None | USER:
+    with tracer.start_as_current_span('verify session token') as span:
+        digest = hashlib.sha256(user_token.encode()).digest()
+        cached_username = _verified_tokens.get(digest)
+        span.set_attribute('token.cached', bool(cached_username))
+        if cached_username:
+            TOKEN_VERIFICATIONS.labels('cached').inc()
+            return cached_username, user_token
+        try:
+            key_id = jwt.get_unverified_header(user_token).get('kid', '')
+            signing_key = (await jwks_cache.get_signing_key(key_id)).key
+            user = jwt.decode(
+                user_token,
+                signing_key,
+                algorithms=['RS256'],
+                verify=True,
+                options={'verify_signature': True, 'verify_aud': False},
+            )
+            username: str = user.get('preferred_username', None)
+            if not username:
+                # all tokens should at least have email if email scope is requested
+                username = user['email']
+            # jwt.decode has already rejected expired tokens, tokens without an expiry are verified every time
+            if 'exp' in user:
+                _verified_tokens.add(digest, username, user['exp'])
+            TOKEN_VERIFICATIONS.labels('verified').inc()
+            return username, user_token  # noqa: TRY300
+        except Exception as e:
+            TOKEN_VERIFICATIONS.labels('rejected').inc()
+            logger.error('%s', e)
+            raise IntersectNotAuthenticatedError from e
@@ -0,0 +1,93 @@
+"""Signing keys of the OIDC provider, kept current by a background task instead of being fetched while a request waits."""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any
+
+import httpx
+from anyio.to_thread import run_sync
+from jwt import PyJWK, PyJWKClientError, PyJWKSet
+
+from ...core.log_config import logger
+from ...core.metrics import JWKS_KEY_LOOKUPS
+from ...core.tracing import traced
+
+_MIN_REFETCH_INTERVAL = 30
+"""Seconds between on-demand fetches, so a flood of tokens with an unknown key ID cannot hammer the OIDC provider."""
+
+_FETCH_TIMEOUT = 10
+
+
+class JwksCache:
+    """The provider's JSON Web Key Set, indexed by key ID.
+
+    'refresh' is blocking and should run in a worker thread. Every successful fetch is also written to disk, and 'load' reads it back on startup.
+    """
+
+    def __init__(self, jwks_url: str, cache_file: Path) -> None:
+        self._jwks_url = jwks_url
+        self._cache_file = cache_file
+        self._keys: dict[str, PyJWK] = {}
+        self._last_fetch = 0.0
+
+    def load(self) -> None:
+        """Start with the keys saved by a previous process, then try to fetch the current ones."""
+        try:
+            self._keys = _index_keys(json.loads(self._cache_file.read_text()))
+            logger.info('Loaded %d cached signing keys from %s', len(self._keys), self._cache_file)
+        except FileNotFoundError:
+            pass
+        except Exception:  # noqa: BLE001
+            logger.exception('Ignoring unreadable signing key cache %s', self._cache_file)
+        try:
+            self.refresh()
+        except Exception:  # noqa: BLE001
+            if self._keys:
+                logger.exception('Could not fetch signing keys, using the cached ones for now')
+            else:
+                logger.exception(
+                    'Could not fetch signing keys, will retry once a session needs them'
+                )
+
+    @traced('jwks refresh')
+    def refresh(self) -> None:
+        self._last_fetch = time.monotonic()
+        resp = httpx.get(self._jwks_url, timeout=_FETCH_TIMEOUT)
+        resp.raise_for_status()
+        jwks = resp.json()
+        # only replace the keys we have once the new ones parsed successfully
+        self._keys = _index_keys(jwks)
+        self._save(jwks)
+
+    async def get_signing_key(self, key_id: str) -> PyJWK:
+        key = self._keys.get(key_id)
+        JWKS_KEY_LOOKUPS.labels('miss' if key is None else 'hit').inc()
+        if key is None and time.monotonic() - self._last_fetch >= _MIN_REFETCH_INTERVAL:
+            # the provider may have rotated its keys since the last refresh
+            await run_sync(self.refresh)
+            key = self._keys.get(key_id)
+        if key is None:
+            msg = f'Unable to find a signing key that matches: "{key_id}"'
+            raise PyJWKClientError(msg)
+        return key
+
+    def check_health(self) -> None:
+        """Sessions can be verified as long as we have signing keys. Does not contact the provider, the refresh task does that."""
+        if not self._keys:
+            msg = 'No signing keys, the OIDC provider has not been reachable'
+            raise Exception(msg)  # noqa: TRY002
+
+    def _save(self, jwks: dict[str, Any]) -> None:
+        # write to a temporary file first, so other workers never read a partially written file
+        tmp_file = self._cache_file.with_name(f'{self._cache_file.name}.{os.getpid()}')
+        try:
+            tmp_file.write_text(json.dumps(jwks))
+            tmp_file.replace(self._cache_file)
+        except OSError:
+            logger.exception('Could not save signing keys to %s', self._cache_file)
+
+
+def _index_keys(jwks: dict[str, Any]) -> dict[str, PyJWK]:
+    return {key.key_id: key for key in PyJWKSet.from_dict(jwks).keys if key.key_id}
@@ -9,7 +9,12 @@ from fastapi import Request
 
 from ...core.environment import settings
 from ...core.log_config import logger
-from ..definitions import SESSION_COOKIE_NAME, USER, IntersectNotAuthenticatedError, SessionManager
+from ..definitions import (
+    SESSION_ID_COOKIE_NAME,
+    USER,
+    IntersectNotAuthenticatedError,
+    SessionManager,
+)
 
 
 class CookieSessionManager:
@@ -82,7 +87,7 @@ class CookieSessionManager:
         return decorator
 
 
-session_manager: SessionManager = CookieSessionManager(cookie_name=SESSION_COOKIE_NAME)  # type: ignore[assignment]
+session_manager: SessionManager = CookieSessionManager(cookie_name=SESSION_ID_COOKIE_NAME)  # type: ignore[assignment]
 """This login manager currently uses session cookies, but can potentially use JWT.
 
 The current idea is to only use it as the authentication manager for UI endpoints, and use API keys for automated endpoints.
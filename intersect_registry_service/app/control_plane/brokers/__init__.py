@@ -1,3 +1,4 @@
+from collections.abc import Sequence
 from typing import Protocol
 
 from ...core.environment import Settings
@@ -18,8 +19,30 @@ class AbstractBrokerHandler(Protocol):
 
     def initialize_service_config(self, service_name: str) -> tuple[str, str]: ...
 
+    def initialize_service_configs(self, service_names: Sequence[str]) -> list[tuple[str, str]]:
+        """Create the broker users of many Services at once, i.e. for a bulk import.
+
+        Returns the generated username and password of each Service, in the same order.
+        """
+        ...
+
     def remove_service_config(self, service_name: str) -> None: ...
 
+    def remove_service_configs(self, service_names: Sequence[str]) -> None:
+        """Remove the broker users of many Services at once."""
+        ...
+
+    def remove_stale_client_queues(self, max_idle_seconds: int) -> int:
+        """Remove Client queues which have no consumers and have been idle for longer than 'max_idle_seconds'.
+
+        Returns the number of queues removed.
+        """
+        ...
+
+    def check_health(self) -> None:
+        """Raise if the broker's management API is unreachable or reports a problem. Must give up within HEALTHCHECK_TIMEOUT."""
+        ...
+
 
 def get_broker_handler(settings: Settings) -> AbstractBrokerHandler:
     match settings.BROKER_APPLICATION:
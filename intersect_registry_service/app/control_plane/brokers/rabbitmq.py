@@ -1,10 +1,17 @@
 import base64
+import datetime
+import hashlib
+import json
+import secrets
+import urllib.parse
+from collections.abc import Sequence
+from typing import Any
 
-import urllib3
-
-from ...core.definitions import INTERSECT_MESSAGE_EXCHANGE
+from ...core.definitions import INTERSECT_CLIENT_MESSAGE_TYPES, INTERSECT_MESSAGE_EXCHANGE
 from ...core.environment import Settings
 from ...core.log_config import logger
+from ...core.metrics import timed_broker_call
+from ...core.tracing import make_pool_manager
 from ...utils.broker_credentials import get_broker_username, make_broker_password
 from ...utils.client_name_generator import CLIENT_PREFIX
 from . import AbstractBrokerHandler
@@ -12,6 +19,11 @@ from . import AbstractBrokerHandler
 RABBITMQ_VHOST = '%2F'
 """We use the same VHOST throughout RabbitMQ"""
 
+_QUEUE_LIST_PAGE_SIZE = 500
+
+CLIENT_QUEUE_POLICY = 'intersect-client-queues'
+"""Name of the policy which makes Client queues expire"""
+
 
 class RabbitMQHandler(AbstractBrokerHandler):
     """
@@ -41,16 +53,20 @@ class RabbitMQHandler(AbstractBrokerHandler):
         self.base_headers = {
             'Authorization': f'Basic {basic_auth}',
         }
-        self.http_client = urllib3.PoolManager(
+        self.http_client = make_pool_manager(
             headers=self.base_headers,
         )
+        self._health_timeout = settings.HEALTHCHECK_TIMEOUT
+        self._client_queue_expires_ms = settings.BROKER_CLIENT_QUEUE_EXPIRES * 1000
 
+    @timed_broker_call('management')
     def initialize_broker(self, client_username: str, client_password: str) -> None:
         """TODO - this should happen entirely on the BROKER
 
         Attempts to:
           - create the Client user
           - set permissions on the Client user
+          - make Client queues expire once they go unused, through a policy
 
         This needs to be called AFTER the INTERSECT exchange is created.
         """
@@ -88,10 +104,36 @@ class RabbitMQHandler(AbstractBrokerHandler):
                 )
                 logger.error('%s %s %s %s', msg, resp.status, resp.headers, resp.data)
                 raise Exception(msg)  # noqa: TRY002
+
+            self._set_client_queue_policy()
         else:
             # TODO figure out how things are generated on the MQTT side
             raise NotImplementedError
 
+    def _set_client_queue_policy(self) -> None:
+        """Client queues must expire, but the SDK redeclares them without any arguments, and RabbitMQ refuses to redeclare a queue with different arguments. So instead of declaring them with 'x-expires', we set the expiry through a policy, which also applies to queues which already exist.
+
+        Only one policy applies to a queue, the one with the highest priority. Keep this in mind when adding policies matching Client queues to the broker.
+        """
+        message_types = '|'.join(INTERSECT_CLIENT_MESSAGE_TYPES)
+        body = {
+            'pattern': f'^{CLIENT_PREFIX}.*_({message_types})$',
+            'definition': {'expires': self._client_queue_expires_ms},
+            'apply-to': 'queues',
+            'priority': 0,
+        }
+        resp = self.http_client.request(
+            'PUT',
+            f'{self._base_url}api/policies/{RABBITMQ_VHOST}/{CLIENT_QUEUE_POLICY}',
+            json.dumps(body),
+            headers={**self.base_headers, 'Content-Type': 'application/json'},
+        )
+        if resp.status >= 400:
+            msg = 'Could not set the expiry policy of client queues'
+            logger.error('%s %s %s %s', msg, resp.status, resp.headers, resp.data)
+            raise Exception(msg)  # noqa: TRY002
+
+    @timed_broker_call('management')
     def initialize_service_config(self, service_name: str) -> tuple[str, str]:
         """
         Assume that we will only call this when:
@@ -118,17 +160,10 @@ class RabbitMQHandler(AbstractBrokerHandler):
             raise Exception(msg)  # noqa: TRY002
 
         if self.is_amqp:
-            # SERVICE PERMISSIONS:
-            # - limited to working with the INTERSECT message exchange
-            # - not allowed to configure anything
-            # - may write (publish) to any request/response channels (TODO may want to restrict this to specific endpoints through OAuth scopes determined by Service user later)
-            # - may read (subscribe) from any event channel (TODO may want to restrict this to specific events through OAuth scopes determined by Service user later)
-            # - may read/write to any of your own channels
-            body = rf'{{"exchange":"{INTERSECT_MESSAGE_EXCHANGE}","configure":"^$","write":"^({self.system_name}\\.{service_name}\\..*|.*\\.request|.*\\.response)$","read":"^({self.system_name}\\.{service_name}\\..*|.*\\.events)$"}}'
             resp = self.http_client.request(
                 'PUT',
                 f'{self._base_url}api/topic-permissions/{RABBITMQ_VHOST}/{username}',
-                body,
+                json.dumps(self._service_topic_permissions(service_name)),
                 headers={**self.base_headers, 'Content-Type': 'application/json'},
             )
             logger.debug('%s %s %s', resp.status, resp.headers, resp.data)
@@ -142,6 +177,67 @@ class RabbitMQHandler(AbstractBrokerHandler):
 
         return username, password
 
+    @timed_broker_call('management')
+    def initialize_service_configs(self, service_names: Sequence[str]) -> list[tuple[str, str]]:
+        """
+        Same as initialize_service_config, but creates every user and its permissions in a single request, by importing them as definitions.
+
+        Definitions only accept password hashes, so we hash the generated passwords the same way RabbitMQ does.
+        """
+        if not self.is_amqp:
+            # TODO figure out how things are generated on the MQTT side
+            raise NotImplementedError
+
+        credentials = [
+            (get_broker_username(service_name), make_broker_password())
+            for service_name in service_names
+        ]
+        definitions = {
+            'users': [
+                {
+                    'name': username,
+                    'password_hash': _rabbitmq_password_hash(password),
+                    'hashing_algorithm': 'rabbit_password_hashing_sha256',
+                    'tags': [],
+                }
+                for username, password in credentials
+            ],
+            'topic_permissions': [
+                {
+                    'user': username,
+                    'vhost': '/',
+                    **self._service_topic_permissions(service_name),
+                }
+                for service_name, (username, _) in zip(service_names, credentials, strict=True)
+            ],
+        }
+        resp = self.http_client.request(
+            'POST',
+            f'{self._base_url}api/definitions',
+            json.dumps(definitions),
+            headers={**self.base_headers, 'Content-Type': 'application/json'},
+        )
+        if resp.status >= 400:
+            msg = f'Could not initialize the broker users for {len(service_names)} services'
+            logger.error('%s %s %s %s', msg, resp.status, resp.headers, resp.data)
+            raise Exception(msg)  # noqa: TRY002
+        return credentials
+
+    def _service_topic_permissions(self, service_name: str) -> dict[str, str]:
+        # SERVICE PERMISSIONS:
+        # - limited to working with the INTERSECT message exchange
+        # - not allowed to configure anything
+        # - may write (publish) to any request/response channels (TODO may want to restrict this to specific endpoints through OAuth scopes determined by Service user later)
+        # - may read (subscribe) from any event channel (TODO may want to restrict this to specific events through OAuth scopes determined by Service user later)
+        # - may read/write to any of your own channels
+        return {
+            'exchange': INTERSECT_MESSAGE_EXCHANGE,
+            'configure': '^$',
+            'write': rf'^({self.system_name}\.{service_name}\..*|.*\.request|.*\.response)$',
+            'read': rf'^({self.system_name}\.{service_name}\..*|.*\.events)$',
+        }
+
+    @timed_broker_call('management')
     def remove_service_config(self, service_name: str) -> None:
         """This just removes the username, we need to delete the service queue elsewhere (should be faster to do this via AMQP)"""
         username = get_broker_username(service_name)
@@ -152,3 +248,107 @@ class RabbitMQHandler(AbstractBrokerHandler):
         if resp.status >= 400:
             msg = f'Could not delete the broker user for service {service_name}'
             raise Exception(msg)  # noqa: TRY002
+
+    @timed_broker_call('management')
+    def remove_service_configs(self, service_names: Sequence[str]) -> None:
+        """Same as remove_service_config, but deletes every user in a single request."""
+        resp = self.http_client.request(
+            'POST',
+            f'{self._base_url}api/users/bulk-delete',
+            json.dumps({'users': [get_broker_username(name) for name in service_names]}),
+            headers={**self.base_headers, 'Content-Type': 'application/json'},
+        )
+        if resp.status >= 400:
+            msg = f'Could not delete the broker users of {len(service_names)} services'
+            logger.error('%s %s %s %s', msg, resp.status, resp.headers, resp.data)
+            raise Exception(msg)  # noqa: TRY002
+
+    @timed_broker_call('management')
+    def remove_stale_client_queues(self, max_idle_seconds: int) -> int:
+        """Client response queues expire on their own through the policy set in initialize_broker, but Clients which declare queues of other names may leave them behind when they crash.
+
+        We list every Client queue through the management API, then delete the ones with no consumers which have been idle for too long. 'if-unused' guards against deleting a queue which gained a consumer in the meantime.
+        """
+        cutoff = datetime.datetime.now(datetime.UTC) - datetime.timedelta(seconds=max_idle_seconds)
+        removed = 0
+        for queue in self._list_client_queues():
+            if queue.get('consumers', 0):
+                continue
+            idle_since = _parse_idle_since(queue.get('idle_since'))
+            if idle_since is None or idle_since > cutoff:
+                continue
+            queue_name = urllib.parse.quote(queue['name'], safe='')
+            resp = self.http_client.request(
+                'DELETE',
+                f'{self._base_url}api/queues/{RABBITMQ_VHOST}/{queue_name}?if-unused=true',
+            )
+            # 404 means the broker expired the queue before we got to it
+            if resp.status >= 400 and resp.status != 404:
+                logger.warning(
+                    'Could not remove stale client queue %s %s %s',
+                    queue['name'],
+                    resp.status,
+                    resp.data,
+                )
+                continue
+            removed += 1
+        return removed
+
+    def check_health(self) -> None:
+        """The alarms check fails while the broker is blocking publishers, i.e. because it is low on memory or disk space."""
+        resp = self.http_client.request(
+            'GET',
+            f'{self._base_url}api/health/checks/alarms',
+            timeout=self._health_timeout,
+            retries=False,
+        )
+        if resp.status >= 400:
+            msg = f'Broker health check failed with status {resp.status}'
+            raise Exception(msg)  # noqa: TRY002
+
+    def _list_client_queues(self) -> list[dict[str, Any]]:
+        query = urllib.parse.urlencode(
+            {
+                'name': f'^{CLIENT_PREFIX}',
+                'use_regex': 'true',
+                'columns': 'name,consumers,idle_since',
+                'page_size': _QUEUE_LIST_PAGE_SIZE,
+            }
+        )
+        queues: list[dict[str, Any]] = []
+        page = 1
+        while True:
+            resp = self.http_client.request(
+                'GET', f'{self._base_url}api/queues/{RABBITMQ_VHOST}?{query}&page={page}'
+            )
+            if resp.status >= 400:
+                msg = 'Could not list client queues'
+                logger.error('%s %s %s %s', msg, resp.status, resp.headers, resp.data)
+                raise Exception(msg)  # noqa: TRY002
+            body = json.loads(resp.data)
+            queues.extend(body['items'])
+            if page >= body['page_count']:
+                return queues
+            page += 1
+
+
+def _parse_idle_since(value: str | None) -> datetime.datetime | None:
+    """RabbitMQ reports 'idle_since' as either '2024-01-31T08:00:00.000+00:00' or '2024-01-31 8:00:00' (UTC), depending on the version."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            parsed = datetime.datetime.strptime(value, '%Y-%m-%d %H:%M:%S')  # noqa: DTZ007
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.UTC)
+    return parsed
+
+
+def _rabbitmq_password_hash(password: str) -> str:
+    """See https://www.rabbitmq.com/docs/passwords#computing-password-hash"""
+    salt = secrets.token_bytes(4)
+    return base64.b64encode(salt + hashlib.sha256(salt + password.encode()).digest()).decode()
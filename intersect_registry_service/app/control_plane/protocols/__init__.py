@@ -1,3 +1,4 @@
+from collections.abc import Sequence
 from typing import Protocol
 
 from ...core.environment import Settings
@@ -10,8 +11,24 @@ class AbstractProtocolHandler(Protocol):
 
     def initialize_service_config(self, service_name: str) -> None: ...
 
+    def initialize_service_configs(self, service_names: Sequence[str]) -> None:
+        """Declare the resources of many Services at once, i.e. for a bulk import."""
+        ...
+
     def remove_service_config(self, service_name: str) -> None: ...
 
+    def remove_service_configs(self, service_names: Sequence[str]) -> None:
+        """Remove the resources of many Services at once."""
+        ...
+
+    def initialize_client_configs(self, client_names: Sequence[str]) -> None:
+        """Declare the temporary resources of one or more SDK Clients. These resources must expire on their own."""
+        ...
+
+    def check_health(self) -> None:
+        """Raise if the broker cannot be reached over the protocol. Must give up within HEALTHCHECK_TIMEOUT."""
+        ...
+
 
 def get_protocol_handler(settings: Settings) -> AbstractProtocolHandler:
     match settings.BROKER_PROTOCOL:
@@ -1,14 +1,19 @@
+import contextvars
+from collections.abc import Sequence
 from concurrent.futures import ThreadPoolExecutor
 from typing import TYPE_CHECKING
 
 import pika
 
 from ...core.definitions import (
+    INTERSECT_CLIENT_MESSAGE_TYPES,
     INTERSECT_MESSAGE_EXCHANGE,
     INTERSECT_SERVICE_SUBSCRIPTION_TYPES,
 )
 from ...core.environment import Settings
 from ...core.log_config import logger
+from ...core.metrics import timed_broker_call
+from ...core.tracing import traced
 from . import AbstractProtocolHandler
 
 if TYPE_CHECKING:
@@ -30,6 +35,7 @@ class Amqp091ProtocolHander(AbstractProtocolHandler):
     The way we handle queues:
       - Services will create their initial request/response queues
       - Each queue will be associated with a specific Service; a Service can potentially have many queues.
+      - Client queues are declared when a Client name is handed out. A broker policy makes them expire, so the broker cleans them up even if the Client crashes.
     """
 
     def __init__(self, settings: Settings) -> None:
@@ -49,17 +55,28 @@ class Amqp091ProtocolHander(AbstractProtocolHandler):
         else:
             ssl_options = None
 
-        self._connection_params = pika.ConnectionParameters(
-            host=settings.BROKER_HOST,
-            port=settings.BROKER_PORT,
-            virtual_host='/',
-            credentials=pika.PlainCredentials(
+        connection_kwargs = {
+            'host': settings.BROKER_HOST,
+            'port': settings.BROKER_PORT,
+            'virtual_host': '/',
+            'credentials': pika.PlainCredentials(
                 settings.BROKER_ROOT_USERNAME, settings.BROKER_ROOT_PASSWORD
             ),
-            connection_attempts=3,
-            ssl_options=ssl_options,
+            'ssl_options': ssl_options,
+        }
+        self._connection_params = pika.ConnectionParameters(
+            connection_attempts=3, **connection_kwargs
+        )
+        # a health check must not retry, and must give up before the prober does
+        self._health_connection_params = pika.ConnectionParameters(
+            connection_attempts=1,
+            socket_timeout=settings.HEALTHCHECK_TIMEOUT,
+            stack_timeout=settings.HEALTHCHECK_TIMEOUT,
+            **connection_kwargs,
         )
 
+    @timed_broker_call('amqp')
+    @traced('amqp initialize_broker')
     def initialize_broker(self) -> None:
         """
         On initialization, we will need to:
@@ -77,6 +94,8 @@ class Amqp091ProtocolHander(AbstractProtocolHandler):
             )
             logger.info('amqp exchange declare result: %s', frame.method)
 
+    @timed_broker_call('amqp')
+    @traced('amqp initialize_service_config')
     def initialize_service_config(self, service_name: str) -> None:
         """
         On initialization, we will need to create a new queue and bind it to our exchange.
@@ -84,12 +103,15 @@ class Amqp091ProtocolHander(AbstractProtocolHandler):
         routing_key = f'{self.system_name}.{service_name}'
         with ThreadPoolExecutor(max_workers=2) as executor:
             for message_type in INTERSECT_SERVICE_SUBSCRIPTION_TYPES:
+                # run in a copy of our context, so the thread's spans belong to the current trace
                 executor.submit(
+                    contextvars.copy_context().run,
                     self._create_service_queues,
                     f'{routing_key}.{message_type}',
                     f'{service_name}_{message_type}',
                 )
 
+    @traced('amqp _create_service_queues')
     def _create_service_queues(self, routing_key: str, queue_name: str) -> None:
         with pika.BlockingConnection(self._connection_params) as connection:
             channel = connection.channel()
@@ -106,9 +128,77 @@ class Amqp091ProtocolHander(AbstractProtocolHandler):
             )
             logger.info('bind_frame %s', bind_frame)
 
+    @timed_broker_call('amqp')
+    @traced('amqp initialize_service_configs')
+    def initialize_service_configs(self, service_names: Sequence[str]) -> None:
+        """
+        Same as initialize_service_config, but for a whole batch of Services over a single connection.
+        """
+        with pika.BlockingConnection(self._connection_params) as connection:
+            channel = connection.channel()
+            for service_name in service_names:
+                routing_key = f'{self.system_name}.{service_name}'
+                for message_type in INTERSECT_SERVICE_SUBSCRIPTION_TYPES:
+                    declare_frame: Frame = channel.queue_declare(
+                        f'{service_name}_{message_type}',
+                        durable=True,
+                    )
+                    logger.debug('declare_frame %s', declare_frame)
+                    bind_frame: Frame = channel.queue_bind(
+                        queue=declare_frame.method.queue,
+                        exchange=INTERSECT_MESSAGE_EXCHANGE,
+                        routing_key=f'{routing_key}.{message_type}',
+                    )
+                    logger.debug('bind_frame %s', bind_frame)
+
+    @timed_broker_call('amqp')
+    @traced('amqp remove_service_config')
     def remove_service_config(self, service_name: str) -> None:
         with pika.BlockingConnection(self._connection_params) as connection:
             channel = connection.channel()
             for message_type in INTERSECT_SERVICE_SUBSCRIPTION_TYPES:
                 remove_frame: Frame = channel.queue_delete(f'{service_name}_{message_type}')
                 logger.info('remove_frame %s', remove_frame)
+
+    @timed_broker_call('amqp')
+    @traced('amqp remove_service_configs')
+    def remove_service_configs(self, service_names: Sequence[str]) -> None:
+        """
+        Same as remove_service_config, but for a whole batch of Services over a single connection.
+        """
+        with pika.BlockingConnection(self._connection_params) as connection:
+            channel = connection.channel()
+            for service_name in service_names:
+                for message_type in INTERSECT_SERVICE_SUBSCRIPTION_TYPES:
+                    remove_frame: Frame = channel.queue_delete(f'{service_name}_{message_type}')
+                    logger.debug('remove_frame %s', remove_frame)
+
+    @timed_broker_call('amqp')
+    @traced('amqp initialize_client_configs')
+    def initialize_client_configs(self, client_names: Sequence[str]) -> None:
+        """
+        Pre-declare the queues Clients will consume from, and bind them to our exchange. A whole batch of Clients shares one connection.
+
+        The SDK redeclares these queues when the Client starts, with 'durable=True' and no other flags or arguments, the same as Service queues. RabbitMQ refuses to redeclare a queue with different flags or arguments (406 PRECONDITION_FAILED), so we must declare them exactly the same way. Their expiry is set by the broker's policy instead, see RabbitMQHandler.initialize_broker.
+        """
+        with pika.BlockingConnection(self._connection_params) as connection:
+            channel = connection.channel()
+            for client_name in client_names:
+                routing_key = f'{self.system_name}.{client_name}'
+                for message_type in INTERSECT_CLIENT_MESSAGE_TYPES:
+                    declare_frame: Frame = channel.queue_declare(
+                        f'{client_name}_{message_type}',
+                        durable=True,
+                    )
+                    logger.debug('declare_frame %s', declare_frame)
+                    bind_frame: Frame = channel.queue_bind(
+                        queue=declare_frame.method.queue,
+                        exchange=INTERSECT_MESSAGE_EXCHANGE,
+                        routing_key=f'{routing_key}.{message_type}',
+                    )
+                    logger.debug('bind_frame %s', bind_frame)
+
+    def check_health(self) -> None:
+        """Open a connection and a channel, which proves that the broker accepts our credentials."""
+        with pika.BlockingConnection(self._health_connection_params) as connection:
+            connection.channel()
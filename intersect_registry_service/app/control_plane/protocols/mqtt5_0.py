@@ -1,3 +1,5 @@
+from collections.abc import Sequence
+
 from ...core.environment import Settings
 from . import AbstractProtocolHandler
 
@@ -12,5 +14,17 @@ class Mqtt5ProtocolHandler(AbstractProtocolHandler):
     def initialize_service_config(self, service_name: str) -> None:
         raise NotImplementedError
 
+    def initialize_service_configs(self, service_names: Sequence[str]) -> None:
+        raise NotImplementedError
+
     def remove_service_config(self, service_name: str) -> None:
         raise NotImplementedError
+
+    def remove_service_configs(self, service_names: Sequence[str]) -> None:
+        raise NotImplementedError
+
+    def initialize_client_configs(self, client_names: Sequence[str]) -> None:
+        raise NotImplementedError
+
+    def check_health(self) -> None:
+        raise NotImplementedError
@@ -0,0 +1,44 @@
+"""Helpers for housekeeping jobs which live as long as a uvicorn worker does.
+
+These jobs are started in the app lifespan, so every worker runs its own copy. Jobs should therefore be idempotent.
+"""
+
+import asyncio
+import time
+from collections.abc import Callable
+
+from anyio.to_thread import run_sync
+
+from .log_config import logger
+from .metrics import BACKGROUND_TASK_DURATION, BACKGROUND_TASK_FAILURES
+
+
+async def _run_periodically(name: str, interval: float, func: Callable[[], object]) -> None:
+    duration = BACKGROUND_TASK_DURATION.labels(name)
+    failures = BACKGROUND_TASK_FAILURES.labels(name)
+    while True:
+        await asyncio.sleep(interval)
+        start = time.perf_counter()
+        try:
+            await run_sync(func)
+        except Exception:  # noqa: BLE001
+            failures.inc()
+            logger.exception('Background task %s failed', name)
+        duration.observe(time.perf_counter() - start)
+
+
+def start_periodic_task(
+    name: str, interval: float, func: Callable[[], object]
+) -> asyncio.Task[None]:
+    """Call the blocking function 'func' in a worker thread every 'interval' seconds, until the task is cancelled.
+
+    Exceptions are logged and do not stop the schedule. Must be called while the event loop is running.
+    """
+    return asyncio.create_task(_run_periodically(name, interval, func), name=name)
+
+
+async def stop_periodic_tasks(tasks: list[asyncio.Task[None]]) -> None:
+    """Cancel all tasks and wait for them to finish."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
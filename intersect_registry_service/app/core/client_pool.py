@@ -0,0 +1,96 @@
+"""Warm pool of Client identities.
+
+Declaring a Client's broker resources requires a round trip to the broker, which we do not want to pay while a Client is waiting on its configuration.
+Instead, each worker keeps a pool of Client names whose resources are already declared, and tops it up in the background.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+from anyio.to_thread import run_sync
+
+from ..utils.client_name_generator import generate_client_name
+from .configuration_manager import ConfigurationManager
+from .environment import Settings
+from .log_config import logger
+
+
+class ClientIdentityPool:
+    """Pool of Client names, refilled in batches by a background task (see 'run').
+
+    Entries expire before their broker resources do, so a name handed out from the pool always has live queues behind it.
+    """
+
+    def __init__(self, config_manager: ConfigurationManager, settings: Settings) -> None:
+        self._config_manager = config_manager
+        self._low_water_mark = settings.CLIENT_POOL_LOW_WATER_MARK
+        self._batch_size = settings.CLIENT_POOL_REFILL_BATCH_SIZE
+        self._max_age = settings.CLIENT_POOL_ENTRY_MAX_AGE
+        self._identities: deque[tuple[str, float]] = deque()
+        """(client name, monotonic time the resources were declared), oldest first"""
+        self._refill_needed = asyncio.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self._low_water_mark > 0
+
+    def __len__(self) -> int:
+        return len(self._identities)
+
+    def pop(self) -> str | None:
+        """Return a provisioned Client name, or None if the pool has run dry."""
+        oldest_allowed = time.monotonic() - self._max_age
+        client_name = None
+        while self._identities:
+            candidate, declared_at = self._identities.popleft()
+            if declared_at >= oldest_allowed:
+                client_name = candidate
+                break
+        if len(self._identities) < self._low_water_mark:
+            self._refill_needed.set()
+        return client_name
+
+    async def acquire(self) -> str:
+        """Get a Client name for a request, falling back to declaring the resources ourselves if the pool is empty."""
+        client_name = self.pop()
+        if client_name is not None:
+            return client_name
+
+        client_name = generate_client_name()
+        try:
+            await run_sync(self._config_manager.add_clients, [client_name])
+        except Exception:  # noqa: BLE001
+            # the Client can still declare its own queue, the periodic sweep will clean it up
+            logger.exception('Could not declare broker resources for client %s', client_name)
+        return client_name
+
+    async def run(self) -> None:
+        """Keep the pool above its low-water mark until cancelled. Start this in the app lifespan."""
+        while True:
+            self._discard_expired()
+            if len(self._identities) >= self._low_water_mark:
+                self._refill_needed.clear()
+                try:
+                    # entries may expire even if nobody is popping them
+                    await asyncio.wait_for(self._refill_needed.wait(), timeout=self._max_age / 2)
+                except TimeoutError:
+                    pass
+                continue
+
+            client_names = [generate_client_name() for _ in range(self._batch_size)]
+            # the broker's expiry clock starts when the queue is declared
+            declared_at = time.monotonic()
+            try:
+                await run_sync(self._config_manager.add_clients, client_names)
+            except Exception:  # noqa: BLE001
+                logger.exception('Could not refill the client identity pool')
+                # don't hammer a broker which is already struggling
+                await asyncio.sleep(self._max_age / 2)
+                continue
+            self._identities.extend((client_name, declared_at) for client_name in client_names)
+
+    def _discard_expired(self) -> None:
+        oldest_allowed = time.monotonic() - self._max_age
+        while self._identities and self._identities[0][1] < oldest_allowed:
+            self._identities.popleft()
@@ -1,6 +1,9 @@
+from collections.abc import Sequence
+
 from ..control_plane.brokers import get_broker_handler
 from ..control_plane.protocols import get_protocol_handler
 from ..core.environment import Settings
+from ..core.log_config import logger
 
 
 class ConfigurationManager:
@@ -9,6 +12,7 @@ class ConfigurationManager:
     def __init__(self, settings: Settings) -> None:
         self.protocol_handler = get_protocol_handler(settings)
         self.broker_handler = get_broker_handler(settings)
+        self._client_queue_expires = settings.BROKER_CLIENT_QUEUE_EXPIRES
 
     def initialize_broker(self, settings: Settings) -> None:
         self.protocol_handler.initialize_broker()
@@ -20,3 +24,38 @@ class ConfigurationManager:
         """Returns: generated username and password for the broker, to be used with that service"""
         self.protocol_handler.initialize_service_config(service_name)
         return self.broker_handler.initialize_service_config(service_name)
+
+    def add_services(self, service_names: Sequence[str]) -> list[tuple[str, str]]:
+        """Returns: generated username and password for the broker of each service, in the same order"""
+        self.protocol_handler.initialize_service_configs(service_names)
+        return self.broker_handler.initialize_service_configs(service_names)
+
+    def remove_services(self, service_names: Sequence[str]) -> None:
+        """Remove the broker users of Services, then their queues. Both are attempted even if the other fails, and raises if either did.
+
+        The users go first, so that a failure never leaves a removed Service able to connect. Removing resources which do not exist is not
+        an error, so a failed call can be repeated.
+        """
+        failed = False
+        for remove in (
+            self.broker_handler.remove_service_configs,
+            self.protocol_handler.remove_service_configs,
+        ):
+            try:
+                remove(service_names)
+            except Exception:  # noqa: BLE001
+                logger.exception('Could not remove the broker resources of services')
+                failed = True
+        if failed:
+            msg = f'Could not remove the broker resources of {len(service_names)} services'
+            raise Exception(msg)  # noqa: TRY002
+
+    def add_clients(self, client_names: Sequence[str]) -> None:
+        """Declare the short-lived broker resources of Clients. These clean themselves up on the broker."""
+        self.protocol_handler.initialize_client_configs(client_names)
+
+    def remove_stale_clients(self) -> None:
+        """Reap Client resources which were not declared by us, and so will not expire on their own."""
+        removed = self.broker_handler.remove_stale_client_queues(self._client_queue_expires)
+        if removed:
+            logger.info('Removed %d stale client queues', removed)
@@ -0,0 +1,219 @@
+"""Database engine setup.
+
+Every engine uses an instrumented connection pool, so that we can tell how close a worker is to exhausting its connections.
+
+Writes always go to the primary ('app.state.db'). Read-only handlers may use 'get_read_engine', which picks a read replica if any are configured and caught up.
+"""
+
+import itertools
+import threading
+import time
+from typing import Any, cast
+
+from fastapi import Request, Response
+from sqlalchemy import Engine, PoolProxiedConnection, create_engine, event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from .environment import Settings
+from .log_config import logger
+from .request_phases import time_engine_statements
+from .tracing import instrument_engine
+
+READ_PRIMARY_COOKIE = 'registry_read_primary'
+"""Presence of this cookie sends the user's reads to the primary, see 'pin_reads_to_primary'."""
+
+_REPLICA_LAG_QUERY = text(
+    # a replica which has replayed everything it received is caught up, even if the primary has been idle for a while - but only
+    # while it is streaming. Otherwise it may not be receiving anything at all, and only the time of the last replay tells its lag
+    'SELECT CASE'
+    ' WHEN NOT pg_is_in_recovery() THEN 0'
+    ' WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()'
+    " AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0"
+    ' ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())'
+    ' END'
+)
+
+
+class PoolStats:
+    """Counters for a single connection pool, since the pool was created. These are per-process."""
+
+    __slots__ = (
+        '_lock',
+        'checkout_timeouts',
+        'checkout_wait_max',
+        'checkout_wait_total',
+        'checkouts',
+        'connections_created',
+        'invalidations',
+    )
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_wait_total = 0.0
+        """seconds spent obtaining connections, including connecting and pre-pinging"""
+        self.checkout_wait_max = 0.0
+        self.checkout_timeouts = 0
+        self.connections_created = 0
+        self.invalidations = 0
+
+    def record_checkout(self, wait: float, timed_out: bool) -> None:
+        with self._lock:
+            if timed_out:
+                self.checkout_timeouts += 1
+            else:
+                self.checkouts += 1
+            self.checkout_wait_total += wait
+            self.checkout_wait_max = max(self.checkout_wait_max, wait)
+
+    def record_connect(self) -> None:
+        with self._lock:
+            self.connections_created += 1
+
+    def record_invalidation(self) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool which times how long callers wait to get a connection."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def connect(self) -> PoolProxiedConnection:
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self.stats.record_checkout(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record_checkout(time.perf_counter() - start, timed_out=False)
+        return connection
+
+    def recreate(self) -> QueuePool:
+        pool = super().recreate()
+        # keep counting across Engine.dispose()
+        pool.stats = self.stats  # type: ignore[attr-defined]
+        return pool
+
+
+def create_db_engine(url: str, settings: Settings) -> Engine:
+    """Create an engine with the pool configuration from the settings. Each uvicorn worker creates its own engines."""
+    connect_args: dict[str, Any] = {
+        'connect_timeout': settings.POSTGRESQL_CONNECT_TIMEOUT,
+        # psycopg prepares a statement after this many executions on a connection, None never prepares
+        'prepare_threshold': 1 if settings.POSTGRESQL_PREPARED_STATEMENTS else None,
+    }
+    if settings.POSTGRESQL_STATEMENT_TIMEOUT:
+        connect_args['options'] = f'-c statement_timeout={settings.POSTGRESQL_STATEMENT_TIMEOUT}'
+    engine = create_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.POSTGRESQL_POOL_SIZE,
+        max_overflow=settings.POSTGRESQL_POOL_MAX_OVERFLOW,
+        pool_timeout=settings.POSTGRESQL_POOL_TIMEOUT,
+        pool_recycle=settings.POSTGRESQL_POOL_RECYCLE,
+        pool_pre_ping=settings.POSTGRESQL_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+    stats = cast('InstrumentedQueuePool', engine.pool).stats
+    event.listen(engine, 'connect', lambda *_: stats.record_connect())  # noqa: ARG005
+    event.listen(engine, 'invalidate', lambda *_: stats.record_invalidation())  # noqa: ARG005
+    event.listen(engine, 'soft_invalidate', lambda *_: stats.record_invalidation())  # noqa: ARG005
+    time_engine_statements(engine)
+    instrument_engine(engine)
+    return engine
+
+
+def get_pool_status(engine: Engine) -> dict[str, int | float]:
+    """Point-in-time view of an engine's pool, for this process only."""
+    pool = cast('InstrumentedQueuePool', engine.pool)
+    stats = pool.stats
+    return {
+        'pool_size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        'overflow': max(pool.overflow(), 0),
+        'checkouts': stats.checkouts,
+        'checkout_wait_seconds_total': stats.checkout_wait_total,
+        'checkout_wait_seconds_max': stats.checkout_wait_max,
+        'checkout_timeouts': stats.checkout_timeouts,
+        'connections_created': stats.connections_created,
+        'invalidations': stats.invalidations,
+    }
+
+
+class ReadReplicas:
+    """The configured read replicas, and which of them are currently fit to serve reads."""
+
+    def __init__(self, settings: Settings) -> None:
+        self.engines = [create_db_engine(url, settings) for url in settings.POSTGRESQL_REPLICA_URLS]
+        self._max_lag = settings.POSTGRESQL_REPLICA_MAX_LAG
+        # replicas are only used once they have been measured, see 'check_lag'
+        self._healthy: tuple[Engine, ...] = ()
+        self._round_robin = itertools.count()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    def pick(self) -> Engine | None:
+        """Return the next healthy replica, or None if the primary should be used."""
+        healthy = self._healthy
+        if not healthy:
+            return None
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    def check_lag(self) -> None:
+        """Measure the replication lag of every replica. Blocking, call this periodically from a worker thread."""
+        healthy = []
+        for idx, engine in enumerate(self.engines):
+            try:
+                with engine.connect() as connection:
+                    lag = connection.execute(_REPLICA_LAG_QUERY).scalar()
+            except Exception:  # noqa: BLE001
+                logger.warning(
+                    'Read replica %d is unreachable, reading from the primary instead', idx
+                )
+                continue
+            if lag is None or lag > self._max_lag:
+                logger.warning(
+                    'Read replica %d is lagging behind (%s seconds), skipping it', idx, lag
+                )
+                continue
+            healthy.append(engine)
+        self._healthy = tuple(healthy)
+
+    def dispose(self) -> None:
+        for engine in self.engines:
+            engine.dispose()
+
+
+def get_read_engine(request: Request) -> Engine:
+    """Engine for a read-only handler.
+
+    Falls back to the primary if there are no healthy replicas, or if the user recently wrote something they expect to see.
+    """
+    if request.cookies.get(READ_PRIMARY_COOKIE):
+        return request.app.state.db  # type: ignore[no-any-return]
+    replica = request.app.state.db_replicas.pick()
+    return replica or request.app.state.db  # type: ignore[no-any-return]
+
+
+def pin_reads_to_primary(response: Response, settings: Settings) -> None:
+    """Call this on the response to a request which wrote to the database on the user's behalf.
+
+    For the next few seconds, the user's reads go to the primary, so a redirect back to a listing page is guaranteed to show what was just written.
+    The cookie is only a routing hint, tampering with it can only ever move reads onto the primary.
+    """
+    response.set_cookie(
+        READ_PRIMARY_COOKIE,
+        '1',
+        max_age=settings.POSTGRESQL_READ_YOUR_WRITES_WINDOW,
+        secure=True,
+        httponly=True,
+        samesite='lax',
+    )
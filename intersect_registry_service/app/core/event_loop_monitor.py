@@ -0,0 +1,110 @@
+"""Detection of code which blocks the event loop, i.e. synchronous database or broker calls made directly in 'async def' endpoints.
+
+Every worker runs a task which sleeps for EVENT_LOOP_SAMPLE_INTERVAL seconds at a time and measures how late it wakes up. This lag is
+exported as a histogram, and the percentiles of the recent samples are part of the admin stats.
+
+A watchdog thread notices when the task is EVENT_LOOP_BLOCKED_THRESHOLD seconds overdue, and logs what the event loop thread is doing
+at that moment: its stack, the current task, and the request being handled. Each block is logged once, however long it lasts.
+Code which holds the GIL while it blocks (i.e. some C extensions) keeps the watchdog from running, so its stack may be missed.
+"""
+
+import asyncio
+import statistics
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from types import FrameType
+from typing import Any
+
+from .log_config import logger
+from .metrics import EVENT_LOOP_BLOCKED, EVENT_LOOP_LAG
+
+_RECENT_SAMPLES = 1200
+"""Samples kept for the percentiles in the admin stats, 10 minutes at the default interval"""
+
+
+def _find_request_scope(frame: FrameType | None) -> dict[str, Any] | None:
+    """Returns: the ASGI scope of the request whose code is running in this stack, if any
+
+    While a coroutine runs, the frames of every coroutine awaiting it are on the stack too, and the middlewares and the router all
+    have the scope as a local variable.
+    """
+    while frame is not None:
+        scope = frame.f_locals.get('scope')
+        if isinstance(scope, dict) and scope.get('type') == 'http':
+            return scope
+        frame = frame.f_back
+    return None
+
+
+class EventLoopMonitor:
+    """Measures the event loop lag of this worker, and logs what blocks the loop. Run 'run' as a task on the loop to monitor."""
+
+    def __init__(self, interval: float, threshold: float) -> None:
+        self._interval = interval
+        self._threshold = threshold
+        self._recent_lags: deque[float] = deque(maxlen=_RECENT_SAMPLES)
+        self._due = 0.0
+        """monotonic time at which the sampling task should wake up next"""
+        self._reported_due = 0.0
+        self._stopped = threading.Event()
+
+    async def run(self) -> None:
+        """Sample the lag until cancelled. Start this in the app lifespan."""
+        loop = asyncio.get_running_loop()
+        watchdog = threading.Thread(
+            target=self._watch,
+            args=(threading.get_ident(), loop),
+            name='event-loop-watchdog',
+            daemon=True,
+        )
+        self._due = time.monotonic() + self._interval
+        watchdog.start()
+        try:
+            while True:
+                await asyncio.sleep(self._interval)
+                now = time.monotonic()
+                lag = max(now - self._due, 0.0)
+                EVENT_LOOP_LAG.observe(lag)
+                self._recent_lags.append(lag)
+                self._due = now + self._interval
+        finally:
+            self._stopped.set()
+
+    def lag_percentiles(self) -> dict[str, float]:
+        """Returns: percentiles of the recent lag samples in seconds, empty until there are two samples"""
+        lags = list(self._recent_lags)
+        if len(lags) < 2:
+            return {}
+        cuts = statistics.quantiles(lags, n=100, method='inclusive')
+        return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98], 'max': max(lags)}
+
+    def _watch(self, loop_thread_id: int, loop: asyncio.AbstractEventLoop) -> None:
+        # check often enough to catch the loop while it is still blocked
+        while not self._stopped.wait(self._threshold / 2):
+            due = self._due
+            blocked_for = time.monotonic() - due
+            if blocked_for >= self._threshold and due != self._reported_due:
+                self._reported_due = due
+                self._report_block(blocked_for, loop_thread_id, loop)
+
+    @staticmethod
+    def _report_block(
+        blocked_for: float, loop_thread_id: int, loop: asyncio.AbstractEventLoop
+    ) -> None:
+        frame = sys._current_frames().get(loop_thread_id)  # noqa: SLF001
+        scope = _find_request_scope(frame)
+        route = getattr(scope.get('route'), 'path', None) if scope is not None else None
+        task = asyncio.current_task(loop)
+        EVENT_LOOP_BLOCKED.labels(route or 'none').inc()
+        logger.warning(
+            'Event loop blocked for more than %.3fs',
+            blocked_for,
+            task=task.get_name() if task is not None else None,
+            route=route,
+            path=scope['path'] if scope is not None else None,
+            method=scope['method'] if scope is not None else None,
+            stack=''.join(traceback.format_stack(frame)) if frame is not None else None,
+        )
@@ -0,0 +1,105 @@
+"""Readiness of this worker, checked in the background so that probes never touch the dependencies themselves.
+
+Kubernetes probes every replica several times a second. Instead of connecting to Postgres and the broker for each probe, every worker checks its
+dependencies once per HEALTHCHECK_INTERVAL, and '/healthcheck' reports the last result.
+"""
+
+import datetime
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from pydantic import BaseModel
+from sqlalchemy import Engine, text
+
+from .log_config import logger
+from .metrics import DEPENDENCY_UP
+
+_MAX_AGE_INTERVALS = 3
+"""A report older than this many intervals means the checks are stuck, and the worker is not ready"""
+
+
+class DependencyHealth(BaseModel):
+    healthy: bool
+    latency: float
+    """Seconds the check took"""
+    error: str | None = None
+    """Type of the error if the check failed. The full error is only logged, since the healthcheck is public."""
+
+
+class HealthReport(BaseModel):
+    healthy: bool
+    checked_at: datetime.datetime | None
+    """When the dependencies were last checked, None before the first check"""
+    dependencies: dict[str, DependencyHealth]
+
+
+def check_database(engine: Engine) -> None:
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+
+
+def _run_check(check: Callable[[], object]) -> tuple[float, Exception | None]:
+    """Returns: how long the check took, and what it raised"""
+    start = time.perf_counter()
+    try:
+        check()
+    except Exception as e:  # noqa: BLE001
+        return time.perf_counter() - start, e
+    return time.perf_counter() - start, None
+
+
+class HealthProber:
+    """Runs every check concurrently, each with its own timeout. Call 'probe' periodically from a worker thread."""
+
+    def __init__(
+        self, checks: dict[str, Callable[[], object]], interval: float, timeout: float
+    ) -> None:
+        self._checks = checks
+        self._timeout = timeout
+        self._max_age = interval * _MAX_AGE_INTERVALS
+        self._executor = ThreadPoolExecutor(max_workers=len(checks), thread_name_prefix='health')
+        self._report = HealthReport(healthy=False, checked_at=None, dependencies={})
+        self._checked_at = 0.0
+
+    def probe(self) -> None:
+        futures = {
+            name: self._executor.submit(_run_check, check) for name, check in self._checks.items()
+        }
+        deadline = time.monotonic() + self._timeout
+        dependencies = {}
+        for name, future in futures.items():
+            try:
+                latency, error = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except FutureTimeoutError:
+                latency, error = self._timeout, TimeoutError(f'No answer in {self._timeout}s')
+            dependencies[name] = DependencyHealth(
+                healthy=error is None,
+                latency=latency,
+                error=None if error is None else type(error).__name__,
+            )
+            DEPENDENCY_UP.labels(name).set(error is None)
+            # only log changes, not every failed check
+            previous = self._report.dependencies.get(name)
+            if error is not None and (previous is None or previous.healthy):
+                logger.warning('Health check of %s failed: %r', name, error)
+            elif error is None and previous is not None and not previous.healthy:
+                logger.info('Health check of %s succeeded again', name)
+
+        self._report = HealthReport(
+            healthy=all(health.healthy for health in dependencies.values()),
+            checked_at=datetime.datetime.now(datetime.UTC),
+            dependencies=dependencies,
+        )
+        self._checked_at = time.monotonic()
+
+    def report(self) -> HealthReport:
+        """The last result, which is unhealthy if the checks have stopped running. Does not do any I/O."""
+        report = self._report
+        if report.healthy and time.monotonic() - self._checked_at > self._max_age:
+            return report.model_copy(update={'healthy': False})
+        return report
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
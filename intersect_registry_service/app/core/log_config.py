@@ -2,12 +2,16 @@
 
 import logging
 import logging.config
+import logging.handlers
 import os
 import platform
-from typing import Any
+import queue
+import sys
+from typing import Any, cast
 
+import orjson
 import structlog
-from structlog.types import EventDict
+from structlog.types import EventDict, Processor
 
 from .environment import settings
 
@@ -31,16 +35,21 @@ _BUNYAN_LOG_LEVELS = {
 """Log levels are based off of the Bunyan format specification's log levels, not Python's."""
 
 
-def _use_bunyan_structure(_: Any, _name: str, event_dict: EventDict) -> EventDict:  # noqa: ARG001
+def _make_bunyan_processor() -> Processor:
     """
     Match Bunyan format: https://github.com/trentm/node-bunyan?tab=readme-ov-file#core-fields
+
+    The fields which are the same for every event of the process are only looked up once, when logging is set up.
     """
-    event_dict['msg'] = event_dict.pop('event')
-    event_dict['v'] = 0
-    event_dict['pid'] = os.getpid()
-    event_dict['hostname'] = platform.node()
-    event_dict['level'] = _BUNYAN_LOG_LEVELS[event_dict['level']]
-    return event_dict
+    static_fields = {'v': 0, 'pid': os.getpid(), 'hostname': platform.node()}
+
+    def use_bunyan_structure(_: Any, _name: str, event_dict: EventDict) -> EventDict:  # noqa: ARG001
+        event_dict['msg'] = event_dict.pop('event')
+        event_dict.update(static_fields)
+        event_dict['level'] = _BUNYAN_LOG_LEVELS[event_dict['level']]
+        return event_dict
+
+    return use_bunyan_structure
 
 
 def _drop_color_message_key(_: Any, _name: str, event_dict: EventDict) -> EventDict:  # noqa: ARG001
@@ -52,6 +61,67 @@ def _drop_color_message_key(_: Any, _name: str, event_dict: EventDict) -> EventD
     return event_dict
 
 
+def _resolve_exc_info(_: Any, _name: str, event_dict: EventDict) -> EventDict:  # noqa: ARG001
+    """
+    'logger.exception()' sets 'exc_info' to True, which means "the exception currently being handled".
+    The listener thread renders the event long after that, so capture the exception itself now.
+    """
+    if event_dict.get('exc_info') is True:
+        event_dict['exc_info'] = sys.exc_info()
+    return event_dict
+
+
+def _dumps_json(obj: Any, **kwargs: Any) -> str:
+    """orjson serializer for structlog's JSONRenderer, which needs to return a string."""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS, **kwargs).decode()
+
+
+class _EventDictQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on the queue of a listener thread, which renders them and writes them to stderr, so that logging never waits on I/O.
+
+    The standard QueueHandler formats each record into a string before queueing it, which would discard structlog's event dict.
+    Instead, records from other libraries (i.e. uvicorn and SQLAlchemy) are run through the shared processors here,
+    so that they get the timestamp and the request context of the thread which logged them - just like structlog's own events.
+    """
+
+    def __init__(
+        self, log_queue: queue.SimpleQueue[logging.LogRecord], foreign_pre_chain: list[Processor]
+    ) -> None:
+        super().__init__(log_queue)
+        self.foreign_pre_chain = foreign_pre_chain
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # unlike the standard QueueHandler, this does not copy the record first: every logger only has this handler, so nothing else sees it
+        # structlog.stdlib.ProcessorFormatter.wrap_for_formatter attaches '_logger' to structlog's own records
+        if hasattr(record, '_logger'):
+            return record
+        method_name = record.levelname.lower()
+        event_dict: EventDict = {'event': record.getMessage(), '_record': record}
+        if record.exc_info:
+            event_dict['exc_info'] = record.exc_info
+        if record.stack_info:
+            event_dict['stack_info'] = record.stack_info
+        for processor in self.foreign_pre_chain:
+            event_dict = cast('EventDict', processor(None, method_name, event_dict))
+        del event_dict['_record']
+        # the listener's ProcessorFormatter treats the record like one of structlog's own now
+        record.msg = event_dict
+        record.args = ()
+        record.exc_info = None
+        record.exc_text = None
+        record.stack_info = None
+        record.__dict__.update(_logger=None, _name=method_name)
+        return record
+
+    def close(self) -> None:
+        # logging.shutdown() closes this when the process exits, and so does dictConfig when logging is set up again
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
+
+
 def setup_logging() -> None:
     """
     This compels all loggers, including third-party loggers, to utilize a standard format with standard keys.
@@ -74,10 +144,11 @@ def setup_logging() -> None:
         _drop_color_message_key,
         timestamper,
         structlog.processors.StackInfoRenderer(),
+        _resolve_exc_info,
     ]
 
     if use_json_logs:
-        shared_processors.append(_use_bunyan_structure)
+        shared_processors.append(_make_bunyan_processor())
         # Format the exception only for JSON logs
         shared_processors.append(structlog.processors.format_exc_info)
 
@@ -89,11 +160,12 @@ def setup_logging() -> None:
     )
 
     formatter = (
-        structlog.processors.JSONRenderer()
+        structlog.processors.JSONRenderer(serializer=_dumps_json)
         if use_json_logs
         else structlog.dev.ConsoleRenderer(timestamp_key='time')
     )
 
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
     logging.config.dictConfig(
         {
             'version': 1,
@@ -114,39 +186,44 @@ def setup_logging() -> None:
                     'class': 'logging.StreamHandler',
                     'formatter': 'global',
                 },
-                #'queue_handler': {
-                #'class': 'logging.handlers.QueueHandler',
-                #'handlers': ['stderr'],
-                #'respect_handler_level': True,
-                # },
+                'queue_handler': {
+                    '()': _EventDictQueueHandler,
+                    'log_queue': log_queue,
+                    'foreign_pre_chain': shared_processors,
+                },
             },
             'loggers': {
                 # root logger
                 '': {
-                    'handlers': ['stderr'],
-                    #'handlers': ['queue_handler'],
+                    'handlers': ['queue_handler'],
                     'level': settings.LOG_LEVEL,
                     'propagate': True,
                 },
                 # we will override the uvicorn.access handler entirely
                 'uvicorn.error': {
-                    'handlers': ['stderr'],
-                    #'handlers': ['queue_handler'],
+                    'handlers': ['queue_handler'],
                     'level': 'INFO',
                     'propagate': False,
                 },
                 'sqlalchemy.engine': {
-                    'handlers': ['stderr'],
-                    #'handlers': ['queue_handler'],
+                    'handlers': ['queue_handler'],
                     'level': 'INFO',
                     'propagate': False,
                 },
                 'sqlalchemy.pool': {
-                    'handlers': ['stderr'],
-                    #'handlers': ['queue_handler'],
+                    'handlers': ['queue_handler'],
                     'level': 'INFO',
                     'propagate': False,
                 },
             },
         }
     )
+
+    # only the listener thread writes to stderr
+    queue_handler = cast('_EventDictQueueHandler', logging.getHandlerByName('queue_handler'))
+    queue_handler.listener = logging.handlers.QueueListener(
+        log_queue,
+        cast('logging.Handler', logging.getHandlerByName('stderr')),
+        respect_handler_level=True,
+    )
+    queue_handler.listener.start()
@@ -0,0 +1,180 @@
+"""Prometheus metrics, aggregated across all uvicorn workers.
+
+When started through 'python -m intersect_registry_service', every worker writes its samples to files in METRICS_MULTIPROC_DIR,
+and whichever worker handles a scrape of '/metrics' reads all of them. Otherwise (i.e. when uvicorn is started directly),
+'/metrics' only reports the worker which handled the scrape.
+
+Gauges of a worker which has stopped are dropped, counters and histograms are kept so that rates stay continuous.
+"""
+
+import os
+import time
+from collections.abc import Callable
+from functools import wraps
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+from sqlalchemy import Engine
+
+from .database import get_pool_status
+from .request_phases import add_phase_time
+
+MULTIPROC_DIR_ENV = 'PROMETHEUS_MULTIPROC_DIR'
+"""prometheus_client decides whether to write samples to files when it is imported, so this must be set before importing this module."""
+
+HTTP_REQUEST_DURATION = Histogram(
+    'registry_http_request_duration_seconds',
+    'Time spent handling HTTP requests',
+    ['method', 'route', 'status'],
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    'registry_http_requests_in_progress',
+    'HTTP requests currently being handled',
+    multiprocess_mode='livesum',
+)
+
+DB_POOL_CONNECTIONS = Gauge(
+    'registry_db_pool_connections',
+    'Connections held by the database pools, by state',
+    ['engine', 'state'],
+    multiprocess_mode='livesum',
+)
+DB_POOL_CHECKOUTS = Counter(
+    'registry_db_pool_checkouts',
+    'Connections handed out by the database pools, and checkouts which timed out',
+    ['engine', 'outcome'],
+)
+DB_POOL_CHECKOUT_WAIT = Counter(
+    'registry_db_pool_checkout_wait_seconds',
+    'Time spent waiting for a connection from the database pools',
+    ['engine'],
+)
+
+BROKER_CALL_DURATION = Histogram(
+    'registry_broker_call_duration_seconds',
+    'Duration of broker operations, through the management API or the messaging protocol',
+    ['api', 'operation'],
+)
+BROKER_CALL_ERRORS = Counter(
+    'registry_broker_call_errors',
+    'Broker operations which raised an exception',
+    ['api', 'operation'],
+)
+
+TOKEN_VERIFICATIONS = Counter(
+    'registry_token_verifications',
+    "Verifications of users' session tokens, 'cached' ones skipped the signature check",
+    ['result'],
+)
+JWKS_KEY_LOOKUPS = Counter(
+    'registry_jwks_key_lookups',
+    "Signing key lookups, 'miss' means the key was not in the background-refreshed cache",
+    ['result'],
+)
+
+DEPENDENCY_UP = Gauge(
+    'registry_dependency_up',
+    'Whether the last background health check of a dependency succeeded, per worker',
+    ['dependency'],
+    multiprocess_mode='livemin',
+)
+
+EVENT_LOOP_LAG = Histogram(
+    'registry_event_loop_lag_seconds',
+    'How late the event loop woke up a task sleeping for EVENT_LOOP_SAMPLE_INTERVAL, per sample',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+EVENT_LOOP_BLOCKED = Counter(
+    'registry_event_loop_blocked',
+    "Times the event loop was blocked for longer than EVENT_LOOP_BLOCKED_THRESHOLD, by the route being handled ('none' outside of routed requests)",
+    ['route'],
+)
+
+BACKGROUND_TASK_DURATION = Histogram(
+    'registry_background_task_duration_seconds',
+    'Duration of each run of a periodic background task',
+    ['task'],
+)
+BACKGROUND_TASK_FAILURES = Counter(
+    'registry_background_task_failures',
+    'Runs of a periodic background task which raised an exception',
+    ['task'],
+)
+
+
+def timed_broker_call[**P, R](api: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Decorator which records the duration and errors of a broker handler method, labelled with the method's name.
+
+    The duration also counts towards the 'broker' phase of the current request.
+    """
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        duration = BROKER_CALL_DURATION.labels(api, func.__name__)
+        errors = BROKER_CALL_ERRORS.labels(api, func.__name__)
+
+        @wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                elapsed = time.perf_counter_ns() - start
+                duration.observe(elapsed / 1e9)
+                add_phase_time('broker', elapsed)
+
+        return wrapper
+
+    return decorator
+
+
+class DatabasePoolMetrics:
+    """Copies the connection pool statistics of this worker into the metrics. Call 'sample' periodically."""
+
+    def __init__(self, engines: dict[str, Engine]) -> None:
+        self._engines = engines
+        self._last: dict[str, dict[str, int | float]] = {}
+        """pool status of each engine at the previous sample, the counters only get the difference"""
+
+    def sample(self) -> None:
+        for name, engine in self._engines.items():
+            status = get_pool_status(engine)
+            last = self._last.get(name, {})
+            for state in ('checked_out', 'checked_in', 'overflow'):
+                DB_POOL_CONNECTIONS.labels(name, state).set(status[state])
+            DB_POOL_CHECKOUTS.labels(name, 'success').inc(
+                status['checkouts'] - last.get('checkouts', 0)
+            )
+            DB_POOL_CHECKOUTS.labels(name, 'timeout').inc(
+                status['checkout_timeouts'] - last.get('checkout_timeouts', 0)
+            )
+            DB_POOL_CHECKOUT_WAIT.labels(name).inc(
+                status['checkout_wait_seconds_total'] - last.get('checkout_wait_seconds_total', 0)
+            )
+            self._last[name] = status
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Returns: the metrics of every worker in the Prometheus text format, and its content type"""
+    if MULTIPROC_DIR_ENV in os.environ:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)  # type: ignore[no-untyped-call]
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_worker_stopped() -> None:
+    """Stop reporting the gauges of this worker. Call this when the worker shuts down."""
+    if MULTIPROC_DIR_ENV in os.environ:
+        mark_process_dead(os.getpid())  # type: ignore[no-untyped-call]
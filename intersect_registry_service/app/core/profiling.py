@@ -0,0 +1,198 @@
+"""Opt-in profiling of sampled requests and of memory allocations, to find out why an endpoint regressed in production.
+
+Nothing is profiled unless PROFILING_DIR is set AND a profiling session was started through the admin API (/api/v1/admin/profiling).
+The admin API writes the session to a control file in PROFILING_DIR, which every worker polls. Sessions therefore reach all workers
+sharing the directory without a restart, and end by themselves when they expire.
+
+Every worker writes its results to PROFILING_DIR:
+- 'cpu-<pid>-<time>-<method>-<path>.prof': cProfile statistics of one request, for pstats, snakeviz or gprof2dot
+- 'memory-<pid>-<time>.txt': the source lines whose allocations grew the most since the session started
+- 'memory-<pid>-<time>.snapshot': the tracemalloc snapshot itself, see tracemalloc.Snapshot.load()
+
+While a profiled request awaits, the event loop runs other requests, and their work ends up in the same CPU profile.
+Each worker profiles at most one request at a time.
+"""
+
+import cProfile
+import datetime
+import os
+import random
+import re
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Annotated
+
+from pydantic import BaseModel, Field, PositiveInt, ValidationError
+
+from .log_config import logger
+
+CONTROL_FILE_NAME = 'session.json'
+
+RESULT_FILE_REGEX = r'^(cpu|memory)-[A-Za-z0-9_.-]+$'
+"""Names of the files the workers write, anything else in PROFILING_DIR is not served"""
+
+_TRACEMALLOC_FRAMES = 5
+"""Frames stored per allocation. More frames make the saved snapshots more useful, but make every allocation slower."""
+
+_MEMORY_DIFF_LINES = 50
+
+
+class ProfilingSession(BaseModel):
+    cpu_sample_rate: Annotated[float, Field(ge=0.0, le=1.0)] = 0.0
+    """Fraction of requests which get a CPU profile"""
+    path_prefix: str = '/'
+    """Only requests whose path starts with this are profiled"""
+    max_cpu_profiles: PositiveInt = 100
+    """Each worker stops profiling requests once it wrote this many profiles during the session"""
+    memory_snapshot_interval: PositiveInt | None = None
+    """If set, every worker traces memory allocations during the session, and writes a diff against the start of the session this many seconds apart, and when the session ends"""
+    started_at: datetime.datetime
+    expires_at: datetime.datetime
+
+
+def read_session(control_file: Path) -> ProfilingSession | None:
+    """Returns: the current session, or None if there is none or it has expired"""
+    try:
+        session = ProfilingSession.model_validate_json(control_file.read_bytes())
+    except FileNotFoundError:
+        return None
+    except ValidationError:
+        logger.warning('Ignoring invalid profiling control file %s', control_file)
+        return None
+    if session.expires_at <= datetime.datetime.now(datetime.UTC):
+        return None
+    return session
+
+
+def write_session(control_file: Path, session: ProfilingSession | None) -> None:
+    """Start a new session, or end the current one if 'session' is None."""
+    if session is None:
+        control_file.unlink(missing_ok=True)
+        return
+    # workers must never read a partially written file
+    tmp_file = control_file.with_suffix(f'.{os.getpid()}.tmp')
+    tmp_file.write_text(session.model_dump_json())
+    tmp_file.replace(control_file)
+
+
+def _timestamp() -> str:
+    return datetime.datetime.now(datetime.UTC).strftime('%Y%m%dT%H%M%S%fZ')
+
+
+class Profiler:
+    """The profiling state of one worker. 'poll' follows the control file, the ProfilingMiddleware calls the CPU profiling methods."""
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.control_file = directory / CONTROL_FILE_NAME
+        self._session: ProfilingSession | None = None
+        self._cpu_profiles_started = 0
+        self._cpu_profile_running = False
+        self._memory_baseline: tracemalloc.Snapshot | None = None
+        self._last_memory_diff = 0.0
+        self._started_tracemalloc = False
+
+    def start_cpu_profile(self, path: str) -> cProfile.Profile | None:
+        """Decide whether to profile this request, and if so, start profiling. Called on the event loop for every request."""
+        session = self._session
+        if (
+            session is None
+            or self._cpu_profile_running
+            or self._cpu_profiles_started >= session.max_cpu_profiles
+            or not path.startswith(session.path_prefix)
+            or random.random() >= session.cpu_sample_rate  # noqa: S311
+        ):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler (i.e. a debugger or coverage) already uses this thread
+            return None
+        self._cpu_profile_running = True
+        self._cpu_profiles_started += 1
+        return profile
+
+    def stop_cpu_profile(self, profile: cProfile.Profile) -> None:
+        profile.disable()
+        self._cpu_profile_running = False
+
+    def save_cpu_profile(self, profile: cProfile.Profile, method: str, path: str) -> None:
+        """Write a finished profile. This does file I/O, so call it in a worker thread."""
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', path).strip('_')[:64] or 'root'
+        profile.dump_stats(
+            self.directory / f'cpu-{os.getpid()}-{_timestamp()}-{method}-{slug}.prof'
+        )
+
+    def poll(self) -> None:
+        """Start or end sessions according to the control file, and write memory diffs which are due. Runs periodically in a worker thread."""
+        session = read_session(self.control_file)
+        if session != self._session:
+            if self._session is not None:
+                logger.info('Profiling session ended')
+                self._stop_memory_tracing()
+            self._session = None
+            self._cpu_profiles_started = 0
+            if session is not None:
+                logger.info(
+                    'Profiling session started, profiling %.1f%% of requests under %s until %s',
+                    session.cpu_sample_rate * 100,
+                    session.path_prefix,
+                    session.expires_at.isoformat(),
+                )
+                if session.memory_snapshot_interval is not None:
+                    self._start_memory_tracing()
+            self._session = session
+        elif (
+            session is not None
+            and session.memory_snapshot_interval is not None
+            and time.monotonic() - self._last_memory_diff >= session.memory_snapshot_interval
+        ):
+            self._write_memory_diff()
+
+    def stop(self) -> None:
+        """End this worker's part of the session, i.e. when it shuts down. Other workers carry on."""
+        self._session = None
+        self._stop_memory_tracing()
+
+    def _start_memory_tracing(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(_TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        self._memory_baseline = self._take_snapshot()
+        self._last_memory_diff = time.monotonic()
+
+    def _stop_memory_tracing(self) -> None:
+        if self._memory_baseline is None:
+            return
+        self._write_memory_diff()
+        self._memory_baseline = None
+        # leave tracing on if it was started by someone else, i.e. with PYTHONTRACEMALLOC
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(inclusive=False, filename_pattern=tracemalloc.__file__),
+                tracemalloc.Filter(
+                    inclusive=False, filename_pattern='<frozen importlib._bootstrap>'
+                ),
+            )
+        )
+
+    def _write_memory_diff(self) -> None:
+        if self._memory_baseline is None:
+            return
+        snapshot = self._take_snapshot()
+        self._last_memory_diff = time.monotonic()
+        name = f'memory-{os.getpid()}-{_timestamp()}'
+        snapshot.dump(str(self.directory / f'{name}.snapshot'))
+        stats = snapshot.compare_to(self._memory_baseline, 'lineno')
+        lines = [
+            f'Allocations of worker {os.getpid()} compared to the start of the profiling session, largest growth first',
+            *(str(stat) for stat in stats[:_MEMORY_DIFF_LINES]),
+        ]
+        (self.directory / f'{name}.txt').write_text('\n'.join(lines) + '\n')
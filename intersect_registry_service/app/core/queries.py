@@ -0,0 +1,122 @@
+"""Hot-path reads, written against SQLAlchemy Core instead of the ORM.
+
+These run on every SDK startup and on every page of the services table, so they skip the Session, the identity map and model instantiation,
+and return plain rows instead.
+
+The statements are constructed once, at import time, with all values as bound parameters. SQLAlchemy therefore compiles each one only once per
+engine, and every execution sends the exact same SQL text, which lets psycopg prepare it on the server (see POSTGRESQL_PREPARED_STATEMENTS).
+
+This module must not import the settings, so that the benchmarks can use it.
+"""
+
+import datetime
+from collections.abc import Sequence
+from typing import Any
+
+from sqlalchemy import Engine, Row, Select, bindparam, literal_column, or_, select
+
+from ..models.service import Service
+from ..models.service_activity import ServiceActivity
+
+_service = Service.__table__  # type: ignore[attr-defined]
+_activity = ServiceActivity.__table__  # type: ignore[attr-defined]
+
+_SERVICE_EXISTS: Select[Any] = (
+    select(literal_column('1'))
+    .select_from(_service)
+    .where(
+        _service.c.service_name == bindparam('service_name'),
+        _service.c.api_key == bindparam('api_key'),
+    )
+    .limit(1)
+)
+
+_SERVICES_FIRST_PAGE: Select[Any] = (
+    select(
+        _service.c.id,
+        _service.c.service_name,
+        _service.c.api_key,
+        _service.c.last_modified,
+    )
+    .where(_service.c.username == bindparam('username'))
+    .order_by(_service.c.last_modified.desc(), _service.c.id.desc())
+    .limit(bindparam('limit'))
+)
+
+_SERVICES_NEXT_PAGE: Select[Any] = _SERVICES_FIRST_PAGE.where(
+    # equivalent to (last_modified, id) < (:last_modified, :id), but lets Postgres use the range on the index
+    _service.c.last_modified <= bindparam('last_modified'),
+    or_(
+        _service.c.last_modified < bindparam('last_modified'),
+        _service.c.id < bindparam('id'),
+    ),
+)
+
+_STALE_SERVICES: Select[Any] = (
+    select(_service.c.service_name, _activity.c.last_seen)
+    .select_from(_service.outerjoin(_activity, _activity.c.service_id == _service.c.id))
+    .where(
+        _service.c.username == bindparam('username'),
+        # give new Services a chance to start up before calling them stale
+        _service.c.created_on < bindparam('seen_before'),
+        or_(_activity.c.last_seen.is_(None), _activity.c.last_seen < bindparam('seen_before')),
+    )
+    .order_by(_activity.c.last_seen.asc().nulls_first(), _service.c.id)
+    .limit(bindparam('limit'))
+)
+
+
+def service_exists(engine: Engine, service_name: str, api_key: str) -> bool:
+    """Check that a Service with this name and API key has been registered."""
+    with engine.connect() as connection:
+        result = connection.execute(
+            _SERVICE_EXISTS, {'service_name': service_name, 'api_key': api_key}
+        )
+        return result.first() is not None
+
+
+def get_services_page(
+    engine: Engine,
+    username: str,
+    limit: int,
+    after: tuple[datetime.datetime, int] | None = None,
+) -> Sequence[Row[Any]]:
+    """A user's services, newest first, as rows of (id, service_name, api_key, last_modified).
+
+    Args:
+      engine: the engine to read from
+      username: owner of the services
+      limit: maximum number of rows to return
+      after: (last_modified, id) of the last row of the previous page, or None for the first page
+    """
+    with engine.connect() as connection:
+        if after is None:
+            result = connection.execute(
+                _SERVICES_FIRST_PAGE, {'username': username, 'limit': limit}
+            )
+        else:
+            last_modified, service_id = after
+            result = connection.execute(
+                _SERVICES_NEXT_PAGE,
+                {
+                    'username': username,
+                    'limit': limit,
+                    'last_modified': last_modified,
+                    'id': service_id,
+                },
+            )
+        return result.all()
+
+
+def get_stale_services(
+    engine: Engine, username: str, seen_before: datetime.datetime, limit: int
+) -> Sequence[Row[Any]]:
+    """A user's services which have not fetched their configuration since 'seen_before', as rows of (service_name, last_seen).
+
+    'last_seen' is None for services which never fetched their configuration. Services which were never seen come first, then the longest unseen.
+    """
+    with engine.connect() as connection:
+        result = connection.execute(
+            _STALE_SERVICES, {'username': username, 'seen_before': seen_before, 'limit': limit}
+        )
+        return result.all()
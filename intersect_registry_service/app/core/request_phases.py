@@ -0,0 +1,87 @@
+"""Time the current request spends in the database, in broker calls and in rendering templates, reported in its access log entry.
+
+Sync endpoints and the broker handlers run in worker threads, which start with a copy of the request's context, so they add to the same RequestPhases.
+Outside of a request (i.e. in background tasks), nothing is recorded.
+"""
+
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, Literal
+
+from sqlalchemy import Engine, event
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import ExceptionContext
+
+Phase = Literal['db', 'broker', 'template']
+
+
+@dataclass(slots=True)
+class RequestPhases:
+    """Nanoseconds spent in each phase. Phases running concurrently in several threads are added up."""
+
+    db: int = 0
+    broker: int = 0
+    template: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+_current_phases: ContextVar[RequestPhases | None] = ContextVar('request_phases', default=None)
+
+_START_INFO_KEY = 'request_phase_start'
+"""Key of the current statement's start time in the DBAPI connection's info dictionary"""
+
+
+def start_request_phases() -> tuple[RequestPhases, Token[RequestPhases | None]]:
+    """Start recording the phases of the current request. Pass the token to end_request_phases once the request is done."""
+    phases = RequestPhases()
+    return phases, _current_phases.set(phases)
+
+
+def end_request_phases(token: Token[RequestPhases | None]) -> None:
+    _current_phases.reset(token)
+
+
+def add_phase_time(phase: Phase, nanoseconds: int) -> None:
+    """Add time to a phase of the current request, if there is one."""
+    phases = _current_phases.get()
+    if phases is not None:
+        setattr(phases, phase, getattr(phases, phase) + nanoseconds)
+
+
+@contextmanager
+def timed_phase(phase: Phase) -> Iterator[None]:
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        add_phase_time(phase, time.perf_counter_ns() - start)
+
+
+def time_engine_statements(engine: Engine) -> None:
+    """Add the time spent executing statements on this engine to the 'db' phase of the request."""
+
+    def before_cursor_execute(conn: Any, *_: Any) -> None:  # noqa: ARG001
+        if _current_phases.get() is not None:
+            conn.info[_START_INFO_KEY] = time.perf_counter_ns()
+
+    def after_cursor_execute(conn: Any, *_: Any) -> None:  # noqa: ARG001
+        start = conn.info.pop(_START_INFO_KEY, None)
+        if start is not None:
+            add_phase_time('db', time.perf_counter_ns() - start)
+
+    def handle_error(context: 'ExceptionContext') -> None:
+        if context.connection is None:
+            return
+        start = context.connection.info.pop(_START_INFO_KEY, None)
+        if start is not None:
+            add_phase_time('db', time.perf_counter_ns() - start)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(engine, 'handle_error', handle_error)
@@ -1,18 +1,89 @@
+import re
+from pathlib import Path
+
+from sqlalchemy import Connection, create_engine, text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.pool import NullPool
+
+from .log_config import logger
+
+_MIGRATION_LOCK_ID = 7_215_202_504_150_001
+"""Postgres advisory lock key held while upgrading. Arbitrary, but it must never change, or old and new replicas would not exclude each other."""
+
+_REVISION_REGEX = re.compile(r'^revision\b[^=]*=\s*[\'"](\w+)[\'"]', re.MULTILINE)
+_DOWN_REVISION_REGEX = re.compile(r'^down_revision\b[^=]*=(.*)$', re.MULTILINE)
+
+
+def _bundled_heads(versions_dir: Path) -> set[str]:
+    """Head revisions of the migration scripts we ship, found without importing Alembic or executing the scripts."""
+    revisions = set()
+    down_revisions = set()
+    for script in versions_dir.glob('*.py'):
+        source = script.read_text()
+        revision = _REVISION_REGEX.search(source)
+        if not revision:
+            continue
+        revisions.add(revision.group(1))
+        down_revision = _DOWN_REVISION_REGEX.search(source)
+        if down_revision:
+            # a merge revision has a tuple of parents
+            down_revisions.update(re.findall(r'[\'"](\w+)[\'"]', down_revision.group(1)))
+    return revisions - down_revisions
+
+
+def _database_heads(connection: Connection) -> set[str]:
+    try:
+        rows = connection.execute(text('SELECT version_num FROM alembic_version'))
+    except ProgrammingError:
+        # fresh database
+        return set()
+    return {row[0] for row in rows}
+
+
+def _upgrade(postgres_url: str, root_dir: Path) -> None:
+    from alembic import command
+    from alembic.config import Config
+
+    alembic_cfg = Config(str(root_dir / 'alembic.ini'))
+    alembic_cfg.set_main_option('script_location', str(root_dir / 'migrations'))
+    alembic_cfg.set_main_option('sqlalchemy.url', postgres_url)
+    # this is a custom setting we use in alembic's env.py so we do not override our own logging format
+    alembic_cfg.set_main_option('process_wants_logging', 'false')
+    command.upgrade(alembic_cfg, 'head')
+
+
 def run_migrations() -> None:
     """NOTE: this command will never GENERATE migration files for you. You should run alembic on the command line to do this.
 
     The only thing it will do is make sure that all of the migration files have been applied against the database.
-    """
-    from alembic import command
-    from alembic.config import Config
 
+    Every replica calls this on startup, so it first compares the database's revision against the bundled migrations, and returns immediately if
+    they match. Otherwise, it upgrades while holding an advisory lock; replicas starting at the same time wait for the lock and then find
+    nothing left to do.
+    """
     from .environment import settings
 
-    parent_dir = settings.ROOT_DIR
+    heads = _bundled_heads(settings.ROOT_DIR / 'migrations' / 'versions')
+    engine = create_engine(settings.postgres_url, poolclass=NullPool)
+    try:
+        # autocommit, so that we do not sit idle in a transaction while waiting for the lock or the upgrade
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            if _database_heads(connection) == heads:
+                logger.info('Database schema is up to date')
+                return
 
-    alembic_cfg = Config(str(parent_dir / 'alembic.ini'))
-    alembic_cfg.set_main_option('script_location', str(parent_dir / 'migrations'))
-    alembic_cfg.set_main_option('sqlalchemy.url', settings.postgres_url)
-    # this is a custom setting we use in alembic's env.py so we do not override our own logging format
-    alembic_cfg.set_main_option('process_wants_logging', 'false')
-    command.upgrade(alembic_cfg, 'head')
+            logger.info('Waiting for the migration lock')
+            connection.execute(text('SELECT pg_advisory_lock(:id)'), {'id': _MIGRATION_LOCK_ID})
+            try:
+                # another replica may have upgraded while we were waiting
+                if _database_heads(connection) == heads:
+                    logger.info('Database schema was upgraded by another replica')
+                    return
+                logger.info('Upgrading database schema')
+                _upgrade(settings.postgres_url, settings.ROOT_DIR)
+            finally:
+                connection.execute(
+                    text('SELECT pg_advisory_unlock(:id)'), {'id': _MIGRATION_LOCK_ID}
+                )
+    finally:
+        engine.dispose()
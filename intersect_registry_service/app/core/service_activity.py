@@ -0,0 +1,68 @@
+"""Write-behind tracking of when Services last fetched their configuration.
+
+Recording a fetch only touches an in-memory dictionary. Each worker periodically writes everything it has recorded since the last flush
+in a single upsert, so the database sees at most one statement per worker per flush interval, no matter how busy the SDK endpoint is.
+"""
+
+import datetime
+import threading
+
+from sqlalchemy import Engine, text
+
+from .log_config import logger
+
+_UPSERT = text(
+    'INSERT INTO service_activity (service_id, last_seen, fetch_count)'
+    ' SELECT service.id, activity.last_seen, activity.fetch_count'
+    ' FROM unnest(CAST(:service_names AS text[]), CAST(:last_seen AS timestamptz[]), CAST(:fetch_counts AS bigint[]))'
+    ' AS activity (service_name, last_seen, fetch_count)'
+    ' JOIN service ON service.service_name = activity.service_name'
+    ' ON CONFLICT (service_id) DO UPDATE SET'
+    # workers flush independently, so an older timestamp may arrive after a newer one
+    ' last_seen = GREATEST(service_activity.last_seen, EXCLUDED.last_seen),'
+    ' fetch_count = service_activity.fetch_count + EXCLUDED.fetch_count'
+)
+
+
+class ServiceActivityTracker:
+    """Coalesces configuration fetches in memory until 'flush' is called."""
+
+    def __init__(self, engine: Engine) -> None:
+        self._engine = engine
+        self._lock = threading.Lock()
+        self._pending: dict[str, tuple[datetime.datetime, int]] = {}
+        """service name -> (last fetch, number of fetches since the last flush)"""
+
+    def record(self, service_name: str) -> None:
+        """Note that a Service fetched its configuration just now. Does not do any I/O."""
+        now = datetime.datetime.now(datetime.UTC)
+        with self._lock:
+            _, count = self._pending.get(service_name, (now, 0))
+            self._pending[service_name] = (now, count + 1)
+
+    def flush(self) -> None:
+        """Write everything recorded so far. Blocking, call this periodically from a worker thread, and once more on shutdown."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        service_names = list(pending)
+        try:
+            with self._engine.begin() as connection:
+                connection.execute(
+                    _UPSERT,
+                    {
+                        'service_names': service_names,
+                        'last_seen': [pending[name][0] for name in service_names],
+                        'fetch_counts': [pending[name][1] for name in service_names],
+                    },
+                )
+        except Exception:
+            # keep the activity around for the next attempt, merging in whatever was recorded in the meantime
+            with self._lock:
+                for service_name, (last_seen, count) in pending.items():
+                    newer_seen, newer_count = self._pending.get(service_name, (last_seen, 0))
+                    self._pending[service_name] = (max(last_seen, newer_seen), count + newer_count)
+            raise
+        logger.debug('Flushed activity of %d services', len(service_names))
@@ -0,0 +1,150 @@
+"""Batched Service management for the administrative API.
+
+Each function handles a whole batch in one database transaction. When Services are created, their broker users are created in one round
+of requests while that transaction is still open, and the transaction is only committed once the broker has accepted them, so a failed
+batch leaves no Services without broker users.
+
+Deletion goes the other way round: the Services are deleted first, and their broker users and queues are removed afterwards. If the broker
+fails, the Services are gone but some of their broker resources may be left; these are logged and reported, and removing them again is safe.
+
+All functions are blocking; call them from a worker thread.
+"""
+
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import Engine, Row, insert, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from ..models.broker import Broker
+from ..models.service import Service
+from ..utils.api_keys import make_api_key
+from .configuration_manager import ConfigurationManager
+from .log_config import logger
+
+_service = Service.__table__  # type: ignore[attr-defined]
+_broker = Broker.__table__  # type: ignore[attr-defined]
+
+SERVICE_COLUMNS = (
+    _service.c.id,
+    _service.c.service_name,
+    _service.c.username,
+    _service.c.api_key,
+    _service.c.created_on,
+    _service.c.last_modified,
+)
+
+_ROTATE_API_KEYS = text(
+    'UPDATE service SET api_key = rotated.api_key, last_modified = CURRENT_TIMESTAMP'
+    ' FROM unnest(CAST(:service_names AS text[]), CAST(:api_keys AS text[]))'
+    ' AS rotated (service_name, api_key)'
+    ' WHERE service.service_name = rotated.service_name'
+    ' RETURNING service.id, service.service_name, service.username, service.api_key,'
+    ' service.created_on, service.last_modified'
+)
+
+
+def list_services(
+    engine: Engine, username: str | None, limit: int, after: int | None
+) -> Sequence[Row[Any]]:
+    """Services in order of creation, optionally only those of one user.
+
+    Args:
+      engine: the engine to read from
+      username: only list this user's Services, or None for every Service
+      limit: maximum number of rows to return
+      after: id of the last row of the previous page, or None for the first page
+    """
+    statement = select(*SERVICE_COLUMNS).order_by(_service.c.id).limit(limit)
+    if username is not None:
+        statement = statement.where(_service.c.username == username)
+    if after is not None:
+        statement = statement.where(_service.c.id > after)
+    with engine.connect() as connection:
+        return connection.execute(statement).all()
+
+
+def create_services(
+    engine: Engine, config_manager: ConfigurationManager, services: Sequence[tuple[str, str]]
+) -> Sequence[Row[Any]]:
+    """Create Services from (service name, username) pairs, each with a new API key.
+
+    Returns the rows of the Services which were created. Names which were already taken are skipped.
+    """
+    with engine.begin() as connection:
+        created = connection.execute(
+            pg_insert(_service)
+            .values(
+                [
+                    {'service_name': service_name, 'username': username, 'api_key': make_api_key()}
+                    for service_name, username in services
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=['service_name'])
+            .returning(*SERVICE_COLUMNS)
+        ).all()
+        if created:
+            credentials = config_manager.add_services([row.service_name for row in created])
+            connection.execute(
+                insert(_broker),
+                [
+                    {'service_id': row.id, 'broker_password': broker_password}
+                    for row, (_, broker_password) in zip(created, credentials, strict=True)
+                ],
+            )
+    return created
+
+
+def rotate_api_keys(engine: Engine, service_names: Sequence[str]) -> Sequence[Row[Any]]:
+    """Give each Service a new API key. Returns the rows of the Services which exist, with their new keys.
+
+    Running SDK processes keep their broker connection, but need the new key the next time they fetch their configuration.
+    """
+    with engine.begin() as connection:
+        return connection.execute(
+            _ROTATE_API_KEYS,
+            {
+                'service_names': list(service_names),
+                'api_keys': [make_api_key() for _ in service_names],
+            },
+        ).all()
+
+
+@dataclass
+class DeleteSummary:
+    deleted: list[str] = field(default_factory=list)
+    """Names of the Services which existed, and were deleted"""
+    broker_leftovers: list[str] = field(default_factory=list)
+    """Names whose broker users or queues could not all be removed"""
+
+
+def delete_services(
+    engine: Engine, config_manager: ConfigurationManager, service_names: Sequence[str]
+) -> DeleteSummary:
+    """Delete Services, then their broker users and queues.
+
+    The broker resources of every name in the batch are removed, not only those of the Services which existed. So if the broker failed,
+    deleting the same names again retries removing what was left behind.
+    """
+    summary = DeleteSummary()
+    with engine.begin() as connection:
+        # broker configurations are removed by the foreign key's ON DELETE CASCADE
+        summary.deleted = list(
+            connection.execute(
+                _service.delete()
+                .where(_service.c.service_name.in_(service_names))
+                .returning(_service.c.service_name)
+            ).scalars()
+        )
+    try:
+        config_manager.remove_services(service_names)
+    except Exception:  # noqa: BLE001
+        # the cause was already logged
+        logger.error(
+            'Could not remove the broker resources of %d services, delete them again to retry: %s',
+            len(service_names),
+            ', '.join(service_names),
+        )
+        summary.broker_leftovers = list(service_names)
+    return summary
@@ -0,0 +1,175 @@
+"""Bulk import and export of Services, for moving a facility's existing namespaces in or out of the registry.
+
+Rows are streamed through Postgres' COPY protocol instead of one INSERT or SELECT per row. Imports are processed in batches: each batch is
+copied into a temporary table, inserted into 'service' in one statement, provisioned on the broker in one round of requests,
+and committed only once the broker has accepted it.
+"""
+
+import csv
+import datetime
+import json
+import re
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from itertools import batched
+from typing import IO, Literal
+
+from psycopg import Connection
+
+from ..utils.api_keys import make_api_key
+from .configuration_manager import ConfigurationManager
+from .definitions import HIERARCHY_REGEX
+from .log_config import logger
+
+TransferFormat = Literal['csv', 'jsonl']
+
+EXPORT_COLUMNS = ('service_name', 'username', 'api_key', 'created_on', 'last_modified')
+"""Exports contain enough to re-import a Service with its existing API key. Broker passwords are not exported, they are regenerated on import."""
+
+_EXPORT_QUERY = f'SELECT {", ".join(EXPORT_COLUMNS)} FROM service ORDER BY id'  # noqa: S608 (constant)
+
+
+@dataclass
+class ImportSummary:
+    imported: int = 0
+    """Services which were created"""
+    skipped_existing: int = 0
+    """Services whose name was already taken"""
+    skipped_invalid: int = 0
+    """Rows without a valid service name or username, or with an invalid timestamp"""
+
+
+def export_services(connection: Connection, output: IO[bytes], fmt: TransferFormat) -> int:
+    """Write every Service to 'output' as UTF-8. Returns the number of Services exported."""
+    count = 0
+    with connection.cursor() as cursor:
+        if fmt == 'csv':
+            # Postgres writes the CSV itself, we only pass the chunks along
+            with cursor.copy(
+                f'COPY ({_EXPORT_QUERY}) TO STDOUT WITH (FORMAT csv, HEADER true)'
+            ) as copy:
+                for chunk in copy:
+                    output.write(chunk)
+            return max(cursor.rowcount, 0)
+
+        with cursor.copy(f'COPY ({_EXPORT_QUERY}) TO STDOUT') as copy:
+            copy.set_types(['text', 'text', 'text', 'timestamptz', 'timestamptz'])
+            for service_name, username, api_key, created_on, last_modified in copy.rows():
+                row = {
+                    'service_name': service_name,
+                    'username': username,
+                    'api_key': api_key,
+                    'created_on': created_on.isoformat(),
+                    'last_modified': last_modified.isoformat(),
+                }
+                output.write(json.dumps(row).encode())
+                output.write(b'\n')
+                count += 1
+    return count
+
+
+def read_services(
+    source: IO[str], fmt: TransferFormat, default_username: str | None
+) -> Iterator[dict[str, str]]:
+    """Parse an import file lazily, yielding one dictionary per Service.
+
+    Rows only need 'service_name'. 'username' falls back to 'default_username', and 'api_key' is generated if it is missing.
+    'created_on' and 'last_modified' are kept as exported, and are the time of the import if they are missing.
+    """
+    rows: Iterable[dict[str, str]]
+    if fmt == 'csv':
+        rows = csv.DictReader(source)
+    else:
+        rows = (json.loads(line) for line in source if line.strip())
+    for row in rows:
+        if default_username and not row.get('username'):
+            row['username'] = default_username
+        yield row
+
+
+def import_services(
+    connection: Connection,
+    rows: Iterable[dict[str, str]],
+    config_manager: ConfigurationManager,
+    batch_size: int,
+) -> ImportSummary:
+    """Create Services (and their broker users) from 'rows', committing once per batch. 'connection' must be in autocommit mode.
+
+    If the broker rejects a batch, that batch is rolled back and the exception is raised; earlier batches stay committed, so the import can be re-run
+    and will skip the Services which already exist.
+    """
+    summary = ImportSummary()
+    for batch in batched(_valid_rows(rows, summary), batch_size):
+        with connection.transaction():
+            created = _insert_batch(connection, batch)
+            summary.skipped_existing += len(batch) - len(created)
+            if created:
+                credentials = config_manager.add_services([name for _, name in created])
+                with (
+                    connection.cursor() as cursor,
+                    cursor.copy('COPY broker (service_id, broker_password) FROM STDIN') as copy,
+                ):
+                    # (service id, service name) and (broker username, broker password)
+                    for service, credential in zip(created, credentials, strict=True):
+                        copy.write_row((service[0], credential[1]))
+        summary.imported += len(created)
+        logger.info('Imported %d services so far', summary.imported)
+    return summary
+
+
+_ImportRow = tuple[str, str, str, datetime.datetime | None, datetime.datetime | None]
+"""service_name, username, api_key, created_on, last_modified"""
+
+
+def _valid_rows(rows: Iterable[dict[str, str]], summary: ImportSummary) -> Iterator[_ImportRow]:
+    """Each importable row. Invalid rows are logged and counted, not fatal."""
+    for line, row in enumerate(rows, start=1):
+        service_name = row.get('service_name') or ''
+        username = row.get('username') or ''
+        if not re.fullmatch(HIERARCHY_REGEX, service_name) or not username:
+            logger.warning('Skipping row %d, it needs a valid service_name and a username', line)
+            summary.skipped_invalid += 1
+            continue
+        try:
+            # both the ISO format of JSON lines and the format of Postgres' CSV output
+            created_on, last_modified = (
+                datetime.datetime.fromisoformat(value) if value else None
+                for value in (row.get('created_on'), row.get('last_modified'))
+            )
+        except ValueError:
+            logger.warning('Skipping row %d, its created_on or last_modified is invalid', line)
+            summary.skipped_invalid += 1
+            continue
+        yield (
+            service_name,
+            username,
+            row.get('api_key') or make_api_key(),
+            created_on,
+            last_modified,
+        )
+
+
+def _insert_batch(connection: Connection, batch: tuple[_ImportRow, ...]) -> list[tuple[int, str]]:
+    """Returns (id, service_name) of the Services which did not exist yet."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE IF NOT EXISTS service_import'
+            ' (service_name text, username text, api_key text,'
+            ' created_on timestamptz, last_modified timestamptz) ON COMMIT DELETE ROWS'
+        )
+        with cursor.copy(
+            'COPY service_import (service_name, username, api_key, created_on, last_modified)'
+            ' FROM STDIN'
+        ) as copy:
+            for row in batch:
+                copy.write_row(row)
+        # DISTINCT ON, because the same name could appear twice in the input
+        cursor.execute(
+            'INSERT INTO service (service_name, username, api_key, created_on, last_modified)'
+            ' SELECT DISTINCT ON (service_name) service_name, username, api_key,'
+            ' COALESCE(created_on, CURRENT_TIMESTAMP), COALESCE(last_modified, CURRENT_TIMESTAMP)'
+            ' FROM service_import'
+            ' ON CONFLICT (service_name) DO NOTHING'
+            ' RETURNING id, service_name'
+        )
+        return cursor.fetchall()
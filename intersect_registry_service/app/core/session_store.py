@@ -0,0 +1,140 @@
+"""Server-side storage of UI sessions.
+
+The browser only holds an opaque session ID; the session dictionary lives in a backend, keyed by a hash of that ID.
+Backends are blocking and are called from a worker thread by the session middleware.
+"""
+
+import datetime
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Protocol
+
+from sqlalchemy import Engine, text
+
+from .environment import Settings
+
+_SELECT_SESSION = text(
+    'SELECT data, EXTRACT(EPOCH FROM expires_at) FROM http_session'
+    ' WHERE id_hash = :id_hash AND expires_at > now()'
+)
+_UPSERT_SESSION = text(
+    'INSERT INTO http_session (id_hash, data, expires_at) VALUES (:id_hash, :data, :expires_at)'
+    ' ON CONFLICT (id_hash) DO UPDATE SET data = EXCLUDED.data, expires_at = EXCLUDED.expires_at'
+)
+_DELETE_SESSION = text('DELETE FROM http_session WHERE id_hash = :id_hash')
+_DELETE_EXPIRED_SESSIONS = text('DELETE FROM http_session WHERE expires_at <= now()')
+
+
+class SessionBackend(Protocol):
+    """Storage for session dictionaries. Keys are already hashed session IDs, backends never see the IDs themselves."""
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        """Returns: the session dictionary, or None if the session does not exist or has expired"""
+        ...
+
+    def save(self, key: str, data: dict[str, Any], max_age: int) -> None:
+        """Create or replace a session, which will expire 'max_age' seconds from now."""
+        ...
+
+    def delete(self, key: str) -> None: ...
+
+    def remove_expired(self) -> int:
+        """Returns: number of sessions removed"""
+        ...
+
+
+class MemorySessionBackend:
+    """Bounded LRU of sessions in this process. Sessions are lost on restart and are not shared between workers."""
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[dict[str, Any], float]] = OrderedDict()
+        """key -> (session dictionary, expiry as a UNIX timestamp)"""
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            data, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            # callers may modify the dictionary they get back
+            return dict(data)
+
+    def save(self, key: str, data: dict[str, Any], max_age: int) -> None:
+        self.store(key, data, time.time() + max_age)
+
+    def store(self, key: str, data: dict[str, Any], expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (dict(data), expires_at)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def remove_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+
+class DatabaseSessionBackend:
+    """Sessions in the 'http_session' table, with a per-worker LRU in front of it.
+
+    Sessions are read far more often than they change, so most requests are served from the LRU.
+    A cached session is trusted for at most 'cache_ttl' seconds, which bounds how long another worker may keep accepting a session after logout.
+    """
+
+    def __init__(self, engine: Engine, cache_size: int, cache_ttl: int) -> None:
+        self._engine = engine
+        self._cache = MemorySessionBackend(cache_size)
+        self._cache_ttl = cache_ttl
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        data = self._cache.load(key)
+        if data is not None:
+            return data
+        with self._engine.connect() as connection:
+            row = connection.execute(_SELECT_SESSION, {'id_hash': key}).first()
+        if row is None:
+            return None
+        data = json.loads(row[0])
+        self._cache.store(key, data, min(float(row[1]), time.time() + self._cache_ttl))
+        return data
+
+    def save(self, key: str, data: dict[str, Any], max_age: int) -> None:
+        expires_at = datetime.datetime.now(datetime.UTC) + datetime.timedelta(seconds=max_age)
+        with self._engine.begin() as connection:
+            connection.execute(
+                _UPSERT_SESSION,
+                {'id_hash': key, 'data': json.dumps(data), 'expires_at': expires_at},
+            )
+        self._cache.store(key, data, min(expires_at.timestamp(), time.time() + self._cache_ttl))
+
+    def delete(self, key: str) -> None:
+        self._cache.delete(key)
+        with self._engine.begin() as connection:
+            connection.execute(_DELETE_SESSION, {'id_hash': key})
+
+    def remove_expired(self) -> int:
+        self._cache.remove_expired()
+        with self._engine.begin() as connection:
+            return connection.execute(_DELETE_EXPIRED_SESSIONS).rowcount
+
+
+def get_session_backend(settings: Settings, engine: Engine) -> SessionBackend:
+    if settings.SESSION_BACKEND == 'memory':
+        return MemorySessionBackend(settings.SESSION_CACHE_SIZE)
+    return DatabaseSessionBackend(engine, settings.SESSION_CACHE_SIZE, settings.SESSION_CACHE_TTL)
@@ -0,0 +1,139 @@
+"""Optional OpenTelemetry tracing of requests, database statements, broker calls and token verification.
+
+Only the OpenTelemetry API is a dependency, and without a configured SDK every span is a no-op. Setting TRACING_ENABLED requires
+'opentelemetry-sdk', and for the 'otlp' exporter also 'opentelemetry-exporter-otlp-proto-http', which reads the standard
+OTEL_EXPORTER_OTLP_* environment variables.
+
+The instrumentation is always in place, and only setup_tracing decides whether spans are recorded. Until a tracer provider is
+installed, the OpenTelemetry API hands out non-recording spans, which cost little more than the function call.
+"""
+
+from collections.abc import Callable
+from functools import wraps
+from typing import TYPE_CHECKING, Any
+
+import urllib3
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind, StatusCode
+from sqlalchemy import Engine, event
+
+from .environment import settings
+
+if TYPE_CHECKING:
+    from opentelemetry.sdk.trace.export import SpanExporter
+    from sqlalchemy.engine import ExceptionContext
+
+tracer = trace.get_tracer('intersect-registry-service')
+
+_SPAN_INFO_KEY = 'otel_span'
+"""Key of the current statement's span in the DBAPI connection's info dictionary"""
+
+
+def setup_tracing(exporter: 'SpanExporter | None' = None) -> None:
+    """Install the tracer provider of this process. Like setup_logging, this needs to be called per uvicorn worker.
+
+    Args:
+      exporter: export spans here synchronously instead of to the configured exporter, i.e. an InMemorySpanExporter in tests.
+        Tracing is enabled when an exporter is given, whatever TRACING_ENABLED says.
+    """
+    if exporter is None and not settings.TRACING_ENABLED:
+        return
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import (
+        BatchSpanProcessor,
+        ConsoleSpanExporter,
+        SimpleSpanProcessor,
+    )
+
+    provider = TracerProvider(
+        resource=Resource.create({'service.name': 'intersect-registry-service'})
+    )
+    if exporter is not None:
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+    elif settings.TRACING_EXPORTER == 'console':
+        provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
+    else:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+
+
+def current_trace_id() -> str | None:
+    """The trace ID of the current span in its usual hex form, or None if nothing is being traced."""
+    span_context = trace.get_current_span().get_span_context()
+    if not span_context.is_valid:
+        return None
+    return trace.format_trace_id(span_context.trace_id)
+
+
+def traced[**P, R](name: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Decorator which runs the function in a span called 'name'. Exceptions are recorded on the span."""
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        @wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            with tracer.start_as_current_span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Trace every statement the engine executes, whether it comes from a Session or from a Core query."""
+    attributes = {
+        'db.system': 'postgresql',
+        'server.address': engine.url.host or '',
+        'db.namespace': engine.url.database or '',
+    }
+
+    def before_cursor_execute(conn: Any, _: Any, statement: str, *_args: Any) -> None:  # noqa: ARG001
+        operation = statement.split(None, 1)[0].upper() if statement else 'QUERY'
+        conn.info[_SPAN_INFO_KEY] = tracer.start_span(
+            operation,
+            kind=SpanKind.CLIENT,
+            attributes={**attributes, 'db.query.text': statement},
+        )
+
+    def after_cursor_execute(conn: Any, *_: Any) -> None:  # noqa: ARG001
+        span = conn.info.pop(_SPAN_INFO_KEY, None)
+        if span is not None:
+            span.end()
+
+    def handle_error(context: 'ExceptionContext') -> None:
+        if context.connection is None:
+            return
+        span = context.connection.info.pop(_SPAN_INFO_KEY, None)
+        if span is not None:
+            span.record_exception(context.original_exception)
+            span.set_status(StatusCode.ERROR)
+            span.end()
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(engine, 'handle_error', handle_error)
+
+
+class _TracedPoolManager(urllib3.PoolManager):
+    def urlopen(  # type: ignore[override]
+        self, method: str, url: str, redirect: bool = True, **kw: Any
+    ) -> urllib3.BaseHTTPResponse:
+        with tracer.start_as_current_span(
+            method,
+            kind=SpanKind.CLIENT,
+            attributes={'http.request.method': method, 'url.full': url},
+        ) as span:
+            resp = super().urlopen(method, url, redirect, **kw)
+            span.set_attribute('http.response.status_code', resp.status)
+            if resp.status >= 400:
+                span.set_status(StatusCode.ERROR)
+            return resp
+
+
+def make_pool_manager(**kwargs: Any) -> urllib3.PoolManager:
+    """A urllib3 PoolManager which traces each HTTP request it makes."""
+    return _TracedPoolManager(**kwargs)
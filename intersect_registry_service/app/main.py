@@ -1,28 +1,38 @@
 """Main file to start backend server."""
 
+import asyncio
 import typing
 from contextlib import asynccontextmanager
+from functools import partial
 from importlib.metadata import version
 from pathlib import Path
 
+from anyio.to_thread import run_sync
 from asgi_correlation_id import CorrelationIdMiddleware
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from fastapi_csrf_protect.exceptions import CsrfProtectError
-from sqlmodel import create_engine
-from starlette.middleware.sessions import SessionMiddleware
 
 from .api import router as api_router
-from .auth.definitions import IntersectNotAuthenticatedError, handle_unauthenticated
+from .core.background_tasks import start_periodic_task, stop_periodic_tasks
+from .core.client_pool import ClientIdentityPool
 from .core.configuration_manager import ConfigurationManager
+from .core.database import ReadReplicas, create_db_engine
 from .core.environment import settings
+from .core.event_loop_monitor import EventLoopMonitor
+from .core.health import HealthProber, check_database
 from .core.log_config import logger, setup_logging
-from .middlewares.csrf import csrf_protect_exception_handler
-from .middlewares.logging_context import add_logging_middleware
-from .ui import router as ui_router
-
-# this needs to be called per uvicorn worker
+from .core.metrics import DatabasePoolMetrics, mark_worker_stopped
+from .core.profiling import Profiler
+from .core.service_activity import ServiceActivityTracker
+from .core.tracing import setup_tracing
+from .middlewares.liveness import LivenessMiddleware
+from .middlewares.logging_context import LoggingMiddleware
+from .middlewares.metrics import PrometheusMiddleware, metrics_endpoint
+from .middlewares.profiling import ProfilingMiddleware
+from .middlewares.tracing import TracingMiddleware
+
+# these need to be called per uvicorn worker
 setup_logging()
+setup_tracing()
 
 
 @asynccontextmanager
@@ -30,10 +40,7 @@ async def lifespan(app: FastAPI) -> typing.AsyncGenerator[None, None]:
     # On startup
     logger.info('Initializing app')
 
-    app.state.db = create_engine(
-        settings.postgres_url,
-        pool_recycle=3600,
-    )
+    app.state.db = create_db_engine(settings.postgres_url, settings)
     if not settings.ALEMBIC_RUN_MIGRATIONS and not settings.DEVELOPMENT_API_KEY:
         # we have not yet checked the DB connection, but need to
         logger.warning(
@@ -44,8 +51,101 @@ async def lifespan(app: FastAPI) -> typing.AsyncGenerator[None, None]:
         with app.state.db.connect() as connection:
             connection.execute(text('SELECT 1'))
 
+    app.state.db_replicas = ReadReplicas(settings)
+    if app.state.db_replicas.enabled:
+        # until their lag has been measured, all reads go to the primary
+        await run_sync(app.state.db_replicas.check_lag)
+
+    app.state.service_activity = ServiceActivityTracker(app.state.db)
+    pool_metrics = DatabasePoolMetrics(
+        {
+            'primary': app.state.db,
+            **{
+                f'replica-{idx}': engine for idx, engine in enumerate(app.state.db_replicas.engines)
+            },
+        }
+    )
+
     logger.info('Configuring broker with initial setup')
     app.state.config_manager = ConfigurationManager(settings)
+    app.state.client_pool = ClientIdentityPool(app.state.config_manager, settings)
+
+    app.state.background_tasks = [
+        start_periodic_task(
+            'client-queue-sweep',
+            settings.BROKER_CLIENT_QUEUE_SWEEP_INTERVAL,
+            app.state.config_manager.remove_stale_clients,
+        ),
+        start_periodic_task(
+            'service-activity-flush',
+            settings.SERVICE_ACTIVITY_FLUSH_INTERVAL,
+            app.state.service_activity.flush,
+        ),
+        start_periodic_task(
+            'db-pool-metrics', settings.METRICS_SAMPLE_INTERVAL, pool_metrics.sample
+        ),
+    ]
+    if settings.UI_ENABLED:
+        from .core.session_store import get_session_backend
+
+        app.state.session_backend = get_session_backend(settings, app.state.db)
+        app.state.background_tasks.append(
+            start_periodic_task(
+                'session-cleanup',
+                settings.SESSION_CLEANUP_INTERVAL,
+                app.state.session_backend.remove_expired,
+            )
+        )
+    if app.state.db_replicas.enabled:
+        app.state.background_tasks.append(
+            start_periodic_task(
+                'replica-lag-check',
+                settings.POSTGRESQL_REPLICA_LAG_CHECK_INTERVAL,
+                app.state.db_replicas.check_lag,
+            )
+        )
+    health_checks: dict[str, typing.Callable[[], object]] = {
+        'database': partial(check_database, app.state.db),
+        'broker_management': app.state.config_manager.broker_handler.check_health,
+        'broker_protocol': app.state.config_manager.protocol_handler.check_health,
+    }
+    if settings.UI_ENABLED and settings.AUTH_IMPLEMENTATION == 'keycloak':
+        from .auth.impl_keycloak.get_user import jwks_cache
+
+        # requests verify sessions against these keys, and only fetch keys themselves when they see an unknown key ID
+        await run_sync(jwks_cache.load)
+        app.state.background_tasks.append(
+            start_periodic_task(
+                'jwks-refresh', settings.KEYCLOAK_JWKS_REFRESH_INTERVAL, jwks_cache.refresh
+            )
+        )
+        health_checks['keycloak_jwks'] = jwks_cache.check_health
+    app.state.health = HealthProber(
+        health_checks, settings.HEALTHCHECK_INTERVAL, settings.HEALTHCHECK_TIMEOUT
+    )
+    # not ready until the first check is done
+    await run_sync(app.state.health.probe)
+    app.state.background_tasks.append(
+        start_periodic_task('healthcheck', settings.HEALTHCHECK_INTERVAL, app.state.health.probe)
+    )
+    if settings.PROFILING_DIR is not None:
+        settings.PROFILING_DIR.mkdir(parents=True, exist_ok=True)
+        app.state.profiler = Profiler(settings.PROFILING_DIR)
+        app.state.background_tasks.append(
+            start_periodic_task(
+                'profiling-poll', settings.PROFILING_POLL_INTERVAL, app.state.profiler.poll
+            )
+        )
+    app.state.event_loop_monitor = EventLoopMonitor(
+        settings.EVENT_LOOP_SAMPLE_INTERVAL, settings.EVENT_LOOP_BLOCKED_THRESHOLD
+    )
+    app.state.background_tasks.append(
+        asyncio.create_task(app.state.event_loop_monitor.run(), name='event-loop-monitor')
+    )
+    if app.state.client_pool.enabled:
+        app.state.background_tasks.append(
+            asyncio.create_task(app.state.client_pool.run(), name='client-pool-refill')
+        )
 
     logger.info('App initialized')
 
@@ -54,7 +154,18 @@ async def lifespan(app: FastAPI) -> typing.AsyncGenerator[None, None]:
     # On cleanup
     logger.info('Shutting down gracefully')
 
+    await stop_periodic_tasks(app.state.background_tasks)
+    app.state.health.close()
+    if settings.PROFILING_DIR is not None:
+        # ends the worker's session, which writes out its last memory diff
+        await run_sync(app.state.profiler.stop)
+    try:
+        await run_sync(app.state.service_activity.flush)
+    except Exception:
+        logger.exception('Could not save service activity on shutdown')
+    app.state.db_replicas.dispose()
     app.state.db.dispose()
+    mark_worker_stopped()
 
     logger.info('Graceful shutdown complete')
 
@@ -73,23 +184,44 @@ app = FastAPI(
 
 # Middlewares are executed in REVERSE order from when they are added
 
-add_logging_middleware(app)
+app.add_middleware(LoggingMiddleware)
+app.add_middleware(TracingMiddleware)
 app.add_middleware(CorrelationIdMiddleware)
-
-app.add_middleware(
-    SessionMiddleware,
-    secret_key=settings.SESSION_SECRET,
-    max_age=settings.SESSION_MAX_AGE,
-    https_only=True,
-    same_site='lax',
-)
-
-app.add_exception_handler(IntersectNotAuthenticatedError, handle_unauthenticated)
-app.add_exception_handler(CsrfProtectError, csrf_protect_exception_handler)
+app.add_middleware(PrometheusMiddleware)
+
+if settings.UI_ENABLED:
+    # the API never uses sessions, so API-only workers skip them entirely
+    from .auth.definitions import SESSION_ID_COOKIE_NAME
+    from .middlewares.server_session import ServerSessionMiddleware
+
+    app.add_middleware(
+        ServerSessionMiddleware,
+        max_age=settings.SESSION_MAX_AGE,
+        cookie_name=SESSION_ID_COOKIE_NAME,
+        https_only=True,
+        same_site='lax',
+    )
+if settings.PROFILING_DIR is not None:
+    app.add_middleware(ProfilingMiddleware)
+app.add_middleware(LivenessMiddleware)
 
 # routes, only the API route has API documentation
 app.include_router(api_router)
-app.include_router(ui_router)
-
-# mount static files AFTER routes
-app.mount('', StaticFiles(directory=(Path(__file__).parent.absolute() / 'ui' / 'static')), 'static')
+app.add_route('/metrics', metrics_endpoint, include_in_schema=False)
+
+if settings.UI_ENABLED:
+    # the UI stack (templates, login, CSRF protection) is only imported if it is used
+    from fastapi.staticfiles import StaticFiles
+    from fastapi_csrf_protect.exceptions import CsrfProtectError
+
+    from .auth.definitions import IntersectNotAuthenticatedError, handle_unauthenticated
+    from .middlewares.csrf import csrf_protect_exception_handler
+    from .ui import router as ui_router
+
+    app.add_exception_handler(IntersectNotAuthenticatedError, handle_unauthenticated)
+    app.add_exception_handler(CsrfProtectError, csrf_protect_exception_handler)
+    app.include_router(ui_router)
+    # mount static files AFTER routes
+    app.mount(
+        '', StaticFiles(directory=(Path(__file__).parent.absolute() / 'ui' / 'static')), 'static'
+    )
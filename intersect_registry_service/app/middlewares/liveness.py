@@ -0,0 +1,27 @@
+"""Liveness probes, answered before any other middleware runs."""
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+LIVENESS_PATH = '/api/v1/liveness'
+
+
+class LivenessMiddleware:
+    """Answers GET requests to LIVENESS_PATH with an empty 204 response: no logging, metrics, sessions or dependency checks.
+
+    A worker whose event loop can run this is alive. Whether it can serve requests is up to '/api/v1/healthcheck'.
+    Must be the outermost middleware.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope['type'] == 'http'
+            and scope['method'] in ('GET', 'HEAD')
+            and scope['path'].removeprefix(scope.get('root_path', '')) == LIVENESS_PATH
+        ):
+            await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        await self.app(scope, receive, send)
@@ -1,14 +1,19 @@
 """Module to log information about each request. Credit to https://gist.github.com/nymous/f138c7f06062b7c43c060bf03759c29e"""
 
+import random
 import time
-from collections.abc import Awaitable, Callable
 
 import structlog
 from asgi_correlation_id.context import correlation_id
-from fastapi import FastAPI, Request, Response
 from fastapi.responses import PlainTextResponse
+from starlette.datastructures import URL, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from uvicorn.protocols.utils import get_path_with_query_string
 
+from ..core.environment import settings
+from ..core.request_phases import RequestPhases, end_request_phases, start_request_phases
+from ..core.tracing import current_trace_id
+
 _access_logger: structlog.stdlib.BoundLogger = structlog.get_logger(
     'intersect-registry-service.access'
 )
@@ -16,48 +21,116 @@ _error_logger: structlog.stdlib.BoundLogger = structlog.get_logger(
     'intersect-registry-service.error'
 )
 
+_PROBE_ROUTES = frozenset(('/api/v1/ping', '/api/v1/healthcheck', '/metrics'))
+
+
+def _sample_rate(route: str | None) -> float:
+    """Returns: the fraction of successful requests to this route template which get an access log entry"""
+    if route in _PROBE_ROUTES:
+        return settings.ACCESS_LOG_SAMPLE_RATE_PROBE
+    if route is None:
+        # static files, and paths which did not match anything
+        return settings.ACCESS_LOG_SAMPLE_RATE_UI
+    if route.startswith('/api/v1/sdk/'):
+        return settings.ACCESS_LOG_SAMPLE_RATE_SDK
+    if route.startswith('/api/v1/admin/'):
+        return settings.ACCESS_LOG_SAMPLE_RATE_ADMIN
+    return settings.ACCESS_LOG_SAMPLE_RATE_UI
+
+
+class LoggingMiddleware:
+    """Binds the request ID to every log entry emitted during the request, and writes the access log entry.
+
+    Requests which fail or are slow are always logged, other requests are sampled according to the ACCESS_LOG_SAMPLE_RATE_* settings.
+    Each entry breaks the duration down into the time spent in the database, in broker calls and in rendering templates.
+
+    The logged duration lasts until the whole response was sent, since streamed pages are rendered after their headers went out.
+    The 'X-Process-Time' header can only report the time until the headers were sent.
+
+    This is a plain ASGI middleware rather than a '@app.middleware("http")' function, which would run the rest of the app in a separate task
+    and pass the response through memory streams.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.slow_request_threshold = int(settings.ACCESS_LOG_SLOW_REQUEST_THRESHOLD * 10**9)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
 
-def add_logging_middleware(app: FastAPI) -> None:
-    @app.middleware('http')
-    async def logging_middleware(
-        request: Request, call_next: Callable[[Request], Awaitable[Response]]
-    ) -> Response:
         structlog.contextvars.clear_contextvars()
         # These context vars will be added to all log entries emitted during the request
         request_id = correlation_id.get()
         structlog.contextvars.bind_contextvars(request_id=request_id)
+        trace_id = current_trace_id()
+        if trace_id:
+            structlog.contextvars.bind_contextvars(trace_id=trace_id)
 
+        phases, phases_token = start_request_phases()
         start_time = time.perf_counter_ns()
-        # If the call_next raises an error, we still want to return our own 500 response,
-        # so we can add headers to it (process time, request ID...)
-        response: Response = PlainTextResponse('Internal server error', status_code=500)
+        # until the response headers were sent, the body may take much longer
+        process_time = 0
+        status_code = 500
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal process_time, status_code, response_started
+            if message['type'] == 'http.response.start':
+                response_started = True
+                process_time = time.perf_counter_ns() - start_time
+                status_code = message['status']
+                MutableHeaders(scope=message).append('X-Process-Time', str(process_time / 10**9))
+            await send(message)
+
         try:
-            response = await call_next(request)
+            await self.app(scope, receive, send_wrapper)
         except Exception:
             # this will never be an HTTPException, this gets caught elsewhere
             _error_logger.exception('Uncaught exception')
+            # If the app raises an error, we still want to return our own 500 response,
+            # so we can add headers to it (process time, request ID...)
+            if not response_started:
+                response = PlainTextResponse('Internal server error', status_code=500)
+                await response(scope, receive, send_wrapper)
         finally:
-            process_time = time.perf_counter_ns() - start_time
-            status_code = response.status_code
-            url = get_path_with_query_string(request.scope)  # type: ignore[arg-type]
-            client_host = request.client.host  # type: ignore[union-attr]
-            client_port = request.client.port  # type: ignore[union-attr]
-            http_method = request.method
-            http_version = request.scope['http_version']
-            # Recreate the Uvicorn access log format, but add all parameters as structured information
-            # This does NOT log HTTP headers or form data
-            _access_logger.info(
-                '%s',
-                f"""{client_host}:{client_port} - "{http_method} {url} HTTP/{http_version}" {status_code}""",
-                http={
-                    'url': str(request.url),
-                    'status_code': status_code,
-                    'method': http_method,
-                    'request_id': request_id,
-                    'version': http_version,
-                },
-                network={'client': {'ip': client_host, 'port': client_port}},
-                duration=process_time,
-            )
-            response.headers['X-Process-Time'] = str(process_time / 10**9)
-            return response  # noqa: B012 (TODO may not want to silence exceptions here)
+            end_request_phases(phases_token)
+            duration = time.perf_counter_ns() - start_time
+            sample_rate = 1.0
+            if status_code < 400 and duration < self.slow_request_threshold:
+                # the router stores the matched route in the scope
+                sample_rate = _sample_rate(getattr(scope.get('route'), 'path', None))
+            if sample_rate >= 1.0 or random.random() < sample_rate:  # noqa: S311
+                self._log_request(scope, status_code, duration, request_id, phases, sample_rate)
+
+    @staticmethod
+    def _log_request(
+        scope: Scope,
+        status_code: int,
+        duration: int,
+        request_id: str | None,
+        phases: RequestPhases,
+        sample_rate: float,
+    ) -> None:
+        url = get_path_with_query_string(scope)  # type: ignore[arg-type]
+        client_host, client_port = scope.get('client') or (None, None)
+        http_method = scope['method']
+        http_version = scope['http_version']
+        # Recreate the Uvicorn access log format, but add all parameters as structured information
+        # This does NOT log HTTP headers or form data
+        _access_logger.info(
+            '%s',
+            f"""{client_host}:{client_port} - "{http_method} {url} HTTP/{http_version}" {status_code}""",
+            http={
+                'url': str(URL(scope=scope)),
+                'status_code': status_code,
+                'method': http_method,
+                'request_id': request_id,
+                'version': http_version,
+            },
+            network={'client': {'ip': client_host, 'port': client_port}},
+            duration=duration,
+            phases=phases.as_dict(),
+            sample_rate=sample_rate,
+        )
@@ -0,0 +1,48 @@
+"""Prometheus instrumentation of HTTP requests, and the '/metrics' endpoint itself."""
+
+import time
+
+from fastapi import Request, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..core.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_PROGRESS, render_metrics
+
+
+class PrometheusMiddleware:
+    """Records the latency of every request, labelled with the route template (i.e. '/api/v1/sdk/service_config') instead of the actual path.
+
+    Requests which did not match a route, such as static files, share the 'unmatched' label, so that arbitrary paths cannot blow up the number of series.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            # the router stores the matched route in the scope
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            HTTP_REQUEST_DURATION.labels(scope['method'], route, str(status_code)).observe(
+                time.perf_counter() - start
+            )
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    content, content_type = render_metrics()
+    return Response(content, media_type=content_type)
@@ -0,0 +1,37 @@
+"""CPU profiles of the requests sampled by the current profiling session, see core/profiling.py"""
+
+from typing import TYPE_CHECKING
+
+from anyio.to_thread import run_sync
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+if TYPE_CHECKING:
+    from ..core.profiling import Profiler
+
+
+class ProfilingMiddleware:
+    """Only added if PROFILING_DIR is set. Outside of a profiling session, this costs one attribute lookup per request.
+
+    Must be the outermost middleware apart from the LivenessMiddleware, so that the profiles include every other middleware.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        # created when the app starts
+        profiler: Profiler = scope['app'].state.profiler
+        profile = profiler.start_cpu_profile(scope['path'])
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop_cpu_profile(profile)
+            await run_sync(profiler.save_cpu_profile, profile, scope['method'], scope['path'])
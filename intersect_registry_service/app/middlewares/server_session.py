@@ -0,0 +1,78 @@
+"""Session middleware which keeps session data on the server, replacing Starlette's signed cookie sessions.
+
+'request.session' still behaves like a dictionary, but the session cookie only holds a random ID, so requests stay small no matter
+how large the session (i.e. an ID token) is. The backend is taken from 'app.state.session_backend', which is set up in the app lifespan.
+"""
+
+import hashlib
+import secrets
+from typing import TYPE_CHECKING, Any
+
+from anyio.to_thread import run_sync
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+if TYPE_CHECKING:
+    from ..core.session_store import SessionBackend
+
+
+def _session_key(session_id: str) -> str:
+    return hashlib.sha256(session_id.encode()).hexdigest()
+
+
+class ServerSessionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_age: int,
+        cookie_name: str,
+        https_only: bool = True,
+        same_site: str = 'lax',
+    ) -> None:
+        self.app = app
+        self.max_age = max_age
+        self.cookie_name = cookie_name
+        self.cookie_flags = f'path=/; httponly; samesite={same_site}'
+        if https_only:
+            self.cookie_flags += '; secure'
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] not in ('http', 'websocket'):
+            await self.app(scope, receive, send)
+            return
+
+        backend: SessionBackend = scope['app'].state.session_backend
+        session_id = HTTPConnection(scope).cookies.get(self.cookie_name)
+        loaded: dict[str, Any] | None = None
+        if session_id:
+            loaded = await run_sync(backend.load, _session_key(session_id))
+        initial = loaded or {}
+        scope['session'] = dict(initial)
+
+        async def send_wrapper(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                session: dict[str, Any] = scope['session']
+                if session != initial:
+                    if loaded is not None:
+                        await run_sync(backend.delete, _session_key(session_id))  # type: ignore[arg-type]
+                    if session:
+                        # a new ID on every change, so an ID obtained before logging in is worthless afterwards
+                        new_session_id = secrets.token_urlsafe(32)
+                        await run_sync(
+                            backend.save, _session_key(new_session_id), session, self.max_age
+                        )
+                        self._set_cookie(message, new_session_id, self.max_age)
+                    else:
+                        self._set_cookie(message, '', 0)
+                elif session_id and loaded is None:
+                    # the session expired or was removed, stop the browser from sending its ID
+                    self._set_cookie(message, '', 0)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _set_cookie(self, message: Message, value: str, max_age: int) -> None:
+        MutableHeaders(scope=message).append(
+            'Set-Cookie', f'{self.cookie_name}={value}; Max-Age={max_age}; {self.cookie_flags}'
+        )
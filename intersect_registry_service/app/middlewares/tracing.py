@@ -0,0 +1,54 @@
+"""Server span of each HTTP request, which every other span of the request descends from."""
+
+from asgi_correlation_id.context import correlation_id
+from opentelemetry import propagate
+from opentelemetry.trace import SpanKind, StatusCode
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..core.tracing import tracer
+
+
+class TracingMiddleware:
+    """Continues the trace of the caller if it sent a 'traceparent' header.
+
+    Must run inside the CorrelationIdMiddleware, so that the span can carry the request ID which also appears in the logs and the 'X-Request-ID' header.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        carrier = {
+            key.decode('latin-1'): value.decode('latin-1') for key, value in scope['headers']
+        }
+        with tracer.start_as_current_span(
+            method,
+            context=propagate.extract(carrier),
+            kind=SpanKind.SERVER,
+            attributes={
+                'http.request.method': method,
+                'url.path': scope['path'],
+                'request.id': correlation_id.get() or '',
+            },
+        ) as span:
+
+            async def send_wrapper(message: Message) -> None:
+                if message['type'] == 'http.response.start':
+                    span.set_attribute('http.response.status_code', message['status'])
+                    if message['status'] >= 500:
+                        span.set_status(StatusCode.ERROR)
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # the router stores the matched route in the scope
+                route = getattr(scope.get('route'), 'path', None)
+                if route is not None:
+                    span.set_attribute('http.route', route)
+                    span.update_name(f'{method} {route}')
@@ -1,4 +1,6 @@
 """This file should ONLY export the actual table models."""
 
 from .broker import Broker
+from .http_session import HttpSession
 from .service import Service
+from .service_activity import ServiceActivity
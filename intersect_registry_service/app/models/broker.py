@@ -14,7 +14,9 @@ class Broker(SQLModel, table=True):
     """
 
     id: int | None = Field(default=None, primary_key=True)
-    service_id: int | None = Field(default=None, foreign_key='service.id', ondelete='CASCADE')
+    service_id: int | None = Field(
+        default=None, foreign_key='service.id', ondelete='CASCADE', index=True
+    )
     service: Service | None = Relationship(back_populates='brokers')
 
     broker_password: str = Field(nullable=False)
@@ -0,0 +1,21 @@
+import datetime
+
+from sqlmodel import TIMESTAMP, Column, Field, SQLModel, Text
+
+
+class HttpSession(SQLModel, table=True):
+    """Server-side data of a UI session. The browser only holds an opaque session ID in a cookie.
+
+    Rows are keyed by a hash of the session ID, so the contents of this table cannot be used to impersonate a user.
+    """
+
+    __tablename__ = 'http_session'
+
+    id_hash: str = Field(primary_key=True, max_length=64)
+    """Hex SHA-256 digest of the session ID"""
+    data: str = Field(sa_column=Column(Text(), nullable=False))
+    """JSON encoded session dictionary"""
+    expires_at: datetime.datetime = Field(
+        sa_column=Column(TIMESTAMP(timezone=True), nullable=False, index=True)
+    )
+    """Expired sessions are ignored, and periodically deleted"""
@@ -1,11 +1,18 @@
 import datetime
 
-from sqlmodel import TIMESTAMP, Column, Field, Relationship, SQLModel, text
+from sqlmodel import TIMESTAMP, Column, Field, Index, Relationship, SQLModel, text
 
 
 class Service(SQLModel, table=True):
     """A service is representative of a namespace reserved by an SDK application."""
 
+    __table_args__ = (
+        # the UI lists a user's services, most recently modified first
+        Index('ix_service_username_last_modified', 'username', text('last_modified DESC')),
+        # the SDK looks up a service by its name and API key, this allows an index-only scan
+        Index('ix_service_service_name_api_key', 'service_name', 'api_key'),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     service_name: str = Field(index=True, unique=True, nullable=False, min_length=3, max_length=63)
     """The namespace your service takes up on this system. You can spin up multiple processes on multiple different machines with this key, but this will horizontally scale.
@@ -0,0 +1,18 @@
+import datetime
+
+from sqlmodel import TIMESTAMP, BigInteger, Column, Field, SQLModel
+
+
+class ServiceActivity(SQLModel, table=True):
+    """How recently, and how often, a Service fetched its configuration from the SDK endpoint.
+
+    Rows are only ever written in batches by the service activity tracker, never per request. A Service without a row has never fetched its configuration.
+    """
+
+    __tablename__ = 'service_activity'
+
+    service_id: int = Field(foreign_key='service.id', ondelete='CASCADE', primary_key=True)
+    last_seen: datetime.datetime = Field(sa_column=Column(TIMESTAMP(timezone=True), nullable=False))
+    """Most recent configuration fetch"""
+    fetch_count: int = Field(sa_column=Column(BigInteger(), nullable=False))
+    """Total number of configuration fetches"""
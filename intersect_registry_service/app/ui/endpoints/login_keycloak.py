@@ -2,13 +2,11 @@ import hashlib
 import random
 import string
 import urllib.parse
-from typing import Annotated
+from functools import cache
+from typing import TYPE_CHECKING, Annotated
 
-import jwt
-from authlib.integrations.starlette_client import OAuth
 from fastapi import APIRouter, Depends
 from fastapi.responses import PlainTextResponse, RedirectResponse
-from starlette.config import Config
 from starlette.requests import Request
 
 from ...auth import session_manager
@@ -18,24 +16,33 @@ from ...utils.html_security_headers import get_html_security_headers, get_nonce
 from ...utils.urls import absolute_url_for, url_abspath_for
 from ..templating import TEMPLATES
 
+if TYPE_CHECKING:
+    from authlib.integrations.starlette_client import StarletteOAuth2App
+
 router = APIRouter()
 
-config = Config(environ={})
-oauth_session = OAuth(config)
-oauth_session.register(
-    'keycloak',
-    authorize_url=settings.keycloak_authorize_url,
-    access_token_url=settings.keycloak_token_url,
-    scope=settings.SCOPE,
-    client_id=settings.CLIENT_ID,
-    client_secret=settings.CLIENT_SECRET,
-    jwks_uri=settings.keycloak_jwks_url,
-)
+
+@cache
+def get_oauth_client() -> 'StarletteOAuth2App':
+    """Only the login redirect and callback need authlib, which takes a while to import, so it is imported on the first login instead of when the worker starts."""
+    from authlib.integrations.starlette_client import OAuth
+    from starlette.config import Config
+
+    oauth_session = OAuth(Config(environ={}))
+    return oauth_session.register(
+        'keycloak',
+        authorize_url=settings.keycloak_authorize_url,
+        access_token_url=settings.keycloak_token_url,
+        scope=settings.SCOPE,
+        client_id=settings.CLIENT_ID,
+        client_secret=settings.CLIENT_SECRET,
+        jwks_uri=settings.keycloak_jwks_url,
+    )
 
 
 @router.get(f'{LOGIN_URL}/callback')
 async def login_callback(request: Request) -> RedirectResponse:
-    token = await oauth_session.keycloak.authorize_access_token(request)
+    token = await get_oauth_client().authorize_access_token(request)
     id_token = token['id_token']
     request.session['user'] = id_token
     response = RedirectResponse(url_abspath_for(request, 'microservice_user_page'), status_code=303)
@@ -48,18 +55,8 @@ async def login_callback(request: Request) -> RedirectResponse:
     sha_hash = hashlib.sha256()
     sha_hash.update(fingerprint.encode('utf-8'))
     digest = sha_hash.hexdigest()
+    # the session is stored server-side, the session middleware only sends its ID to the browser
     request.session['fingerprint_hash'] = digest
-    encoded_session = jwt.encode(
-        payload=request.session, key=settings.SESSION_SECRET, algorithm='HS256'
-    )
-    response.set_cookie(
-        key=session_manager.cookie_name,
-        value=encoded_session,
-        secure=True,
-        httponly=True,
-        samesite='lax',
-        max_age=settings.SESSION_MAX_AGE,
-    )
     # Set fingerprint cookie
     response.set_cookie(
         key=settings.SESSION_FINGERPRINT_COOKIE,
@@ -77,7 +74,7 @@ async def login_redirect(request: Request) -> RedirectResponse:
     url_for = absolute_url_for(request, 'login_callback')
     if not url_for:
         return PlainTextResponse('Internal server error', status_code=500)  # type: ignore[return-value]
-    return await oauth_session.keycloak.authorize_redirect(request, url_for)  # type: ignore[no-any-return]
+    return await get_oauth_client().authorize_redirect(request, url_for)  # type: ignore[no-any-return]
 
 
 @router.get(LOGIN_URL)
@@ -103,7 +100,8 @@ async def login_page(
 async def logout_request(request: Request) -> RedirectResponse:
     user = request.session.get('user')
     if user:
-        request.session.pop('user')
+        # removes the server-side session as well, and ServerSessionMiddleware removes its cookie
+        request.session.clear()
         url_for = absolute_url_for(request, 'login_page')
         if url_for:
             app_redirect_uri = urllib.parse.quote_plus(str(url_for))
@@ -116,12 +114,6 @@ async def logout_request(request: Request) -> RedirectResponse:
     else:
         response = RedirectResponse(url_abspath_for(request, 'login_page'), status_code=303)
 
-    response.delete_cookie(
-        session_manager.cookie_name,
-        secure=True,
-        httponly=True,
-        samesite='strict',
-    )
     response.delete_cookie(
         'csrf-token',
         secure=True,
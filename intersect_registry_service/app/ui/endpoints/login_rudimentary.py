@@ -4,8 +4,9 @@ from fastapi import APIRouter, Depends, Form, Query, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi_csrf_protect import CsrfProtect
 
-from ...auth import get_user, session_manager
+from ...auth import session_manager
 from ...auth.definitions import LOGIN_URL, USER
+from ...auth.impl_rudimentary.get_user import get_user
 from ...utils.html_security_headers import get_html_security_headers, get_nonce
 from ...utils.htmx import is_htmx_request
 from ...utils.urls import url_abspath_for
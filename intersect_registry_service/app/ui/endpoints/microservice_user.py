@@ -1,23 +1,30 @@
-from typing import Annotated
+import datetime
+import time
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Annotated, Any
 
 from fastapi import APIRouter, Depends, Form, Query, Request, Response
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi_csrf_protect import CsrfProtect
+from sqlalchemy import Row
 from sqlalchemy.exc import IntegrityError
-from sqlmodel import Session, col, select
+from sqlmodel import Session
 
 from ...auth import session_manager
 from ...auth.definitions import USER
+from ...core.database import get_read_engine, pin_reads_to_primary
 from ...core.definitions import HIERARCHY_REGEX
 from ...core.environment import settings
 from ...core.log_config import logger
+from ...core.queries import get_services_page, get_stale_services
 from ...models.broker import Broker
 from ...models.service import Service
 from ...utils.api_keys import make_api_key
 from ...utils.html_security_headers import get_html_security_headers, get_nonce
 from ...utils.htmx import is_htmx_request
 from ...utils.urls import url_abspath_for
-from ..templating import TEMPLATES
+from ..templating import TEMPLATES, stream_template
 
 router = APIRouter()
 
@@ -25,6 +32,39 @@ router = APIRouter()
 CTX_INVALID_SERVICE = 'x-app-microservice-invalid'
 CTX_SERVER_ERROR_SERVICE = 'x-app-microservice-misc'
 
+_STALE_SERVICES_CACHE_MAX_SIZE = 1024
+
+
+class _StaleServicesCache:
+    """Stale Services of each user, until they are UI_STALE_SERVICES_CACHE_TTL seconds old.
+
+    Looking them up means going through all of a user's Services, and it happens on every load of the first page.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size = max_size
+        self._entries: OrderedDict[str, tuple[Sequence[Row[Any]], float]] = OrderedDict()
+
+    def get(self, username: str) -> Sequence[Row[Any]] | None:
+        entry = self._entries.get(username)
+        if entry is None:
+            return None
+        services, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[username]
+            return None
+        self._entries.move_to_end(username)
+        return services
+
+    def add(self, username: str, services: Sequence[Row[Any]], ttl: float) -> None:
+        self._entries[username] = (services, time.monotonic() + ttl)
+        self._entries.move_to_end(username)
+        if len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+
+_stale_services_cache = _StaleServicesCache(_STALE_SERVICES_CACHE_MAX_SIZE)
+
 
 @router.get('/', response_class=HTMLResponse)
 async def microservice_user_page(
@@ -33,31 +73,32 @@ async def microservice_user_page(
     csrf_protect: Annotated[CsrfProtect, Depends()],
     invalid_service: Annotated[str, Query(alias='err_svc')] = '',
     server_fault: Annotated[str, Query(alias='err')] = '',
-) -> HTMLResponse:
+    cursor: Annotated[str, Query()] = '',
+) -> StreamingResponse:
     username = user[0]
-    with Session(request.app.state.db) as session:
-        statement = (
-            select(Service)
-            .where(Service.username == username)
-            .order_by(col(Service.last_modified).desc())
-        )
-        results = session.exec(statement).fetchall()
+    services, next_cursor = _get_services_page(request, username, cursor)
+    # only report inactive services once, above the first page of the table
+    stale_services = _get_stale_services(request, username) if not cursor else []
 
     nonce = get_nonce()
     headers = get_html_security_headers(nonce)
     csrf_token, signed_token = csrf_protect.generate_csrf_tokens()
-    response = TEMPLATES.TemplateResponse(
-        request=request,
-        name='microservice-user-page.jinja',
-        context={
+    response = stream_template(
+        request,
+        'microservice-user-page.jinja',
+        {
             'nonce': nonce,
             'csrf_token': csrf_token,
             'system_name': settings.SYSTEM_NAME,
             'client_api_key': settings.BROKER_CLIENT_API_KEY,
-            'services': results,
+            'services': services,
             'err_svc': invalid_service,
             'err': server_fault,
             'username': username,
+            'is_first_page': not cursor,
+            'stale_services': stale_services,
+            'stale_service_days': settings.UI_STALE_SERVICE_AGE // 86400,
+            **_next_page_urls(request, next_cursor),
         },
         headers=headers,
     )
@@ -65,6 +106,83 @@ async def microservice_user_page(
     return response
 
 
+@router.get('/services', response_class=HTMLResponse)
+async def service_list_page(
+    request: Request,
+    user: Annotated[USER, Depends(session_manager)],
+    cursor: Annotated[str, Query()] = '',
+) -> StreamingResponse:
+    """Table rows for the next page of services, requested by HTMX once the user scrolls to the bottom of the table."""
+    services, next_cursor = _get_services_page(request, user[0], cursor)
+    return stream_template(
+        request,
+        'service-list-partial.jinja',
+        {
+            'services': services,
+            **_next_page_urls(request, next_cursor),
+        },
+    )
+
+
+def _get_services_page(
+    request: Request, username: str, cursor: str
+) -> tuple[Sequence[Row[Any]], str]:
+    """Keyset pagination over (last_modified, id), newest first. The cost of a page does not depend on how many pages came before it.
+
+    Returns the services on this page, and the cursor of the next page ('' if this is the last page).
+    """
+    page_size = settings.UI_SERVICES_PAGE_SIZE
+    results = get_services_page(
+        get_read_engine(request), username, page_size + 1, _decode_cursor(cursor)
+    )
+    if len(results) <= page_size:
+        return results, ''
+    results = results[:page_size]
+    return results, _encode_cursor(results[-1])
+
+
+def _get_stale_services(request: Request, username: str) -> Sequence[Row[Any]]:
+    """Services which have not fetched their configuration recently. The activity they are judged by is written to the database periodically, and cached per worker, so it may be a few minutes behind."""
+    stale_services = _stale_services_cache.get(username)
+    if stale_services is not None:
+        return stale_services
+    seen_before = datetime.datetime.now(datetime.UTC) - datetime.timedelta(
+        seconds=settings.UI_STALE_SERVICE_AGE
+    )
+    stale_services = get_stale_services(
+        get_read_engine(request), username, seen_before, settings.UI_STALE_SERVICES_LIMIT
+    )
+    if settings.UI_STALE_SERVICES_CACHE_TTL:
+        _stale_services_cache.add(username, stale_services, settings.UI_STALE_SERVICES_CACHE_TTL)
+    return stale_services
+
+
+def _encode_cursor(service: Row[Any]) -> str:
+    return f'{service.last_modified.isoformat()}_{service.id}'
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime.datetime, int] | None:
+    """An invalid cursor is treated as a request for the first page."""
+    if not cursor:
+        return None
+    last_modified, _, service_id = cursor.rpartition('_')
+    try:
+        return datetime.datetime.fromisoformat(last_modified), int(service_id)
+    except ValueError:
+        return None
+
+
+def _next_page_urls(request: Request, next_cursor: str) -> dict[str, str]:
+    """HTMX loads the next rows into the table, browsers without Javascript follow a link to the next full page."""
+    if not next_cursor:
+        return {'next_page_url': '', 'next_rows_url': ''}
+    query = {'cursor': next_cursor}
+    return {
+        'next_page_url': url_abspath_for(request, 'microservice_user_page', query),
+        'next_rows_url': url_abspath_for(request, 'service_list_page', query),
+    }
+
+
 @router.post('/')
 async def add_new_service(
     request: Request,
@@ -113,15 +231,18 @@ async def add_new_service(
 
     if is_htmx_request(request):
         # Javascript is enabled, so we can return an HTML partial
-        return TEMPLATES.TemplateResponse(
+        response: Response = TEMPLATES.TemplateResponse(
             request=request,
             name='service-list-partial-oob.jinja',
             context={'services': [new_service]},
         )
+        pin_reads_to_primary(response, settings)
+        return response
 
     # no Javascript detected, use the Post-Redirect-Get fallback
     response = RedirectResponse(url_abspath_for(request, 'microservice_user_page'), status_code=303)
     csrf_protect.unset_csrf_cookie(response)
+    pin_reads_to_primary(response, settings)
     return response
 
 
@@ -1,11 +1,20 @@
 """UI templating definitions"""
 
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Hashable
 from pathlib import Path
 from typing import TYPE_CHECKING, Any
 
+import jinja2
+from fastapi.responses import StreamingResponse
 from fastapi.templating import Jinja2Templates
+from markupsafe import Markup
 from starlette.templating import pass_context
 
+from ..core.environment import settings
+from ..core.request_phases import add_phase_time, timed_phase
 from ..utils.urls import url_abspath_for
 
 if TYPE_CHECKING:
@@ -23,6 +32,52 @@ def url_abspath_for_tmpl(
     return url_abspath_for(request, name, **path_params)
 
 
+class _TimedTemplate(jinja2.Template):
+    """Counts rendering towards the 'template' phase of the request. stream_template times the generated pieces itself."""
+
+    def render(self, *args: Any, **kwargs: Any) -> str:
+        with timed_phase('template'):
+            return super().render(*args, **kwargs)
+
+
+class FragmentCache:
+    """Bounded LRU of rendered fragments of one template, in this worker.
+
+    Each fragment is stored under a key of everything its output depends on, so a fragment is only rendered again once that changes.
+    """
+
+    def __init__(self, template_name: str, max_size: int) -> None:
+        self._template_name = template_name
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, Markup] = OrderedDict()
+
+    def render(self, key: Hashable, **context: Any) -> Markup:
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+                return fragment
+        # generate() rather than render(), the page containing the fragment already counts towards the template phase
+        fragment = Markup(''.join(TEMPLATES.get_template(self._template_name).generate(context)))
+        with self._lock:
+            self._entries[key] = fragment
+            if len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+        return fragment
+
+
+_SERVICE_ROWS = FragmentCache('service-row-partial.jinja', settings.UI_ROW_CACHE_SIZE)
+
+
+def service_row(service: Any) -> Markup:
+    """One row of the services table. 'service' is a Service, or a database row with the same columns.
+
+    Every change to a Service (i.e. rotating its API key) also updates 'last_modified', and IDs are never reused.
+    """
+    return _SERVICE_ROWS.render((service.id, service.last_modified), service=service)
+
+
 def _get_templates() -> Jinja2Templates:
     base_dir = Path(__file__).parent.absolute() / 'templates'
     templates = Jinja2Templates(
@@ -32,8 +87,58 @@ def _get_templates() -> Jinja2Templates:
             base_dir / 'partials',
         ]
     )
+    templates.env.template_class = _TimedTemplate
+    if settings.UI_TEMPLATE_CACHE_DIR is not None:
+        settings.UI_TEMPLATE_CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+    # compiled templates are keyed by their path and checked against their source, so changing a template invalidates its entry
+    templates.env.bytecode_cache = jinja2.FileSystemBytecodeCache(
+        str(settings.UI_TEMPLATE_CACHE_DIR) if settings.UI_TEMPLATE_CACHE_DIR is not None else None
+    )
     templates.env.globals.setdefault('url_abspath_for', url_abspath_for_tmpl)
+    templates.env.globals.setdefault('service_row', service_row)
     return templates
 
 
 TEMPLATES = _get_templates()
+
+_STREAM_CHUNK_SIZE = 16384
+"""Jinja yields output in very small pieces, we buffer them up to roughly this many characters before sending."""
+
+
+async def _render_chunks(template: jinja2.Template, context: dict[str, Any]) -> AsyncIterator[str]:
+    buffer: list[str] = []
+    size = 0
+    # only the rendering counts towards the request's template phase, not the time spent sending each chunk
+    start = time.perf_counter_ns()
+    for piece in template.generate(context):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= _STREAM_CHUNK_SIZE:
+            add_phase_time('template', time.perf_counter_ns() - start)
+            yield ''.join(buffer)
+            start = time.perf_counter_ns()
+            buffer.clear()
+            size = 0
+    add_phase_time('template', time.perf_counter_ns() - start)
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_template(
+    request: 'Request',
+    name: str,
+    context: dict[str, Any],
+    headers: dict[str, str] | None = None,
+    status_code: int = 200,
+) -> StreamingResponse:
+    """Like TEMPLATES.TemplateResponse, but sends the page while it is still being rendered instead of holding the whole document in memory.
+
+    Everything the template needs must already be loaded; in particular, do not pass in objects which lazy-load from a closed DB session.
+    """
+    template = TEMPLATES.get_template(name)
+    return StreamingResponse(
+        _render_chunks(template, {**context, 'request': request}),
+        status_code=status_code,
+        headers=headers,
+        media_type='text/html',
+    )
@@ -0,0 +1,45 @@
+"""add query pattern indexes
+
+Revision ID: 4c1f0e7b9a2d
+Revises: dadb8fbc6719
+Create Date: 2026-10-19 09:00:00.000000+00:00
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '4c1f0e7b9a2d'
+down_revision: str | None = 'dadb8fbc6719'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the UI lists a user's services, most recently modified first
+    op.create_index(
+        'ix_service_username_last_modified',
+        'service',
+        ['username', sa.text('last_modified DESC')],
+        unique=False,
+    )
+    # the SDK looks up a service by its name and API key, this allows an index-only scan
+    op.create_index(
+        'ix_service_service_name_api_key',
+        'service',
+        ['service_name', 'api_key'],
+        unique=False,
+    )
+    # Postgres does not index foreign keys on its own
+    op.create_index(op.f('ix_broker_service_id'), 'broker', ['service_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_broker_service_id'), table_name='broker')
+    op.drop_index('ix_service_service_name_api_key', table_name='service')
+    op.drop_index('ix_service_username_last_modified', table_name='service')
@@ -0,0 +1,35 @@
+"""add service activity
+
+Revision ID: 8e3b5d2a6f14
+Revises: 4c1f0e7b9a2d
+Create Date: 2026-10-19 10:00:00.000000+00:00
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '8e3b5d2a6f14'
+down_revision: str | None = '4c1f0e7b9a2d'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'service_activity',
+        sa.Column('service_id', sa.Integer(), nullable=False),
+        sa.Column('last_seen', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('fetch_count', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['service_id'], ['service.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('service_id'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('service_activity')
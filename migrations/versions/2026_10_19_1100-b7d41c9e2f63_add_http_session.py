@@ -0,0 +1,39 @@
+"""add http session
+
+Revision ID: b7d41c9e2f63
+Revises: 8e3b5d2a6f14
+Create Date: 2026-10-19 11:00:00.000000+00:00
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d41c9e2f63'
+down_revision: str | None = '8e3b5d2a6f14'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'http_session',
+        sa.Column('id_hash', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=False),
+        sa.Column('data', sa.Text(), nullable=False),
+        sa.Column('expires_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('id_hash'),
+    )
+    op.create_index(
+        op.f('ix_http_session_expires_at'), 'http_session', ['expires_at'], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_http_session_expires_at'), table_name='http_session')
+    op.drop_table('http_session')
@@ -0,0 +1,32 @@
+"""The Settings are read when the app's modules are imported, so the tests provide the required ones unless they are already set."""
+
+import os
+import sys
+
+_REQUIRED_SETTINGS = {
+    'AUTH_IMPLEMENTATION': 'rudimentary',
+    'KEYCLOAK_REALM_BASE_URL': 'http://127.0.0.1:8080/realms/test/protocol/openid-connect',
+    'SECRET_NAME': 'testsecretname-not-for-production',
+    'SYSTEM_NAME': 'test-system',
+    'BROKER_HOST': '127.0.0.1',
+    'BROKER_PORT': '5672',
+    'BROKER_PROTOCOL': 'amqp0.9.1',
+    'BROKER_APPLICATION': 'rabbitmq',
+    'BROKER_ROOT_USERNAME': 'intersect_username',
+    'BROKER_ROOT_PASSWORD': 'intersect_password',
+    'BROKER_CLIENT_USERNAME': 'lackey',
+    'BROKER_CLIENT_PASSWORD': 'lackey',
+    'BROKER_CLIENT_API_KEY': 'fakeapikey',
+    'BROKER_MANAGEMENT_URI': 'http://127.0.0.1:15672',
+    'POSTGRESQL_USERNAME': 'registry_username',
+    'POSTGRESQL_PASSWORD': 'registry_password',
+    'POSTGRESQL_HOST': '127.0.0.1',
+    'POSTGRESQL_PORT': '5432',
+    'POSTGRESQL_DATABASE': 'registry',
+}
+
+for _name, _value in _REQUIRED_SETTINGS.items():
+    os.environ.setdefault(_name, _value)
+
+# the Settings parse the command line too, which holds pytest's arguments
+del sys.argv[1:]
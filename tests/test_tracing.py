@@ -0,0 +1,122 @@
+"""Spans of requests, database statements, broker calls and token verification, with TRACING_ENABLED unset.
+
+setup_tracing is called after the instrumented code was imported and built, as it is in a worker.
+"""
+
+import asyncio
+import threading
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import pytest
+from asgi_correlation_id import CorrelationIdMiddleware
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import SpanKind, StatusCode
+from sqlalchemy import create_engine, text
+
+from intersect_registry_service.app.auth.definitions import IntersectNotAuthenticatedError
+from intersect_registry_service.app.auth.impl_keycloak.get_user import get_user
+from intersect_registry_service.app.control_plane.brokers.rabbitmq import RabbitMQHandler
+from intersect_registry_service.app.core.environment import settings
+from intersect_registry_service.app.core.tracing import instrument_engine, setup_tracing
+from intersect_registry_service.app.middlewares.tracing import TracingMiddleware
+
+_EXPORTER = InMemorySpanExporter()
+
+
+@pytest.fixture(scope='session', autouse=True)
+def _tracing() -> None:
+    # a tracer provider can only be installed once per process
+    assert not settings.TRACING_ENABLED
+    setup_tracing(_EXPORTER)
+
+
+@pytest.fixture
+def exporter() -> Iterator[InMemorySpanExporter]:
+    _EXPORTER.clear()
+    yield _EXPORTER
+    _EXPORTER.clear()
+
+
+def only_span(exporter: InMemorySpanExporter, name: str) -> ReadableSpan:
+    spans = [span for span in exporter.get_finished_spans() if span.name == name]
+    assert len(spans) == 1, [span.name for span in exporter.get_finished_spans()]
+    return spans[0]
+
+
+class _HealthyManagementAPI(BaseHTTPRequestHandler):
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        pass
+
+    def do_GET(self) -> None:  # noqa: N802
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+
+@pytest.fixture
+def management_api() -> Iterator[str]:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _HealthyManagementAPI)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/'
+    server.shutdown()
+    thread.join()
+
+
+def test_request_span(exporter: InMemorySpanExporter) -> None:
+    app = FastAPI()
+
+    @app.get('/ping')
+    async def ping() -> str:
+        return 'pong'
+
+    app.add_middleware(TracingMiddleware)
+    app.add_middleware(CorrelationIdMiddleware)
+    with TestClient(app) as client:
+        response = client.get('/ping')
+
+    span = only_span(exporter, 'GET /ping')
+    assert span.kind == SpanKind.SERVER
+    assert span.attributes is not None
+    assert span.attributes['request.id'] == response.headers['X-Request-ID']
+    assert span.attributes['http.route'] == '/ping'
+    assert span.attributes['http.response.status_code'] == 200
+
+
+def test_sql_span(exporter: InMemorySpanExporter) -> None:
+    engine = create_engine('sqlite://')
+    instrument_engine(engine)
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+
+    span = only_span(exporter, 'SELECT')
+    assert span.kind == SpanKind.CLIENT
+    assert span.attributes is not None
+    assert span.attributes['db.query.text'] == 'SELECT 1'
+
+
+def test_broker_http_span(exporter: InMemorySpanExporter, management_api: str) -> None:
+    handler = RabbitMQHandler(settings.model_copy(update={'BROKER_MANAGEMENT_URI': management_api}))
+    handler.check_health()
+
+    span = only_span(exporter, 'GET')
+    assert span.kind == SpanKind.CLIENT
+    assert span.attributes is not None
+    assert span.attributes['url.full'] == f'{management_api}api/health/checks/alarms'
+    assert span.attributes['http.response.status_code'] == 200
+
+
+def test_token_verification_span(exporter: InMemorySpanExporter) -> None:
+    with pytest.raises(IntersectNotAuthenticatedError):
+        asyncio.run(get_user('not-a-token'))
+
+    span = only_span(exporter, 'verify session token')
+    assert span.attributes is not None
+    assert span.attributes['token.cached'] is False
+    assert span.status.status_code == StatusCode.ERROR